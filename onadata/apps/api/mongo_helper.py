@@ -128,7 +128,7 @@ class MongoHelper(object):
         :return: string
         """
         for pattern, repl in cls.ENCODING_SUBSTITUTIONS:
-            key = re.sub(pattern, repl, key)
+            key = pattern.sub(repl, key)
         return key
 
     @classmethod
@@ -141,7 +141,7 @@ class MongoHelper(object):
         :return: string
         """
         for pattern, repl in cls.DECODING_SUBSTITUTIONS:
-            key = re.sub(pattern, repl, key)
+            key = pattern.sub(repl, key)
         return key
 
     @classmethod
@@ -181,3 +181,49 @@ class MongoHelper(object):
             if key.startswith(u"{}.".format(reserved_attribute)):
                 return True
         return False
+
+
+class MongoKeyMap(object):
+    """
+    The Mongo-safe names of the fields of a form and their names in the
+    form, both ways, for the fields whose names differ
+
+    Built once per form from `DataDictionary.get_mongo_field_names_dict()`,
+    so that decoding a record only looks up its keys in a dict.
+    """
+
+    def __init__(self, field_names):
+        xpaths = set(field_names.values())
+        # a key which is also the name of another field is left as is
+        self.from_mongo = dict(
+            (key, xpath) for key, xpath in field_names.items()
+            if key != xpath and key not in xpaths)
+        self.to_mongo = dict(
+            (xpath, key) for key, xpath in self.from_mongo.items())
+
+    def encode(self, field):
+        return self.to_mongo.get(field, field)
+
+    def decode(self, key):
+        return self.from_mongo.get(key, key)
+
+    def decode_record(self, record):
+        """
+        Rename in place the keys of `record`, and of the records of its
+        repeats, to the names of the form
+        """
+        if not self.from_mongo:
+            return record
+        from_mongo = self.from_mongo
+        records = [record]
+        while records:
+            d = records.pop()
+            # `keys()` is a copy, the keys can be renamed while iterating
+            for key in d.keys():
+                value = d[key]
+                if type(value) == list:
+                    records.extend(e for e in value if type(e) == dict)
+                xpath = from_mongo.get(key)
+                if xpath is not None:
+                    d[xpath] = d.pop(key)
+        return record
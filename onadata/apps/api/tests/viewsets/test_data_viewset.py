@@ -1,13 +1,21 @@
+import json
 import requests
 import unittest
+from urlparse import urlparse
 
+from django.http import QueryDict
 from django.test import RequestFactory
+from django.test.utils import override_settings
+from mock import patch
+from pymongo.errors import ExecutionTimeout
 
 from onadata.apps.api.viewsets.data_viewset import DataViewSet
 from onadata.apps.api.viewsets.xform_viewset import XFormViewSet
 from onadata.apps.main.tests.test_base import TestBase
 from onadata.apps.logger.models import XForm
+from onadata.apps.viewer.models.parsed_instance import ParsedInstance
 from onadata.libs.permissions import ReadOnlyRole
+from onadata.libs.serializers.data_serializer import encode_cursor
 from onadata.libs import permissions as role
 from httmock import urlmatch, HTTMock
 
@@ -215,6 +223,166 @@ class TestDataViewSet(TestBase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.data), 1)
 
+    def _get_pages(self, **params):
+        view = DataViewSet.as_view({'get': 'list'})
+        params['cursor'] = ''
+        pages = []
+        while True:
+            request = self.factory.get('/', params, **self.extra)
+            response = view(request, pk=self.xform.pk)
+            self.assertEqual(response.status_code, 200)
+            pages.append([record['_id'] for record in
+                          response.data['results']])
+            if response.data['next'] is None:
+                return pages
+            params['cursor'] = QueryDict(
+                urlparse(response.data['next']).query)['cursor']
+
+    def test_data_with_cursor_parameter(self):
+        self._make_submissions()
+        ids = sorted(self.xform.instances.values_list('id', flat=True))
+        self.assertEqual(self._get_pages(limit=3), [ids[:3], ids[3:]])
+
+        instances = sorted(self.xform.instances.all(),
+                           key=lambda i: i.uuid, reverse=True)
+        self.assertEqual(
+            self._get_pages(limit=1, sort='{"_uuid": -1}',
+                            fields='["_id"]'),
+            [[instance.id] for instance in instances])
+
+    def test_data_with_cursor_parameter_and_missing_sort_values(self):
+        self._make_submissions()
+        field = 'transport/loop_over_transport_types_frequency/ambulance/'\
+            'frequency_to_referral_facility'
+        view = DataViewSet.as_view({'get': 'list'})
+        request = self.factory.get('/', **self.extra)
+        response = view(request, pk=self.xform.pk)
+        values = dict((record['_id'], record.get(field))
+                      for record in response.data)
+        missing = sorted(_id for _id, value in values.items()
+                         if value is None)
+        present = sorted((_id for _id, value in values.items()
+                          if value is not None),
+                         key=lambda _id: (values[_id], _id))
+        self.assertTrue(missing and present)
+
+        self.assertEqual(
+            self._get_pages(limit=1, sort='{"%s": 1}' % field,
+                            fields='["_id"]'),
+            [[_id] for _id in missing + present])
+        self.assertEqual(
+            self._get_pages(limit=1, sort='{"%s": -1}' % field,
+                            fields='["_id"]'),
+            [[_id] for _id in reversed(missing + present)])
+
+    def test_data_with_invalid_cursor_parameter(self):
+        view = DataViewSet.as_view({'get': 'list'})
+        request = self.factory.get('/', {'cursor': 'invalid'}, **self.extra)
+        response = view(request, pk=self.xform.pk)
+        self.assertEqual(response.status_code, 400)
+
+        self._make_submissions()
+        request = self.factory.get(
+            '/', {'cursor': '', 'limit': '0'}, **self.extra)
+        response = view(request, pk=self.xform.pk)
+        self.assertEqual(response.status_code, 400)
+
+        # well-formed tokens of invalid keysets
+        for keyset in (['1'], [True], [1, {'$gt': 0}], [1, [2]]):
+            request = self.factory.get(
+                '/', {'cursor': encode_cursor(keyset)}, **self.extra)
+            response = view(request, pk=self.xform.pk)
+            self.assertEqual(response.status_code, 400)
+
+    def test_data_streamed(self):
+        self._make_submissions()
+        view = DataViewSet.as_view({'get': 'list'})
+        request = self.factory.get('/', **self.extra)
+        response = view(request, pk=self.xform.pk)
+        expected = json.loads(json.dumps(response.data))
+
+        request = self.factory.get('/', {'stream': 'true'}, **self.extra)
+        response = view(request, pk=self.xform.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(
+            json.loads(''.join(response.streaming_content)), expected)
+
+        request = self.factory.get('/', **self.extra)
+        response = view(request, pk=self.xform.pk, format='ndjson')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'],
+                         'application/x-ndjson; charset=utf-8')
+        lines = ''.join(response.streaming_content).splitlines()
+        self.assertEqual([json.loads(line) for line in lines], expected)
+
+    def test_data_query_timeout(self):
+        def _query_mongo_minimal(*args, **kwargs):
+            raise ExecutionTimeout('operation exceeded time limit')
+            yield
+
+        self._make_submissions()
+        view = DataViewSet.as_view({'get': 'list'})
+        with patch.object(ParsedInstance, 'query_mongo_minimal',
+                          side_effect=_query_mongo_minimal) as mock_query:
+            request = self.factory.get('/', **self.extra)
+            response = view(request, pk=self.xform.pk)
+            self.assertEqual(response.status_code, 503)
+
+            # streamed responses only start once the query returns records
+            request = self.factory.get('/', {'stream': 'true'}, **self.extra)
+            response = view(request, pk=self.xform.pk)
+            self.assertEqual(response.status_code, 503)
+            self.assertFalse(response.streaming)
+            self.assertTrue(mock_query.call_args[1]['stream'])
+
+    def test_data_count(self):
+        self._make_submissions()
+        view = DataViewSet.as_view({'get': 'list'})
+        request = self.factory.get('/', {'count': 'true'}, **self.extra)
+        response = view(request, pk=self.xform.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'count': 4})
+
+        query = {'count': 'true', 'query': '{"transport/loop_over_transport_'
+                 'types_frequency/ambulance/frequency_to_referral_facility":'
+                 ' "daily"}'}
+        request = self.factory.get('/', query, **self.extra)
+        response = view(request, pk=self.xform.pk)
+        self.assertEqual(response.data, {'count': 1})
+
+        # filtered counts are cached
+        self.xform.instances.all()[0].set_deleted()
+        response = view(request, pk=self.xform.pk)
+        self.assertEqual(response.data, {'count': 1})
+
+        # the count of all the submissions is the counter of the form
+        request = self.factory.get('/', {'count': 'true'}, **self.extra)
+        response = view(request, pk=self.xform.pk)
+        self.assertEqual(response.data, {'count': 3})
+
+    def test_data_count_estimate(self):
+        self._make_submissions()
+        view = DataViewSet.as_view({'get': 'list'})
+        query = {'count': 'true', 'estimate': 'true',
+                 'query': '{"_id": {"$gt": 0}}'}
+        with override_settings(DATA_COUNT_ESTIMATE_SAMPLE_SIZE=2):
+            request = self.factory.get('/', query, **self.extra)
+            response = view(request, pk=self.xform.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'count': 4, 'estimated': True})
+
+    def test_data_count_estimate_sample_spreads_over_the_form(self):
+        self._make_submissions()
+        ids = sorted(self.xform.instances.values_list('pk', flat=True))
+        query = {ParsedInstance.USERFORM_ID: u'%s_%s' % (
+            self.user.username, self.xform.id_string)}
+        with patch('onadata.apps.viewer.models.parsed_instance.random.'
+                   'randint', return_value=ids[2]):
+            sample = ParsedInstance.sample_mongo_ids(
+                query, 2, (ids[0], ids[-1]), windows=1)
+        self.assertEqual(sample, ids[2:])
+
     def test_anon_data_list(self):
         self._make_submissions()
         view = DataViewSet.as_view({'get': 'list'})
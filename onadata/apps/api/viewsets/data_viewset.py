@@ -1,9 +1,10 @@
+import itertools
 import json
 
 from django.db.models import Q
-from django.http import Http404
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from django.utils import six
+from django.utils import six, timezone
 from django.utils.translation import ugettext as _
 
 from rest_framework import status
@@ -18,13 +19,14 @@ from onadata.apps.api.tools import add_tags_to_instance, add_validation_status_t
 from onadata.apps.logger.models.xform import XForm
 from onadata.apps.logger.models.instance import Instance
 from onadata.apps.viewer.models.parsed_instance import ParsedInstance
+from onadata.apps.api.mongo_helper import MongoHelper
 from onadata.libs.renderers import renderers
 from onadata.libs.mixins.anonymous_user_public_forms_mixin import (
     AnonymousUserPublicFormsMixin)
 from onadata.apps.api.permissions import XFormDataPermissions
 from onadata.libs.permissions import CAN_CHANGE_XFORM
 from onadata.libs.serializers.data_serializer import (
-    DataSerializer, DataListSerializer, DataInstanceSerializer)
+    DataSerializer, DataListSerializer, DataInstanceSerializer, data_query)
 from onadata.libs import filters
 from onadata.libs.utils.viewer_tools import (
     EnketoError,
@@ -237,6 +239,70 @@ API Parameters</a>.
 >            }
 >        ]
 
+## Page through the submitted data of a specific form
+Use the `cursor` parameter, empty for the first page, to page through the
+submissions in the order of `_id`, or of the single key of `sort` then `_id`.
+Unlike `start`, the next page is found without skipping the previous ones.
+The response holds the page in `results` and the link to the next page,
+`null` on the last one, in `next`.
+<pre class="prettyprint">
+<b>GET</b> /api/v1/data/<code>{pk}</code>?cursor=&limit=1000</b>
+<b>GET</b> /api/v1/data/<code>{pk}</code>?cursor=&sort={"_submission_time": -1}</b>
+</pre>
+> Example
+>
+>       curl -X GET 'https://example.com/api/v1/data/22845?cursor=&limit=2'
+
+> Response
+>
+>        {
+>            "next": "https://example.com/api/v1/data/22845?cursor=WzQ1MDRd&limit=2",
+>            "results": [
+>                {
+>                    "_id": 4503,
+>                    ....
+>                },
+>                {
+>                    "_id": 4504,
+>                    ....
+>                }
+>            ]
+>        }
+
+## Stream the submitted data of a specific form
+Use `stream=true`, or the `ndjson` format for newline delimited JSON, to
+receive the submissions as they are read instead of all at once, e.g. for
+large `limit` values. `query`, `fields`, `sort`, `start` and `limit` apply.
+<pre class="prettyprint">
+<b>GET</b> /api/v1/data/<code>{pk}</code>?stream=true</b>
+<b>GET</b> /api/v1/data/<code>{pk}</code>.ndjson</b>
+</pre>
+> Example
+>
+>       curl -X GET https://example.com/api/v1/data/22845.ndjson
+
+> Response
+>
+>        {"_id": 4503, "expense_type": "service", ....}
+>        {"_id": 4504, "expense_type": "electricity", ....}
+
+## Count the submitted data of a specific form
+Use `count=true` to receive the number of submissions matching `query`. The
+counts of filtered queries may be up to a minute old. Add `estimate=true` to
+extrapolate them from a sample of the submissions instead of counting them
+all, in which case `estimated` tells whether the count is exact.
+<pre class="prettyprint">
+<b>GET</b> /api/v1/data/<code>{pk}</code>?count=true&query={"kind": "monthly"}</b>
+<b>GET</b> /api/v1/data/<code>{pk}</code>?count=true&estimate=true&query={"kind": "monthly"}</b>
+</pre>
+> Example
+>
+>       curl -X GET 'https://example.com/api/v1/data/22845?count=true&estimate=true&query={"kind": "monthly"}'
+
+> Response
+>
+>        {"count": 4500, "estimated": true}
+
 ## Query submitted data of a specific form using Tags
 Provides a list of json submitted data for a specific form matching specific
 tags. Use the `tags` query parameter to filter the list of forms, `tags`
@@ -395,7 +461,9 @@ Delete a specific submission in a form
         renderers.CSVRenderer,
         renderers.CSVZIPRenderer,
         renderers.SAVZIPRenderer,
-        renderers.RawXMLRenderer
+        renderers.ParquetZIPRenderer,
+        renderers.RawXMLRenderer,
+        renderers.NDJSONRenderer
     ]
 
     content_negotiation_class = renderers.InstanceContentNegotiation
@@ -613,6 +681,10 @@ Delete a specific submission in a form
         xform = self.get_object()
         query = request.GET.get("query", {})
         export_type = kwargs.get('format')
+        if export_type == 'ndjson' or (
+                export_type in [None, 'json'] and
+                request.GET.get('stream') == 'true'):
+            return self._stream_data(request, xform, export_type == 'ndjson')
         if export_type is None or export_type in ['json']:
             # perform default viewset retrieve, no data export
 
@@ -625,6 +697,32 @@ Delete a specific submission in a form
 
         return custom_response_handler(request, xform, query, export_type)
 
+    def _stream_data(self, request, xform, ndjson):
+        """
+        Stream the submissions, paged with `start` and `limit`, as a JSON
+        array or as newline delimited JSON, a record at a time as they come
+        off the Mongo cursor
+        """
+        query_kwargs = DataListSerializer.get_query_kwargs(
+            xform, request.query_params)
+        with data_query(query_kwargs):
+            for key in ('start', 'limit'):
+                if request.query_params.get(key):
+                    query_kwargs[key] = int(request.query_params[key])
+            cursor = ParsedInstance.query_mongo_minimal(
+                stream=True, **query_kwargs)
+            # the query fails before the response starts, rather than
+            # truncating it, when fetching the first batch fails
+            first_records = list(itertools.islice(cursor, 1))
+
+        records = (MongoHelper.to_readable_dict(record) for record in
+                   itertools.chain(first_records, cursor))
+        content_type = renderers.NDJSONRenderer.media_type if ndjson \
+            else 'application/json'
+        return StreamingHttpResponse(
+            renderers.stream_json_records(records, ndjson=ndjson),
+            content_type='%s; charset=utf-8' % content_type)
+
     def modify(self, request, *args, **kwargs):
 
         xform = self.get_object()
@@ -697,8 +795,11 @@ Delete a specific submission in a form
                     # If everything is OK, submit data to DBs
                     if http_status == status.HTTP_200_OK:
                         # Update Postgres & Mongo
+                        # `date_modified` tells the cached exports apart
                         updated_records_count = Instance.objects.\
-                            filter(**filter_).update(validation_status=new_validation_status)
+                            filter(**filter_).update(
+                                validation_status=new_validation_status,
+                                date_modified=timezone.now())
                         ParsedInstance.bulk_update_validation_statuses(query, new_validation_status)
                         response = {"detail": _("{} submissions have been updated").format(updated_records_count)}
 
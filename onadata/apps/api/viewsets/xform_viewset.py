@@ -53,6 +53,7 @@ EXPORT_EXT = {
     'csv': Export.CSV_EXPORT,
     'csvzip': Export.CSV_ZIP_EXPORT,
     'savzip': Export.SAV_ZIP_EXPORT,
+    'parquetzip': Export.PARQUET_ZIP_EXPORT,
     'uuid': Export.EXTERNAL_EXPORT,
 }
 
@@ -77,7 +78,8 @@ def _get_extension_from_export_type(export_type):
 
     if export_type == Export.XLS_EXPORT:
         extension = 'xlsx'
-    elif export_type in [Export.CSV_ZIP_EXPORT, Export.SAV_ZIP_EXPORT]:
+    elif export_type in [Export.CSV_ZIP_EXPORT, Export.SAV_ZIP_EXPORT,
+                         Export.PARQUET_ZIP_EXPORT]:
         extension = 'zip'
 
     return extension
@@ -598,12 +600,13 @@ https://example.com/api/v1/forms/28058/enketo
 
 ## Get form data in xls, csv format.
 
-Get form data exported as xls, csv, csv zip, sav zip format.
+Get form data exported as xls, csv, csv zip, sav zip, parquet zip format.
 
 Where:
 
 - `pk` - is the form unique identifier
-- `format` - is the data export format i.e csv, xls, csvzip, savzip
+- `format` - is the data export format i.e csv, xls, csvzip, savzip, \
+parquetzip
 
 Params for the custom xls report
 
@@ -719,6 +722,7 @@ data (instance/submission per row)
         renderers.CSVRenderer,
         renderers.CSVZIPRenderer,
         renderers.SAVZIPRenderer,
+        renderers.ParquetZIPRenderer,
         renderers.RawXMLRenderer
     ]
     queryset = XForm.objects.all()
@@ -1,11 +1,18 @@
 # encoding=utf-8
 import os
+import posixpath
 import shutil
-import tempfile
+import threading
 import zipfile
+from collections import defaultdict, namedtuple
+from contextlib import closing
+from multiprocessing.dummy import Pool as ThreadPool
 
-from django.core.files.uploadedfile import InMemoryUploadedFile
+from django.core.files.uploadedfile import InMemoryUploadedFile,\
+    TemporaryUploadedFile
+from django.db import connection, transaction
 
+from onadata.apps.logger.models.instance import increment_submission_counts
 from onadata.apps.logger.xform_fs import XFormInstanceFS
 from onadata.libs.utils.logger_tools import create_instance
 
@@ -62,46 +69,214 @@ def iterate_through_instances(dirpath, callback):
     return (total_file_count, success_count, errors)
 
 
-def import_instances_from_zip(zipfile_path, user, status="zip"):
+DEFAULT_BATCH_SIZE = 50
+
+# An instance of a dump: the path of its XML and the paths of its photos
+ManifestEntry = namedtuple('ManifestEntry', ['path', 'photos'])
+
+
+class ZipSource(object):
+    """
+    Reads the members of a zip file without extracting it. Every thread
+    opens the zip file separately since members can't be read concurrently
+    from the same `ZipFile`.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._zip_files = []
+
+    def _zip_file(self):
+        if not hasattr(self._local, 'zip_file'):
+            self._local.zip_file = zipfile.ZipFile(self.path)
+            self._zip_files.append(self._local.zip_file)
+        return self._local.zip_file
+
+    def names(self):
+        return [info.filename for info in self._zip_file().infolist()
+                if not info.filename.endswith('/')]
+
+    def open(self, name):
+        return self._zip_file().open(name)
+
+    def close(self):
+        for zip_file in self._zip_files:
+            zip_file.close()
+
+
+class DirectorySource(object):
+    """
+    Reads the files of an extracted dump, named like zip members.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def names(self):
+        names = []
+        for directory, subdirs, subfiles in os.walk(self.path):
+            relative_directory = os.path.relpath(directory, self.path)
+            for filename in subfiles:
+                names.append(posixpath.normpath(posixpath.join(
+                    *(relative_directory.split(os.sep) + [filename]))))
+        return names
+
+    def open(self, name):
+        return open(os.path.join(self.path, *name.split('/')), 'rb')
+
+    def close(self):
+        pass
+
+
+def build_manifest(source):
+    """
+    List the instances of a dump with their photos, looking at every file
+    name once instead of searching the directory of each instance.
+    """
+    names = source.names()
+    photos_by_directory = defaultdict(list)
+    for name in names:
+        if name.endswith('.jpg'):
+            photos_by_directory[posixpath.dirname(name)].append(name)
+
+    manifest = []
+    for name in sorted(names):
+        if not name.endswith('.xml'):
+            continue
+        with closing(source.open(name)) as f:
+            xml = f.read()
+        if not XFormInstanceFS.is_valid_instance_xml(xml):
+            continue
+        photos = [photo for photo in photos_by_directory[
+            posixpath.dirname(name)]
+            if xml.find(posixpath.basename(photo)) > 0]
+        manifest.append(ManifestEntry(name, photos))
+    return manifest
+
+
+def _spool_photo(source, name):
+    # Attachments must be seekable, zip members are not
+    with closing(source.open(name)) as member:
+        photo = TemporaryUploadedFile(
+            posixpath.basename(name), 'image/jpeg', 0, None)
+        shutil.copyfileobj(member, photo)
+    photo.size = photo.tell()
+    photo.seek(0)
+    return photo
+
+
+def _import_entry(source, entry, user, status):
+    result = {'path': entry.path, 'instance': None, 'error': None}
+    photos = []
+    try:
+        photos = [_spool_photo(source, name) for name in entry.photos]
+        with closing(source.open(entry.path)) as xml_file:
+            # `create_instance()` runs in a savepoint, so a failure only
+            # rolls back this instance
+            instance = create_instance(user.username, xml_file, photos,
+                                       status, defer_counting=True)
+        if instance:
+            result['instance'] = instance
+    except Exception as e:
+        result['error'] = "%s => %s" % (
+            posixpath.basename(entry.path), str(e))
+    finally:
+        for photo in photos:
+            photo.close()
+    return result
+
+
+def _import_batch(source, entries, user, status, close_connection):
+    try:
+        with transaction.atomic():
+            results = [_import_entry(source, entry, user, status)
+                       for entry in entries]
+            # Update the counters once per form, just before committing, to
+            # hold their row locks as briefly as possible
+            new_instances = defaultdict(list)
+            for result in results:
+                instance = result['instance']
+                if getattr(instance, 'defer_counting', False):
+                    del instance.defer_counting
+                    new_instances[instance.xform_id].append(instance)
+            for xform_id, instances in new_instances.items():
+                increment_submission_counts(
+                    xform_id, len(instances),
+                    max(i.date_created for i in instances))
+    finally:
+        if close_connection:
+            # Every thread of the pool has its own connection
+            connection.close()
+    for result in results:
+        if result['instance'] is not None:
+            result['instance'] = result['instance'].pk
+    return results
+
+
+def import_instances_from_source(source, user, status="zip", workers=1,
+                                 batch_size=DEFAULT_BATCH_SIZE,
+                                 progress_callback=None):
+    """
+    Import the instances of a dump and their photos.
+
+    The instances are imported by `workers` threads, `batch_size` at a time
+    in a transaction per batch.
+
+    :param progress_callback: Optional function called after every batch with
+        the number of processed instances, the total and the batch results.
+    :returns: One result per instance: a dict with its `path` in the dump and
+        either the primary key of its `instance` or an `error`.
+    """
+    manifest = build_manifest(source)
+    batches = [manifest[i:i + batch_size]
+               for i in range(0, len(manifest), batch_size)]
+    pool = ThreadPool(workers) if workers > 1 else None
+    import_batch = lambda entries: _import_batch(
+        source, entries, user, status, pool is not None)
+    results = []
     try:
-        temp_directory = tempfile.mkdtemp()
-        zf = zipfile.ZipFile(zipfile_path)
+        imap = pool.imap if pool else lambda func, items: (
+            func(item) for item in items)
+        for batch_results in imap(import_batch, batches):
+            results.extend(batch_results)
+            if progress_callback is not None:
+                progress_callback(len(results), len(manifest), batch_results)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+        source.close()
+    return results
+
+
+def _summarize(results):
+    success_count = len([r for r in results if r['instance'] is not None])
+    errors = [r['error'] for r in results if r['error'] is not None]
+    return len(results), success_count, errors
+
 
-        zf.extractall(temp_directory)
+def import_instances_from_zip(zipfile_path, user, status="zip", **kwargs):
+    """
+    Import the instances of a zipped dump without extracting it. Accepts the
+    options of `import_instances_from_source()`; with more than one worker,
+    `zipfile_path` must be a path rather than a file object.
+
+    :returns: The number of instances, the number imported and the errors.
+    """
+    try:
+        source = ZipSource(zipfile_path)
+        source.names()
     except zipfile.BadZipfile, e:
         errors = [u"%s" % e]
         return 0, 0, errors
-    else:
-        return import_instances_from_path(temp_directory, user, status)
-    finally:
-        shutil.rmtree(temp_directory)
-
-
-def import_instances_from_path(path, user, status="zip"):
-    def callback(xform_fs):
-        """
-        This callback is passed an instance of a XFormInstanceFS.
-        See xform_fs.py for more info.
-        """
-        with django_file(xform_fs.path, field_name="xml_file",
-                         content_type="text/xml") as xml_file:
-            images = [django_file(jpg, field_name="image",
-                      content_type="image/jpeg") for jpg in xform_fs.photos]
-            # TODO: if an instance has been submitted make sure all the
-            # files are in the database.
-            # there shouldn't be any instances with a submitted status in the
-            # import.
-            instance = create_instance(user.username, xml_file, images, status)
-
-            for i in images:
-                i.close()
-
-            if instance:
-                return 1
-            else:
-                return 0
-
-    total_count, success_count, errors = iterate_through_instances(
-        path, callback)
-
-    return (total_count, success_count, errors)
+    return _summarize(
+        import_instances_from_source(source, user, status, **kwargs))
+
+
+def import_instances_from_path(path, user, status="zip", **kwargs):
+    """
+    Same as `import_instances_from_zip()` for an extracted dump.
+    """
+    return _summarize(import_instances_from_source(
+        DirectorySource(path), user, status, **kwargs))
@@ -0,0 +1,348 @@
+'''
+Django management command to replay submissions through the OpenRosa
+submission endpoint and measure their latency, SQL queries and Mongo round
+trips.
+
+The submissions are posted with the Django test client by `--concurrency`
+threads to a form published for a throwaway user, which is removed at the
+end of the run unless `--keep` is given. By default, the form and the
+submissions are synthetic (see `build_repeat_heavy_instance()`); `--form`
+and `--instance` replay an XLSForm fixture and one of its instances instead.
+
+:Example:
+    python manage.py benchmark_submissions --submissions 500 \\
+        --concurrency 4 --repeats 20 --attachments 2 --output before.json
+'''
+
+import json
+import math
+import os
+import re
+import threading
+import time
+import uuid
+from Queue import Empty, Queue
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from mock import patch
+from pyxform import Survey
+from pyxform.builder import create_survey_element_from_dict
+
+from onadata.apps.main.models import UserProfile
+from onadata.libs.utils.logger_tools import publish_xls_form,\
+    publish_xml_form, remove_xform
+from onadata.libs.utils.viewer_tools import django_file
+from .benchmark_xform_instance_parser import build_repeat_heavy_instance
+
+
+INSTANCE_ID_PATTERN = re.compile(r'<instanceID>[^<]*</instanceID>')
+
+
+def build_benchmark_survey(depth, fields, attachments):
+    '''
+    Build the form matching the submissions of `build_repeat_heavy_instance()`.
+    '''
+    def _questions():
+        return [{u'type': u'text', u'name': u'q_%d' % i, u'label': u'Q %d' % i}
+                for i in range(fields)]
+
+    children = []
+    for level in reversed(range(depth)):
+        children = [{
+            u'type': u'repeat',
+            u'name': u'repeat_%d' % level,
+            u'label': u'Repeat %d' % level,
+            u'children': _questions() + children,
+        }]
+
+    survey = Survey(name=u'benchmark', id_string=u'benchmark',
+                    title=u'Benchmark')
+    for child in _questions() + children:
+        survey.add_child(create_survey_element_from_dict(child))
+    for i in range(attachments):
+        survey.add_child(create_survey_element_from_dict({
+            u'type': u'image', u'name': u'photo_%d' % i,
+            u'label': u'Photo %d' % i,
+        }))
+    survey.add_child(create_survey_element_from_dict({
+        u'type': u'group',
+        u'name': u'meta',
+        u'control': {u'bodyless': True},
+        u'children': [{
+            u'type': u'calculate',
+            u'name': u'instanceID',
+            u'bind': {u'readonly': u'true()',
+                      u'calculate': u"concat('uuid:', uuid())"},
+        }],
+    }))
+    return survey
+
+
+def percentiles(values):
+    '''
+    Summarise `values` with their mean and nearest-rank percentiles.
+    '''
+    if not values:
+        return None
+    values = sorted(values)
+
+    def _rank(percent):
+        index = int(math.ceil(percent / 100.0 * len(values))) - 1
+        return values[max(0, min(index, len(values) - 1))]
+
+    return {
+        'mean': float(sum(values)) / len(values),
+        'p50': _rank(50),
+        'p95': _rank(95),
+        'p99': _rank(99),
+        'max': values[-1],
+    }
+
+
+class MongoRoundTripCounter(object):
+    '''
+    Count, per thread, the messages the Mongo client sends to the server.
+    Every query, write or `getMore` is one round trip.
+    '''
+    METHODS = ('_send_message', '_send_message_with_response')
+
+    def __init__(self):
+        self._local = threading.local()
+        self._patches = []
+
+    @property
+    def count(self):
+        return getattr(self._local, 'count', 0)
+
+    def reset(self):
+        self._local.count = 0
+
+    def _wrap(self, method):
+        def counting_method(client, *args, **kwargs):
+            self._local.count = self.count + 1
+            return method(client, *args, **kwargs)
+        return counting_method
+
+    def __enter__(self):
+        client_class = type(settings.MONGO_CONNECTION)
+        for name in self.METHODS:
+            self._patches.append(patch.object(
+                client_class, name, self._wrap(getattr(client_class, name))))
+        for p in self._patches:
+            p.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        for p in self._patches:
+            p.stop()
+        self._patches = []
+
+
+class Command(BaseCommand):
+    help = 'Measure the latency of the submission endpoint under load.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--submissions',
+            type=int,
+            default=100,
+            help='Number of submissions measured.',
+        )
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=5,
+            help='Number of submissions posted before measuring.',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=1,
+            help='Number of threads posting submissions.',
+        )
+        parser.add_argument(
+            '--repeats',
+            type=int,
+            default=10,
+            help='Number of repetitions of the outermost repeat group.',
+        )
+        parser.add_argument(
+            '--depth',
+            type=int,
+            default=2,
+            help='Number of nested repeat groups.',
+        )
+        parser.add_argument(
+            '--fields',
+            type=int,
+            default=10,
+            help='Number of questions in each group.',
+        )
+        parser.add_argument(
+            '--attachments',
+            type=int,
+            default=0,
+            help='Number of attachments posted with each submission.',
+        )
+        parser.add_argument(
+            '--attachment-size',
+            type=int,
+            default=100 * 1024,
+            help='Size of each attachment, in bytes.',
+        )
+        parser.add_argument(
+            '--form',
+            help='XLSForm fixture to publish instead of the synthetic form.',
+        )
+        parser.add_argument(
+            '--instance',
+            help='Submission of `--form` to replay.',
+        )
+        parser.add_argument(
+            '--output',
+            help='Write the results to this JSON file.',
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            default=False,
+            help='Keep the benchmark user, form and submissions.',
+        )
+
+    def handle(self, *_, **options):
+        if bool(options['form']) != bool(options['instance']):
+            raise CommandError('`--form` and `--instance` go together.')
+        if options['depth'] < 1 and not options['form']:
+            raise CommandError('`--depth` must be at least 1.')
+        if options['concurrency'] < 1 or options['submissions'] < 1:
+            raise CommandError(
+                '`--concurrency` and `--submissions` must be positive.')
+
+        username = 'benchmark_%s' % uuid.uuid4().hex[:8]
+        user = User.objects.create_user(username, password=uuid.uuid4().hex)
+        # Submit anonymously: authenticating every request would mostly
+        # measure password hashing
+        UserProfile.objects.get_or_create(user=user)
+        UserProfile.objects.filter(user=user).update(require_auth=False)
+        xform = None
+        try:
+            xform = self._publish(user, options)
+            xform.require_auth = False
+            xform.save()
+
+            with override_settings(ALLOWED_HOSTS=['*']):
+                self._run(username, options['warmup'], options)
+                results = self._run(
+                    username, options['submissions'], options)
+        finally:
+            if not options['keep']:
+                if xform is not None:
+                    remove_xform(xform)
+                user.delete()
+
+        results['config'] = dict(
+            (key, options[key]) for key in (
+                'submissions', 'warmup', 'concurrency', 'repeats', 'depth',
+                'fields', 'attachments', 'attachment_size', 'form',
+                'instance'))
+        results['config']['mongo_write_behind'] = getattr(
+            settings, 'MONGO_WRITE_BEHIND', False)
+
+        self.stdout.write(json.dumps(results, indent=4, sort_keys=True))
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=4, sort_keys=True)
+
+    def _publish(self, user, options):
+        if options['form']:
+            xls_file = django_file(
+                options['form'], 'xls_file', 'application/vnd.ms-excel')
+            return publish_xls_form(xls_file, user)
+        survey = build_benchmark_survey(
+            options['depth'], options['fields'], options['attachments'])
+        return publish_xml_form(
+            ContentFile(survey.to_xml(), name='benchmark.xml'), user)
+
+    def _build_submission(self, options):
+        instance_id = u'uuid:%s' % uuid.uuid4()
+        if options['instance']:
+            with open(options['instance']) as f:
+                xml = INSTANCE_ID_PATTERN.sub(
+                    u'<instanceID>%s</instanceID>' % instance_id,
+                    f.read().decode('utf-8'))
+        else:
+            xml, _ = build_repeat_heavy_instance(
+                options['repeats'], options['depth'], options['fields'],
+                options['attachments'], instance_id)
+        return xml.encode('utf-8')
+
+    def _run(self, username, count, options):
+        if count < 1:
+            return {}
+        url = '/%s/submission' % username
+        attachment = os.urandom(options['attachment_size'])
+        queue = Queue()
+        for _ in range(count):
+            queue.put(self._build_submission(options))
+        measurements = []
+        lock = threading.Lock()
+
+        def _post_submissions(mongo_counter):
+            client = Client()
+            try:
+                while True:
+                    try:
+                        xml = queue.get_nowait()
+                    except Empty:
+                        return
+                    data = {'xml_submission_file': SimpleUploadedFile(
+                        'submission.xml', xml, 'text/xml')}
+                    for i in range(options['attachments']):
+                        name = 'photo_%d.jpg' % i
+                        data[name] = SimpleUploadedFile(
+                            name, attachment, 'image/jpeg')
+                    mongo_counter.reset()
+                    with CaptureQueriesContext(connection) as queries:
+                        started = time.time()
+                        response = client.post(url, data)
+                        latency = (time.time() - started) * 1000
+                    with lock:
+                        measurements.append((response.status_code, latency,
+                                             len(queries),
+                                             mongo_counter.count))
+            finally:
+                connection.close()
+
+        with MongoRoundTripCounter() as mongo_counter:
+            threads = [threading.Thread(target=_post_submissions,
+                                        args=(mongo_counter,))
+                       for _ in range(options['concurrency'])]
+            started = time.time()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.time() - started
+
+        status_codes = {}
+        for status_code, _, _, _ in measurements:
+            status_codes[status_code] = status_codes.get(status_code, 0) + 1
+        return {
+            'submissions': len(measurements),
+            'errors': len([m for m in measurements if m[0] != 201]),
+            'status_codes': status_codes,
+            'elapsed_seconds': elapsed,
+            'throughput_per_second': len(measurements) / max(elapsed, 0.001),
+            'latency_ms': percentiles([m[1] for m in measurements]),
+            'sql_queries_per_submission': percentiles(
+                [m[2] for m in measurements]),
+            'mongo_round_trips_per_submission': percentiles(
+                [m[3] for m in measurements]),
+        }
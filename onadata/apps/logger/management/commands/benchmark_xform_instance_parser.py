@@ -0,0 +1,99 @@
+'''
+Django management command to compare the `XFormInstanceParser` backends on a
+synthetic, repeat-heavy submission.
+
+:Example:
+    python manage.py benchmark_xform_instance_parser --repeats 2000 --depth 3
+'''
+
+import timeit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...xform_instance_parser import PARSER_BACKENDS
+
+
+def build_repeat_heavy_instance(repeats, depth, fields, attachments=0,
+                                instance_id=u'uuid:benchmark'):
+    '''
+    Build the XML of a submission with `repeats` instances of a repeat group
+    nested `depth` levels deep, each holding `fields` questions, and with
+    `attachments` image questions named `photo_<n>`.
+
+    :returns: The XML string and the list of repeat xpaths.
+    '''
+    repeat_xpaths = []
+    xpath = None
+    for level in range(depth):
+        name = u'repeat_%d' % level
+        xpath = name if xpath is None else u'%s/%s' % (xpath, name)
+        repeat_xpaths.append(xpath)
+
+    def _build_group(level):
+        questions = u''.join(
+            u'<q_%d>value %d</q_%d>' % (i, i, i) for i in range(fields))
+        if level == depth:
+            return questions
+        # only the outermost group carries the bulk of the repetitions
+        count = repeats if level == 0 else 2
+        child = u'<repeat_%d>%s</repeat_%d>' % (
+            level, _build_group(level + 1), level)
+        return questions + child * count
+
+    photos = u''.join(u'<photo_%d>photo_%d.jpg</photo_%d>' % (i, i, i)
+                      for i in range(attachments))
+    xml = (u'<?xml version="1.0" ?><benchmark id="benchmark">%s%s'
+           u'<meta><instanceID>%s</instanceID></meta>'
+           u'</benchmark>') % (_build_group(0), photos, instance_id)
+    return xml, repeat_xpaths
+
+
+class Command(BaseCommand):
+    help = 'Time the XForm instance parser backends against each other.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeats',
+            type=int,
+            default=1000,
+            help='Number of repetitions of the outermost repeat group.',
+        )
+        parser.add_argument(
+            '--depth',
+            type=int,
+            default=3,
+            help='Number of nested repeat groups.',
+        )
+        parser.add_argument(
+            '--fields',
+            type=int,
+            default=10,
+            help='Number of questions in each group.',
+        )
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=5,
+            help='Number of times each backend parses the submission.',
+        )
+
+    def handle(self, *_, **options):
+        if options['depth'] < 1:
+            raise CommandError('`--depth` must be at least 1.')
+        xml, repeat_xpaths = build_repeat_heavy_instance(
+            options['repeats'], options['depth'], options['fields'])
+        self.stdout.write('Submission size: {} bytes, {} elements.'.format(
+            len(xml), xml.count(u'</')))
+
+        results = {}
+        for name, parse_xml in sorted(PARSER_BACKENDS.items()):
+            results[name] = parse_xml(xml, repeat_xpaths)[1]
+            seconds = min(timeit.repeat(
+                lambda: parse_xml(xml, repeat_xpaths),
+                repeat=options['iterations'], number=1))
+            self.stdout.write('{:>10}: {:.3f}s per submission'.format(
+                name, seconds))
+
+        expected = results.values()[0]
+        if any(result != expected for result in results.values()):
+            raise CommandError('Parser backends produced different results.')
@@ -1,19 +1,28 @@
 #!/usr/bin/env python
 # vim: ai ts=4 sts=4 et sw=4 coding=utf-8
 import os
+from optparse import make_option
 
 from django.contrib.auth.models import User
 from django.core.management.base import BaseCommand, CommandError
 from django.utils.translation import ugettext as _, ugettext_lazy
 
-from onadata.libs.logger.import_tools import import_instances_from_zip,\
-    import_instances_from_path
+from onadata.apps.logger.import_tools import DEFAULT_BATCH_SIZE,\
+    import_instances_from_zip, import_instances_from_path
 
 
 class Command(BaseCommand):
     args = 'username path'
     help = ugettext_lazy("Import a zip file, a directory containing zip files "
                          "or a directory of ODK instances")
+    option_list = BaseCommand.option_list + (
+        make_option('--workers', type='int', default=1,
+                    help=ugettext_lazy(
+                        "Number of threads importing the instances")),
+        make_option('--batch-size', type='int', default=DEFAULT_BATCH_SIZE,
+                    help=ugettext_lazy(
+                        "Number of instances imported per transaction")),
+    )
 
     def _log_import(self, results):
         total_count, success_count, errors = results
@@ -28,6 +37,8 @@ class Command(BaseCommand):
             raise CommandError(_("Usage: <command> username file/path."))
         username = args[0]
         path = args[1]
+        import_options = {'workers': kwargs['workers'],
+                          'batch_size': kwargs['batch_size']}
         try:
             user = User.objects.get(username=username)
         except User.DoesNotExist:
@@ -45,13 +56,15 @@ class Command(BaseCommand):
                 # dont walk further down this dir
                 subdirs.remove("odk")
                 self.stdout.write(_("Importing from dir %s..\n") % dir)
-                results = import_instances_from_path(dir, user)
-                self.log_import(results)
+                results = import_instances_from_path(
+                    dir, user, **import_options)
+                self._log_import(results)
             for file in files:
                 filepath = os.path.join(path, file)
                 if os.path.isfile(filepath) and\
                         os.path.splitext(filepath)[1].lower() == ".zip":
                     self.stdout.write(_(
                         "Importing from zip at %s..\n") % filepath)
-                    results = import_instances_from_zip(filepath, user)
-                    self.log_import(results)
+                    results = import_instances_from_zip(
+                        filepath, user, **import_options)
+                    self._log_import(results)
@@ -7,7 +7,7 @@ Relies solely on the `argparse` capabilities of `BaseCommand` for argument parsi
 
 :Example:
     python manage.py populate_xml_hashes_for_instances --repopulate --usernames someuser anotheruser
-    python manage.py populate_xml_hashes_for_instances --all
+    python manage.py populate_xml_hashes_for_instances --all --workers 4
 '''
 
 from datetime import datetime
@@ -37,6 +37,18 @@ class Command(BaseCommand):
             help='Recalculate even `Instance` objects that already have '
                  'hashes.',
         )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Number of `Instance` objects hashed and updated at once.',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of chunks processed in parallel.',
+        )
 
     def handle(self, *_, **options):
         # Populate the `Instance` hashes and track how long it took.
@@ -44,6 +56,8 @@ class Command(BaseCommand):
         instances_updated_total = Instance.populate_xml_hashes_for_instances(
             usernames=options['usernames'],
             repopulate=options['repopulate'],
+            chunk_size=options['chunk_size'],
+            workers=options['workers'],
         )
         execution_time = datetime.now() - start_time
 
@@ -18,17 +18,28 @@ class Command(BaseCommand):
             '--batchsize',
             type='int',
             default=100,
-            help=ugettext_lazy("Number of records to process per query")),)
+            help=ugettext_lazy("Number of records to process per query")),
+        make_option(
+            '--only-unknown',
+            action='store_true',
+            default=False,
+            help=ugettext_lazy("Only update the records saved before "
+                               "is_synced_with_mongo was added")),)
 
 
     def handle(self, *args, **kwargs):
         batchsize = kwargs.get("batchsize", 100)
         xform_instances = settings.MONGO_DB.instances
+        instances = Instance.objects.all()
+        if kwargs.get("only_unknown"):
+            instances = instances.filter(is_synced_with_mongo__isnull=True)
         stop = False
-        offset = 0
+        last_id = 0
         while stop is not True:
-            limit = offset + batchsize
-            instances_ids = Instance.objects.values_list("id", flat=True).order_by("id")[offset:limit]
+            # the updates take the records out of `--only-unknown`, so page
+            # on the ids rather than with an offset
+            instances_ids = instances.filter(id__gt=last_id).values_list(
+                "id", flat=True).order_by("id")[:batchsize]
             if instances_ids:
                 instances_ids = [int(instance_id) for instance_id in instances_ids]
                 query = {"_id": {"$in": instances_ids}}
@@ -46,6 +57,6 @@ class Command(BaseCommand):
                 if mongo_ids:
                     Instance.objects.filter(id__in=mongo_ids).update(is_synced_with_mongo=True)
 
-                offset += batchsize
+                last_id = instances_ids[-1]
             else:
                 stop = True
\ No newline at end of file
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    '''
+    Index the columns `reconcile_mongo()` filters on: the modification date,
+    and, with a partial index, the instances not synced with Mongo.
+    '''
+
+    dependencies = [
+        ('logger', '0011_add-index-to-instance-uuid_and_xform_uuid'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='instance',
+            name='date_modified',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX logger_instance_not_synced_with_mongo '
+            'ON logger_instance (xform_id) '
+            'WHERE is_synced_with_mongo = 0;',
+            reverse_sql='DROP INDEX logger_instance_not_synced_with_mongo;'
+        ),
+    ]
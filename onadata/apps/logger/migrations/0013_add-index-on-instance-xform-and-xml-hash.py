@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logger', '0012_add-index-on-instance-date-modified'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='instance',
+            index_together=set([('xform', 'xml_hash')]),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logger', '0013_add-index-on-instance-xform-and-xml-hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attachment',
+            name='media_file_hash',
+            field=models.CharField(db_index=True, max_length=32, null=True, blank=True),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.conf import settings
+import jsonfield.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('logger', '0014_attachment_media_file_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BulkImport',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('zip_file', models.CharField(max_length=255)),
+                ('status', models.CharField(default='pending', max_length=10, choices=[('pending', 'pending'), ('running', 'running'), ('successful', 'successful'), ('failed', 'failed')])),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('processed', models.PositiveIntegerField(default=0)),
+                ('imported', models.PositiveIntegerField(default=0)),
+                ('results', jsonfield.fields.JSONField(default=[])),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('date_modified', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(related_name='bulk_imports', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    '''
+    Index, with a partial index, the instances saved before
+    `is_synced_with_mongo` was added, which `mongo_sync_report()` reports
+    until `update_is_sync_with_mongo --only-unknown` resolves them.
+    '''
+
+    dependencies = [
+        ('logger', '0015_bulkimport'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX logger_instance_unknown_mongo_sync '
+            'ON logger_instance (xform_id) '
+            'WHERE is_synced_with_mongo IS NULL;',
+            reverse_sql='DROP INDEX logger_instance_unknown_mongo_sync;'
+        ),
+    ]
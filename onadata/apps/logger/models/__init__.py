@@ -4,3 +4,4 @@ from onadata.apps.logger.models.survey_type import SurveyType
 from onadata.apps.logger.models.xform import XForm
 from onadata.apps.logger.models.ziggy_instance import ZiggyInstance
 from onadata.apps.logger.models.note import Note
+from onadata.apps.logger.models.bulk_import import BulkImport
@@ -3,7 +3,11 @@ import re
 import mimetypes
 
 from hashlib import md5
-from django.db import models
+from itertools import islice
+from multiprocessing.dummy import Pool as ThreadPool
+
+from django.db import connection, models
+from django.db.models import Case, Value, When
 
 from instance import Instance
 
@@ -26,6 +30,19 @@ def hash_attachment_contents(contents):
     return u'%s' % md5(contents).hexdigest()
 
 
+def hash_attachment_file(f):
+    '''
+    Same as `hash_attachment_contents(f.read())`, reading `f` in chunks
+    instead of all at once. `f` is rewound afterwards.
+    '''
+    contents_hash = md5()
+    # `chunks()` starts from the beginning of the file
+    for chunk in f.chunks():
+        contents_hash.update(chunk)
+    f.seek(0)
+    return u'%s' % contents_hash.hexdigest()
+
+
 class Attachment(models.Model):
     instance = models.ForeignKey(Instance, related_name="attachments")
     media_file = models.FileField(upload_to=upload_to, max_length=380, db_index=True)
@@ -33,6 +50,10 @@ class Attachment(models.Model):
         max_length=260, null=True, blank=True, db_index=True)
     mimetype = models.CharField(
         max_length=100, null=False, blank=True, default='')
+    # Set when the file is uploaded; use the `set_media_file_hash` management
+    # command to populate it for older attachments
+    media_file_hash = models.CharField(
+        max_length=32, null=True, blank=True, db_index=True)
 
     class Meta:
         app_label = 'logger'
@@ -40,6 +61,10 @@ class Attachment(models.Model):
     def save(self, *args, **kwargs):
         if self.media_file:
             self.media_file_basename = self.filename
+            if self.media_file_hash is None and \
+                    not self.media_file._committed:
+                # hash the upload itself, before it is sent to the storage
+                self.media_file_hash = hash_attachment_file(self.media_file)
             if self.mimetype == '':
                 # guess mimetype
                 mimetype, encoding = mimetypes.guess_type(self.media_file.name)
@@ -50,14 +75,89 @@ class Attachment(models.Model):
 
     @property
     def file_hash(self):
+        if self.media_file_hash is not None:
+            return self.media_file_hash
         if self.media_file.storage.exists(self.media_file.name):
             media_file_position = self.media_file.tell()
-            self.media_file.seek(0)
-            media_file_hash = hash_attachment_contents(self.media_file.read())
+            media_file_hash = hash_attachment_file(self.media_file)
             self.media_file.seek(media_file_position)
+            # Avoid reading the file from the storage again
+            self.media_file_hash = media_file_hash
+            if self.pk:
+                Attachment.objects.filter(pk=self.pk).update(
+                    media_file_hash=media_file_hash)
             return media_file_hash
         return u''
 
+    @classmethod
+    def populate_media_file_hashes(cls, chunk_size=100, workers=1):
+        '''
+        Populate the `media_file_hash` field of the attachments uploaded
+        before it existed. Attachments whose file is missing are skipped.
+
+        :param int chunk_size: Number of attachments updated at once.
+        :param int workers: Number of threads reading files from the storage
+            in parallel, each with its own DB connection.
+        :returns: Total number of attachments updated.
+        '''
+        queryset = cls.objects.filter(media_file_hash=None).exclude(
+            media_file='').order_by('pk')
+
+        def _chunks():
+            last_pk = 0
+            while True:
+                attachments = list(
+                    queryset.filter(pk__gt=last_pk).only('pk', 'media_file')[
+                        :chunk_size])
+                if not attachments:
+                    return
+                last_pk = attachments[-1].pk
+                yield attachments
+
+        def _hash(attachment):
+            storage = attachment.media_file.storage
+            if not storage.exists(attachment.media_file.name):
+                return None
+            attachment.media_file.open()
+            try:
+                return hash_attachment_file(attachment.media_file)
+            finally:
+                attachment.media_file.close()
+
+        def _populate_chunk(attachments):
+            try:
+                hashes = [(a.pk, _hash(a)) for a in attachments]
+                hashes = [(pk, h) for pk, h in hashes if h is not None]
+                if not hashes:
+                    return 0
+                # A single `UPDATE` for the whole chunk
+                return cls.objects.filter(
+                    pk__in=[pk for pk, _ in hashes]).update(
+                    media_file_hash=Case(
+                        *[When(pk=pk, then=Value(h)) for pk, h in hashes],
+                        output_field=models.CharField()))
+            finally:
+                if workers > 1:
+                    # Every thread of the pool has its own connection
+                    connection.close()
+
+        total = 0
+        chunks = _chunks()
+        pool = ThreadPool(workers) if workers > 1 else None
+        try:
+            while True:
+                # Only keep `workers` chunks in memory at a time
+                chunk_batch = list(islice(chunks, workers))
+                if not chunk_batch:
+                    break
+                map_function = pool.map if pool else map
+                total += sum(map_function(_populate_chunk, chunk_batch))
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+        return total
+
     @property
     def filename(self):
         return os.path.basename(self.media_file.name)
@@ -0,0 +1,46 @@
+from django.contrib.auth.models import User
+from django.db import models
+from jsonfield import JSONField
+
+
+class BulkImport(models.Model):
+    """
+    Progress and per-instance results of a bulk submission imported by the
+    `import_instances_from_zip_async` task.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    SUCCESSFUL = 'successful'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, PENDING),
+        (RUNNING, RUNNING),
+        (SUCCESSFUL, SUCCESSFUL),
+        (FAILED, FAILED),
+    )
+
+    user = models.ForeignKey(User, related_name='bulk_imports')
+    # Path of the uploaded zip file in the default storage, deleted once
+    # imported
+    zip_file = models.CharField(max_length=255)
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    total = models.PositiveIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    imported = models.PositiveIntegerField(default=0)
+    results = JSONField(default=[], null=False)
+    date_created = models.DateTimeField(auto_now_add=True)
+    date_modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        app_label = 'logger'
+
+    def to_dict(self):
+        return {
+            'id': self.pk,
+            'status': self.status,
+            'total': self.total,
+            'processed': self.processed,
+            'imported': self.imported,
+            'results': self.results,
+        }
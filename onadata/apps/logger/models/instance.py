@@ -1,10 +1,12 @@
 from datetime import datetime
 from hashlib import sha256
+from itertools import islice
+from multiprocessing.dummy import Pool as ThreadPool
 
 import reversion
 
-from django.db.models import F
-from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.db import connection, transaction
 from django.contrib.gis.db import models
 from django.db.models.signals import post_save
 from django.db.models.signals import post_delete
@@ -62,52 +64,53 @@ def submission_time():
     return timezone.now()
 
 
-def update_xform_submission_count(sender, instance, created, **kwargs):
-    if not created:
-        return
-    # `defer_counting` is a Python-only attribute
-    if getattr(instance, 'defer_counting', False):
-        return
+def increment_submission_counts(xform_id, count, last_submission_time=None):
+    """
+    Add `count` new submissions to the counters of a form and of its owner,
+    or remove them if `count` is negative. The counters never go below 0.
+    """
     with transaction.atomic():
-        xform = XForm.objects.only('user_id').get(pk=instance.xform_id)
+        try:
+            xform = XForm.objects.only('user_id').get(pk=xform_id)
+        except XForm.DoesNotExist:
+            # the submissions are deleted along with their form
+            return
+        updates = {'num_of_submissions': F('num_of_submissions') + count}
+        if last_submission_time is not None:
+            updates['last_submission_time'] = last_submission_time
         # Update with `F` expression instead of `select_for_update` to avoid
         # locks, which were mysteriously piling up during periods of high
         # traffic
-        XForm.objects.filter(pk=instance.xform_id).update(
-            num_of_submissions=F('num_of_submissions') + 1,
-            last_submission_time=instance.date_created,
-        )
+        XForm.objects.filter(pk=xform_id).update(**updates)
         # Hack to avoid circular imports
         UserProfile = User.profile.related.related_model
         profile, created = UserProfile.objects.only('pk').get_or_create(
             user_id=xform.user_id
         )
         UserProfile.objects.filter(pk=profile.pk).update(
-            num_of_submissions=F('num_of_submissions') + 1,
+            num_of_submissions=F('num_of_submissions') + count,
         )
+        if count < 0:
+            XForm.objects.filter(pk=xform_id, num_of_submissions__lt=0)\
+                .update(num_of_submissions=0)
+            UserProfile.objects.filter(
+                pk=profile.pk, num_of_submissions__lt=0).update(
+                num_of_submissions=0)
+
+
+def update_xform_submission_count(sender, instance, created, **kwargs):
+    if not created:
+        return
+    # `defer_counting` is a Python-only attribute
+    if getattr(instance, 'defer_counting', False):
+        return
+    increment_submission_counts(instance.xform_id, 1, instance.date_created)
 
 
 def update_xform_submission_count_delete(sender, instance, **kwargs):
-    try:
-        xform = XForm.objects.select_for_update().get(pk=instance.xform.pk)
-    except XForm.DoesNotExist:
-        pass
-    else:
-        xform.num_of_submissions -= 1
-        if xform.num_of_submissions < 0:
-            xform.num_of_submissions = 0
-        xform.save()
-        profile_qs = User.profile.get_queryset()
-        try:
-            profile = profile_qs.select_for_update()\
-                .get(pk=xform.user.profile.pk)
-        except profile_qs.model.DoesNotExist:
-            pass
-        else:
-            profile.num_of_submissions -= 1
-            if profile.num_of_submissions < 0:
-                profile.num_of_submissions = 0
-            profile.save()
+    # soft deleted submissions were already taken off the counters
+    if instance.deleted_at is None:
+        increment_submission_counts(instance.xform_id, -1)
 
 
 @reversion.register
@@ -127,7 +130,7 @@ class Instance(models.Model):
     date_created = models.DateTimeField(auto_now_add=True)
 
     # this will end up representing "date last parsed"
-    date_modified = models.DateTimeField(auto_now=True)
+    date_modified = models.DateTimeField(auto_now=True, db_index=True)
 
     # this will end up representing "date instance was deleted"
     deleted_at = models.DateTimeField(null=True, default=None)
@@ -156,6 +159,8 @@ class Instance(models.Model):
 
     class Meta:
         app_label = 'logger'
+        # Duplicate submissions are looked up by content hash within a form
+        index_together = (('xform', 'xml_hash'),)
 
     @property
     def asset(self):
@@ -185,20 +190,38 @@ class Instance(models.Model):
         if not force and self.xform and not self.xform.downloadable:
             raise FormInactiveError()
 
+    def _get_data_dictionary(self):
+        context = getattr(self, 'submission_context', None)
+        if context is not None:
+            return context.data_dictionary
+        return self.xform.data_dictionary()
+
+    def _get_geopoints(self, geo_xpaths):
+        self._set_parser()
+        context = getattr(self, 'submission_context', None)
+        if context is not None and context.geopoints is not None:
+            return context.geopoints
+
+        doc = self.get_dict()
+        points = []
+        for xpath in geo_xpaths:
+            geometry = [float(s) for s in doc.get(xpath, u'').split()]
+
+            if len(geometry):
+                lat, lng = geometry[0:2]
+                points.append(Point(lng, lat))
+
+        if context is not None:
+            context.geopoints = points
+        return points
+
     def _set_geom(self):
         xform = self.xform
-        data_dictionary = xform.data_dictionary()
+        data_dictionary = self._get_data_dictionary()
         geo_xpaths = data_dictionary.geopoint_xpaths()
-        doc = self.get_dict()
-        points = []
 
         if len(geo_xpaths):
-            for xpath in geo_xpaths:
-                geometry = [float(s) for s in doc.get(xpath, u'').split()]
-
-                if len(geometry):
-                    lat, lng = geometry[0:2]
-                    points.append(Point(lng, lat))
+            points = self._get_geopoints(geo_xpaths)
 
             if not xform.instances_with_geopoints and len(points):
                 xform.instances_with_geopoints = True
@@ -224,7 +247,11 @@ class Instance(models.Model):
         self.json = doc
 
     def _set_parser(self):
-        if not hasattr(self, "_parser"):
+        context = getattr(self, 'submission_context', None)
+        if context is not None:
+            # `save_submission()` shares one parse across every step
+            self._parser = context.get_parser(self.xml)
+        elif not hasattr(self, "_parser"):
             self._parser = XFormInstanceParser(
                 self.xml, self.xform.data_dictionary())
 
@@ -247,7 +274,8 @@ class Instance(models.Model):
         self.xml_hash = self.get_hash(self.xml)
 
     @classmethod
-    def populate_xml_hashes_for_instances(cls, usernames=None, pk__in=None, repopulate=False):
+    def populate_xml_hashes_for_instances(cls, usernames=None, pk__in=None, repopulate=False,
+                                          chunk_size=2000, workers=1):
         '''
         Populate the `xml_hash` field for `Instance` instances limited to the specified users
         and/or DB primary keys.
@@ -257,6 +285,9 @@ class Instance(models.Model):
         :param list[int] pk__in: Optional list of primary keys for `Instance`s that should be
         populated with hashes.
         :param bool repopulate: Optional argument to force repopulation of existing hashes.
+        :param int chunk_size: Number of `Instance`s hashed and updated at once.
+        :param int workers: Number of chunks processed in parallel, each by a thread with its own
+        DB connection.
         :returns: Total number of `Instance`s updated.
         :rtype: int
         '''
@@ -277,31 +308,46 @@ class Instance(models.Model):
         if not target_instances_queryset.exists():
             return 0
 
-        # Limit our queryset result content since we'll only need the `pk` and `xml` attributes.
-        target_instances_queryset = target_instances_queryset.only('pk', 'xml')
-        instances_updated_total = 0
+        def _chunks():
+            # Only the primary keys are read here, the XML is read by `_populate_chunk()`.
+            last_pk = 0
+            while True:
+                pks = list(target_instances_queryset.filter(pk__gt=last_pk).order_by(
+                    'pk').values_list('pk', flat=True)[:chunk_size])
+                if not pks:
+                    return
+                last_pk = pks[-1]
+                yield pks
+
+        def _populate_chunk(pks):
+            try:
+                hashes = [(pk, cls.get_hash(xml)) for pk, xml in
+                          cls.objects.filter(pk__in=pks).values_list('pk', 'xml')]
+                # Do a single `Queryset.update()` for the whole chunk, which also avoids signals
+                # triggering things like `Reversion` versioning.
+                return cls.objects.filter(pk__in=pks).update(xml_hash=Case(
+                    *[When(pk=pk, then=Value(xml_hash)) for pk, xml_hash in hashes],
+                    output_field=models.CharField()))
+            finally:
+                if workers > 1:
+                    # Every thread of the pool has its own connection
+                    connection.close()
 
-        # Break the potentially large `target_instances_queryset` into chunks to avoid memory
-        # exhaustion.
-        chunk_size = 2000
-        target_instances_queryset = target_instances_queryset.order_by('pk')
-        target_instances_qs_chunk = target_instances_queryset
-        while target_instances_qs_chunk.exists():
-            # Take a chunk of the target `Instance`s.
-            target_instances_qs_chunk = target_instances_qs_chunk[0:chunk_size]
-
-            for instance in target_instances_qs_chunk:
-                pk = instance.pk
-                xml = instance.xml
-                # Do a `Queryset.update()` on this individual instance to avoid signals triggering
-                # things like `Reversion` versioning.
-                instances_updated_count = Instance.objects.filter(pk=pk).update(
-                    xml_hash=cls.get_hash(xml))
-                instances_updated_total += instances_updated_count
-
-            # Set up the next chunk
-            target_instances_qs_chunk = target_instances_queryset.filter(
-                pk__gt=instance.pk)
+        instances_updated_total = 0
+        chunks = _chunks()
+        pool = ThreadPool(workers) if workers > 1 else None
+        try:
+            while True:
+                # Only keep `workers` chunks in memory at a time
+                chunk_batch = list(islice(chunks, workers))
+                if not chunk_batch:
+                    break
+                map_function = pool.map if pool else map
+                instances_updated_total += sum(map_function(_populate_chunk, chunk_batch))
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
 
         return instances_updated_total
 
@@ -389,10 +435,11 @@ class Instance(models.Model):
         super(Instance, self).save(*args, **kwargs)
 
     def set_deleted(self, deleted_at=timezone.now()):
+        was_deleted = self.deleted_at is not None
         self.deleted_at = deleted_at
         self.save()
-        # force submission count re-calculation
-        self.xform.submission_count(force_update=True)
+        if not was_deleted:
+            increment_submission_counts(self.xform_id, -1)
         self.parsed_instance.save()
 
     def get_validation_status(self):
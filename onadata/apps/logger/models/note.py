@@ -1,4 +1,7 @@
 from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
 from .instance import Instance
 
 
@@ -13,3 +16,15 @@ class Note(models.Model):
         permissions = (
             ('view_note', 'View note'),
         )
+
+
+def update_instance_date_modified(sender, instance, **kwargs):
+    # the notes are part of the exported submission, which the export cache
+    # and incremental exports tell apart by `date_modified`
+    Instance.objects.filter(pk=instance.instance_id).update(
+        date_modified=timezone.now())
+
+post_save.connect(update_instance_date_modified, sender=Note,
+                  dispatch_uid='note_update_instance_date_modified')
+post_delete.connect(update_instance_date_modified, sender=Note,
+                    dispatch_uid='note_delete_instance_date_modified')
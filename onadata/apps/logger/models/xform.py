@@ -14,6 +14,7 @@ from django.core.urlresolvers import reverse
 from django.db.models.signals import post_save, post_delete
 from django.core.exceptions import ObjectDoesNotExist
 from django.core.files.storage import get_storage_class
+from django.db.models.fields.files import FieldFile
 from django.utils.translation import ugettext_lazy, ugettext as _
 from guardian.shortcuts import \
     assign_perm, \
@@ -129,7 +130,22 @@ class XForm(BaseModel):
     def data_dictionary(self):
         from onadata.apps.viewer.models.data_dictionary import\
             DataDictionary
-        return DataDictionary.objects.get(pk=self.pk)
+        if self.pk is None or self.get_deferred_fields():
+            return DataDictionary.objects.get(pk=self.pk)
+
+        # `DataDictionary` is a proxy of `XForm`, so build it from the row we
+        # already have instead of fetching it again. Its compiled survey comes
+        # from a process-wide cache.
+        field_names = []
+        values = []
+        for field in self._meta.concrete_fields:
+            value = getattr(self, field.attname)
+            if isinstance(value, FieldFile):
+                # let the new instance bind its own `FieldFile`
+                value = value.name
+            field_names.append(field.attname)
+            values.append(value)
+        return DataDictionary.from_db(self._state.db, field_names, values)
 
     @property
     def has_instances_with_geopoints(self):
@@ -217,10 +233,15 @@ class XForm(BaseModel):
         return getattr(self, "id_string", "")
 
     def submission_count(self, force_update=False):
+        """
+        The number of submissions, maintained by the `Instance` signals;
+        `force_update`, or a counter still at 0, recounts them, which scans
+        the submissions of the form
+        """
         if self.num_of_submissions == 0 or force_update:
             count = self.instances.filter(deleted_at__isnull=True).count()
+            XForm.objects.filter(pk=self.pk).update(num_of_submissions=count)
             self.num_of_submissions = count
-            self.save()
         return self.num_of_submissions
     submission_count.short_description = ugettext_lazy("Submission Count")
 
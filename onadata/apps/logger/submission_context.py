@@ -0,0 +1,41 @@
+from onadata.apps.logger.xform_instance_parser import XFormInstanceParser
+
+
+class SubmissionContext(object):
+    """
+    Holds everything derived from one submission while it is being saved.
+
+    `save_submission()` creates a context and attaches it to the `Instance`
+    as the Python-only `submission_context` attribute. `Instance.save()`,
+    `ParsedInstance.save()` and `call_service()` then share the parsed XML,
+    the geopoints and the Mongo document instead of rebuilding them.
+    """
+
+    def __init__(self, xform):
+        self.xform = xform
+        self._data_dictionary = None
+        self._parser = None
+        self._parsed_xml = None
+        # Populated by `Instance._set_geom()`
+        self.geopoints = None
+        # Populated by `ParsedInstance.to_dict_for_mongo()`
+        self.mongo_document = None
+
+    @property
+    def data_dictionary(self):
+        if self._data_dictionary is None:
+            self._data_dictionary = self.xform.data_dictionary()
+        return self._data_dictionary
+
+    def get_parser(self, xml):
+        """
+        Return the parser for `xml`, parsing it only the first time. An edit
+        submission replaces the XML, in which case everything derived from
+        the previous XML is dropped.
+        """
+        if self._parser is None or xml != self._parsed_xml:
+            self._parser = XFormInstanceParser(xml, self.data_dictionary)
+            self._parsed_xml = xml
+            self.geopoints = None
+            self.mongo_document = None
+        return self._parser
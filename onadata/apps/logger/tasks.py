@@ -15,13 +15,18 @@ def fix_root_node_names(**kwargs):
 
 import csv
 import datetime
+import logging
 import pytz
+import shutil
+import tempfile
 import zipfile
 from io import BytesIO
 from collections import defaultdict
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.files.storage import get_storage_class
-from .models import Instance, XForm
+from .import_tools import ZipSource, import_instances_from_source
+from .models import BulkImport, Instance, XForm
 
 @shared_task
 def generate_stats_zip(output_filename):
@@ -88,3 +93,53 @@ def generate_stats_zip(output_filename):
             csv_io.close()
 
         zip_file.close()
+
+
+@shared_task
+def import_instances_from_zip_async(bulk_import_id):
+    """
+    Import the zip file of a `BulkImport`, recording the progress after
+    every batch of instances.
+    """
+    bulk_import = BulkImport.objects.get(pk=bulk_import_id)
+    BulkImport.objects.filter(pk=bulk_import.pk).update(
+        status=BulkImport.RUNNING)
+    default_storage = get_storage_class()()
+    counts = {'imported': 0}
+    # the results of the batches done, kept if the import fails
+    done_results = []
+
+    def _progress(processed, total, batch_results):
+        done_results.extend(batch_results)
+        counts['imported'] += len(
+            [r for r in batch_results if r['instance'] is not None])
+        BulkImport.objects.filter(pk=bulk_import.pk).update(
+            processed=processed, total=total, imported=counts['imported'])
+
+    try:
+        with tempfile.NamedTemporaryFile(suffix='.zip') as zip_file:
+            # `ZipFile` needs to seek, which remote storages do poorly
+            with default_storage.open(bulk_import.zip_file, 'rb') as f:
+                shutil.copyfileobj(f, zip_file)
+            zip_file.flush()
+            results = import_instances_from_source(
+                ZipSource(zip_file.name), bulk_import.user,
+                workers=settings.BULK_SUBMISSION_WORKERS,
+                progress_callback=_progress)
+    except Exception as e:
+        logging.exception('Bulk import %d failed', bulk_import.pk)
+        bulk_import.status = BulkImport.FAILED
+        bulk_import.results = done_results + [
+            {'path': None, 'instance': None, 'error': unicode(e)}]
+        # the batches imported before the failure are committed, and
+        # `_progress()` recorded how far the import got
+        update_fields = ['imported']
+    else:
+        bulk_import.status = BulkImport.SUCCESSFUL
+        bulk_import.results = results
+        bulk_import.total = bulk_import.processed = len(results)
+        update_fields = ['total', 'processed', 'imported']
+    bulk_import.imported = counts['imported']
+    bulk_import.save(update_fields=[
+        'status', 'results', 'date_modified'] + update_fields)
+    default_storage.delete(bulk_import.zip_file)
@@ -1,13 +1,18 @@
 from datetime import datetime
+from hashlib import md5
 import os
 
 from django.core.files.base import File
 from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.management import call_command
 
 from onadata.apps.main.tests.test_base import TestBase
 from onadata.apps.logger.models import Attachment, Instance
+from onadata.apps.logger.models.attachment import \
+    generate_attachment_filename
 from onadata.libs.utils.image_tools import image_url
+from onadata.libs.utils.logger_tools import save_attachments
 
 
 class TestAttachment(TestBase):
@@ -23,10 +28,54 @@ class TestAttachment(TestBase):
         self.attachment = Attachment.objects.create(
             instance=self.instance,
             media_file=File(open(media_file), media_file))
+        with open(media_file) as f:
+            self.media_file_hash = md5(f.read()).hexdigest()
 
     def test_mimetype(self):
         self.assertEqual(self.attachment.mimetype, 'image/jpeg')
 
+    def test_media_file_hash(self):
+        self.assertEqual(self.attachment.media_file_hash,
+                         self.media_file_hash)
+        self.assertEqual(Attachment.objects.get(
+            pk=self.attachment.pk).file_hash, self.media_file_hash)
+
+    def test_set_media_file_hash_command(self):
+        Attachment.objects.update(media_file_hash=None)
+        call_command("set_media_file_hash", attachments=True, workers=2,
+                     chunk_size=1)
+        self.assertFalse(
+            Attachment.objects.filter(media_file_hash=None).exists())
+        self.assertEqual(Attachment.objects.get(
+            pk=self.attachment.pk).media_file_hash, self.media_file_hash)
+
+    def test_save_attachments_skips_duplicates_without_hash(self):
+        media_file = os.path.join(
+            self.this_directory, 'fixtures',
+            'transportation', 'instances', self.surveys[0], self.media_file)
+        with open(media_file) as f:
+            contents = f.read()
+        # an attachment saved before its hash was recorded, at the path a
+        # new upload of the same file gets
+        filename = generate_attachment_filename(
+            self.instance, self.media_file)
+        if not default_storage.exists(filename):
+            default_storage.save(filename, File(open(media_file)))
+        Attachment.objects.filter(pk=self.attachment.pk).update(
+            media_file=filename, media_file_hash=None)
+        count = Attachment.objects.count()
+
+        self.assertFalse(save_attachments(self.instance, [SimpleUploadedFile(
+            self.media_file, contents, content_type='image/jpeg')]))
+        self.assertEqual(Attachment.objects.count(), count)
+        self.assertEqual(Attachment.objects.get(
+            pk=self.attachment.pk).media_file_hash, self.media_file_hash)
+
+        # then its recorded hash is enough
+        self.assertFalse(save_attachments(self.instance, [SimpleUploadedFile(
+            self.media_file, contents, content_type='image/jpeg')]))
+        self.assertEqual(Attachment.objects.count(), count)
+
     def test_thumbnails(self):
         for attachment in Attachment.objects.filter(instance=self.instance):
             url = image_url(attachment, 'small')
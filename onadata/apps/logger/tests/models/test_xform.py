@@ -4,6 +4,7 @@ import unittest
 
 from onadata.apps.main.tests.test_base import TestBase
 from onadata.apps.logger.models import XForm, Instance
+from onadata.apps.main.models import UserProfile
 
 
 class TestXForm(TestBase):
@@ -23,6 +24,31 @@ class TestXForm(TestBase):
         self.xform = XForm.objects.get(pk=self.xform.id)
         self.assertEqual(self.xform.submission_count(), 0)
 
+    def test_deletes_update_submission_counters(self):
+        self._publish_transportation_form()
+        self._make_submissions()
+        instances = list(self.xform.instances.order_by('pk'))
+        instances[0].set_deleted()
+        # deleting it again, or for good, doesn't count it twice
+        Instance.objects.get(pk=instances[0].pk).set_deleted()
+        Instance.objects.get(pk=instances[0].pk).delete()
+        instances[1].delete()
+
+        self.xform = XForm.objects.get(pk=self.xform.pk)
+        self.assertEqual(self.xform.num_of_submissions, 2)
+        self.assertEqual(self.xform.submission_count(force_update=True), 2)
+        self.assertEqual(
+            UserProfile.objects.get(user=self.user).num_of_submissions, 2)
+
+    def test_submission_count_recounts_a_zero_counter(self):
+        self._publish_transportation_form()
+        self._make_submissions()
+        XForm.objects.filter(pk=self.xform.pk).update(num_of_submissions=0)
+        self.xform = XForm.objects.get(pk=self.xform.pk)
+        self.assertEqual(self.xform.submission_count(), 4)
+        self.assertEqual(
+            XForm.objects.get(pk=self.xform.pk).num_of_submissions, 4)
+
     def test_set_title_in_xml_unicode_error(self):
         xls_file_path = os.path.join(
             os.path.dirname(os.path.abspath(__file__)),
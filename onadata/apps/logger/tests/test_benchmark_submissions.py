@@ -0,0 +1,34 @@
+import json
+import os
+from tempfile import NamedTemporaryFile
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+
+from onadata.apps.logger.models import Instance, XForm
+from onadata.apps.main.tests.test_base import TestBase
+
+
+class TestBenchmarkSubmissions(TestBase):
+    def test_benchmark_submissions(self):
+        with NamedTemporaryFile(suffix='.json', delete=False) as f:
+            path = f.name
+        call_command('benchmark_submissions', submissions=3, warmup=1,
+                     concurrency=2, repeats=2, attachments=1,
+                     attachment_size=16, output=path)
+        with open(path) as f:
+            results = json.load(f)
+        os.unlink(path)
+
+        self.assertEqual(results['submissions'], 3)
+        self.assertEqual(results['errors'], 0)
+        for key in ('latency_ms', 'sql_queries_per_submission',
+                    'mongo_round_trips_per_submission'):
+            self.assertEqual(
+                sorted(results[key]), ['max', 'mean', 'p50', 'p95', 'p99'])
+        self.assertGreater(results['sql_queries_per_submission']['p50'], 0)
+        # the benchmark user and data are removed
+        self.assertFalse(User.objects.filter(
+            username__startswith='benchmark_').exists())
+        self.assertEqual(XForm.objects.count(), 0)
+        self.assertEqual(Instance.objects.count(), 0)
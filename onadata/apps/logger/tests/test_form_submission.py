@@ -199,6 +199,38 @@ class TestFormSubmission(TestBase):
         self._make_submission(xml_submission_file_path)
         self.assertEqual(self.response.status_code, 202)
 
+    def test_duplicate_submissions_without_xml_hash(self):
+        """
+        Test duplicates of submissions made before content hashes existed
+        are detected, and that backfilling the hashes covers them
+        """
+        xls_file_path = os.path.join(
+            os.path.dirname(os.path.abspath(__file__)),
+            "../fixtures/test_forms/survey_names/survey_names.xls"
+        )
+        self._publish_xls_file(xls_file_path)
+        xml_submission_file_path = os.path.join(
+            os.path.dirname(os.path.abspath(__file__)),
+            "../fixtures/test_forms/survey_names/instances/"
+            "survey_names_2012-08-17_11-24-53.xml"
+        )
+
+        self._make_submission(xml_submission_file_path)
+        self.assertEqual(self.response.status_code, 201)
+        instance = Instance.objects.order_by('-pk')[0]
+        xml_hash = instance.xml_hash
+        Instance.objects.filter(pk=instance.pk).update(
+            xml_hash=Instance.DEFAULT_XML_HASH)
+        self._make_submission(xml_submission_file_path)
+        self.assertEqual(self.response.status_code, 202)
+
+        self.assertEqual(Instance.populate_xml_hashes_for_instances(
+            chunk_size=1, workers=2), 1)
+        self.assertEqual(Instance.objects.get(pk=instance.pk).xml_hash,
+                         xml_hash)
+        self._make_submission(xml_submission_file_path)
+        self.assertEqual(self.response.status_code, 202)
+
     def test_unicode_submission(self):
         """Test xml submissions that contain unicode characters
         """
@@ -1,12 +1,17 @@
+import json
 import os
 import glob
 
+from django.core.files import File
+from django.core.files.storage import get_storage_class
 from django.core.urlresolvers import reverse
 from django.conf import settings
+from mock import patch
 
 from onadata.apps.main.tests.test_base import TestBase
-from onadata.apps.logger.models import Instance
+from onadata.apps.logger.models import BulkImport, Instance, XForm
 from onadata.apps.logger.import_tools import import_instances_from_zip
+from onadata.apps.logger.tasks import import_instances_from_zip_async
 from onadata.apps.logger.views import bulksubmission
 
 CUR_PATH = os.path.abspath(__file__)
@@ -69,6 +74,25 @@ class TestImportingDatabase(TestBase):
         # by 1 (or 2) based on the b1 & b2 data sets
         self.assertEqual(instance_count, initial_instance_count + 2)
 
+    def test_importing_with_several_workers(self):
+        initial_instance_count = Instance.objects.count()
+        initial_image_count = images_count()
+        xform = XForm.objects.get(user=self.user)
+        initial_submission_count = xform.num_of_submissions
+
+        total, success, errors = import_instances_from_zip(
+            os.path.join(DB_FIXTURES_PATH, "bulk_submission.zip"),
+            self.user, workers=2, batch_size=1)
+
+        self.assertEqual(success, 2)
+        self.assertEqual(Instance.objects.count(),
+                         initial_instance_count + 2)
+        self.assertEqual(images_count(), initial_image_count + 2)
+        # the counters are updated once per batch
+        xform.refresh_from_db()
+        self.assertEqual(xform.num_of_submissions,
+                         initial_submission_count + 2)
+
     def test_badzipfile_import(self):
         total, success, errors = import_instances_from_zip(
             os.path.join(
@@ -99,3 +123,49 @@ class TestImportingDatabase(TestBase):
             post_data = {'zip_submission_file': zip_file}
             response = self.client.post(url, post_data)
         self.assertEqual(response.status_code, 200)
+
+    def test_bulk_import_post_async(self):
+        zip_file_path = os.path.join(DB_FIXTURES_PATH, "bulk_submission.zip")
+        url = reverse(bulksubmission, kwargs={
+            "username": self.user.username
+        })
+        with open(zip_file_path, "rb") as zip_file:
+            post_data = {'zip_submission_file': zip_file, 'async': 'true'}
+            response = self.client.post(url, post_data)
+        self.assertEqual(response.status_code, 202)
+
+        # the task runs eagerly in the tests
+        bulk_import = BulkImport.objects.get(user=self.user)
+        self.assertEqual(bulk_import.status, BulkImport.SUCCESSFUL)
+        self.assertEqual(bulk_import.imported, 2)
+
+        progress_url = response['Location']
+        response = self.client.get(progress_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['imported'], 2)
+        response = self.anon.get(progress_url)
+        self.assertEqual(response.status_code, 302)
+
+    def test_failed_bulk_import_keeps_its_progress(self):
+        storage = get_storage_class()()
+        with open(os.path.join(
+                DB_FIXTURES_PATH, "bulk_submission.zip"), "rb") as f:
+            zip_file = storage.save('bulk_submission.zip', File(f))
+        bulk_import = BulkImport.objects.create(
+            user=self.user, zip_file=zip_file)
+
+        def _fail_after_a_batch(source, user, workers, progress_callback):
+            progress_callback(1, 2, [{'path': 'a.xml', 'instance': 1}])
+            raise IOError('Truncated zip file')
+
+        with patch('onadata.apps.logger.tasks.import_instances_from_source',
+                   side_effect=_fail_after_a_batch):
+            import_instances_from_zip_async(bulk_import.pk)
+        bulk_import = BulkImport.objects.get(pk=bulk_import.pk)
+        self.assertEqual(bulk_import.status, BulkImport.FAILED)
+        self.assertEqual(
+            (bulk_import.total, bulk_import.processed, bulk_import.imported),
+            (2, 1, 1))
+        self.assertEqual(bulk_import.results, [
+            {'path': 'a.xml', 'instance': 1},
+            {'path': None, 'instance': None, 'error': u'Truncated zip file'}])
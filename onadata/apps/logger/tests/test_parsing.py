@@ -1,6 +1,7 @@
 # vim: ai ts=4 sts=4 et sw=4 fileencoding=utf-8
 import os
 import re
+from tempfile import NamedTemporaryFile
 from xml.dom import minidom
 
 from onadata.apps.main.tests.test_base import TestBase
@@ -8,7 +9,8 @@ from onadata.apps.logger.xform_instance_parser import XFormInstanceParser,\
     xpath_from_xml_node
 from onadata.apps.logger.xform_instance_parser import get_uuid_from_xml,\
     get_meta_from_xml, get_deprecated_uuid_from_xml,\
-    _xml_node_to_dict, clean_and_parse_xml
+    _xml_node_to_dict, clean_and_parse_xml, _iterparse_xml_to_dict,\
+    _parse_with_minidom
 from onadata.libs.utils.common_tags import XFORM_ID_STRING
 
 
@@ -186,3 +188,71 @@ class TestXFormInstanceParser(TestBase):
             with open(json_file) as jfile:
                 import json
                 self.assertEqual(jfile.read(), json.dumps(dict_))
+
+    def _assert_backends_match(self, xml_str, repeats):
+        minidom_result = _parse_with_minidom(xml_str, repeats)
+        lxml_result = _iterparse_xml_to_dict(xml_str, repeats)
+        self.assertEqual(minidom_result[0], lxml_result[0])
+        self.assertEqual(minidom_result[1], lxml_result[1])
+        self.assertEqual(sorted(minidom_result[2]), sorted(lxml_result[2]))
+
+    def test_backends_match_on_fixtures(self):
+        fixtures_dir = os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), "..", "fixtures")
+        for xml_file in [
+                "new_repeats/instances/new_repeats_2012-07-05-14-33-53.xml",
+                "new_repeats/instances/multiple_nodes_error.xml",
+                "repeated_group/repeated_group.xml",
+                "tutorial/instances/tutorial_2012-06-27_11-27-53_w_uuid.xml"]:
+            with open(os.path.join(fixtures_dir, xml_file)) as f:
+                xml_str = f.read()
+            self._assert_backends_match(xml_str, [])
+            self._assert_backends_match(
+                xml_str, [u"kids/kids_details", u"question_group"])
+
+    def test_backends_match_on_namespaces_and_nested_repeats(self):
+        xml_str = (
+            u'<?xml version="1.0" ?><data id="nested" version="2" '
+            u'xmlns:orx="http://openrosa.org/xforms" '
+            u'xmlns:jr="http://openrosa.org/javarosa">'
+            u'<hh><name>A</name><member jr:template=""><age>3</age>'
+            u'<pet><kind>dog</kind></pet><pet><kind>cat</kind></pet>'
+            u'</member><member><age>40</age><empty/></member></hh>'
+            u'<note>   </note><!-- comment --><text>caf\xe9</text>'
+            u'<orx:meta><orx:instanceID>uuid:1</orx:instanceID></orx:meta>'
+            u'</data>')
+        self._assert_backends_match(
+            xml_str, [u"hh/member", u"hh/member/pet"])
+
+    def test_backends_match_on_xml_lang(self):
+        self._assert_backends_match(
+            u'<?xml version="1.0" ?><data id="lang">'
+            u'<text xml:lang="fr">Bonjour</text></data>', [])
+
+    def test_lxml_backend_does_not_expand_external_entities(self):
+        with NamedTemporaryFile(suffix='.txt') as secret:
+            secret.write('top secret')
+            secret.flush()
+            xml_str = (
+                u'<?xml version="1.0" ?>'
+                u'<!DOCTYPE data [<!ENTITY xxe SYSTEM "file://%s">]>'
+                u'<data id="xxe"><text>&xxe;</text></data>' % secret.name)
+            result = _iterparse_xml_to_dict(xml_str, [])
+        self.assertNotIn('top secret', repr(result))
+
+    def test_parser_backends_produce_same_dicts(self):
+        self._publish_and_submit_new_repeats()
+        data_dictionary = self.xform.data_dictionary()
+        minidom_parser = XFormInstanceParser(
+            self.xml, data_dictionary, backend='minidom')
+        lxml_parser = XFormInstanceParser(
+            self.xml, data_dictionary, backend='lxml')
+        self.assertEqual(minidom_parser.to_dict(), lxml_parser.to_dict())
+        self.assertEqual(minidom_parser.to_flat_dict(),
+                         lxml_parser.to_flat_dict())
+        self.assertEqual(minidom_parser.get_attributes(),
+                         lxml_parser.get_attributes())
+        self.assertEqual(minidom_parser.get_root_node_name(),
+                         lxml_parser.get_root_node_name())
+        self.assertEqual(minidom_parser.get_root_node().toxml(),
+                         lxml_parser.get_root_node().toxml())
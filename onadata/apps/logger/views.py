@@ -4,6 +4,7 @@ import json
 import os
 import tempfile
 import re
+import uuid
 
 import pytz
 from django.contrib.auth.decorators import login_required, user_passes_test
@@ -38,6 +39,7 @@ from wsgiref.util import FileWrapper
 from onadata.apps.main.models import UserProfile, MetaData
 from onadata.apps.logger.import_tools import import_instances_from_zip
 from onadata.apps.logger.models.attachment import Attachment
+from onadata.apps.logger.models.bulk_import import BulkImport
 from onadata.apps.logger.models.instance import Instance
 from onadata.apps.logger.models.xform import XForm
 from onadata.apps.logger.models.ziggy_instance import ZiggyInstance
@@ -63,7 +65,7 @@ from onadata.libs.utils.user_auth import (helper_auth_helper,
                                           )
 from onadata.libs.utils.viewer_tools import _get_form_url
 from ...koboform.pyxform_utils import convert_csv_to_xls
-from .tasks import generate_stats_zip
+from .tasks import generate_stats_zip, import_instances_from_zip_async
 
 IO_ERROR_STRINGS = [
     'request data read error',
@@ -137,22 +139,34 @@ def bulksubmission(request, username):
                                         u"submission files (?)]"))
 
     postfile = temp_postfile[0]
-    tempdir = tempfile.gettempdir()
-    our_tfpath = os.path.join(tempdir, postfile.name)
 
-    with open(our_tfpath, 'wb') as f:
-        f.write(postfile.read())
+    if request.POST.get('async'):
+        return _bulksubmission_async(request, posting_user, postfile)
+
+    # `ZipFile` reads the members straight from the file on disk
+    if hasattr(postfile, 'temporary_file_path'):
+        our_tfpath = postfile.temporary_file_path()
+        remove_tfpath = False
+    else:
+        with tempfile.NamedTemporaryFile(
+                suffix='.zip', delete=False) as f:
+            for chunk in postfile.chunks():
+                f.write(chunk)
+        our_tfpath = f.name
+        remove_tfpath = True
 
-    with open(our_tfpath, 'rb') as f:
-        total_count, success_count, errors = import_instances_from_zip(
-            f, posting_user)
-    # chose the try approach as suggested by the link below
-    # http://stackoverflow.com/questions/82831
     try:
-        os.remove(our_tfpath)
-    except IOError:
-        # TODO: log this Exception somewhere
-        pass
+        total_count, success_count, errors = import_instances_from_zip(
+            our_tfpath, posting_user)
+    finally:
+        if remove_tfpath:
+            # chose the try approach as suggested by the link below
+            # http://stackoverflow.com/questions/82831
+            try:
+                os.remove(our_tfpath)
+            except (IOError, OSError):
+                # TODO: log this Exception somewhere
+                pass
     json_msg = {
         'message': _(u"Submission complete. Out of %(total)d "
                      u"survey instances, %(success)d were imported, "
@@ -173,6 +187,48 @@ def bulksubmission(request, username):
     return response
 
 
+def _bulksubmission_async(request, posting_user, postfile):
+    """
+    Save the zip file and import it with a background task, whose progress
+    is reported by `bulksubmission_progress()`.
+    """
+    default_storage = get_storage_class()()
+    zip_file = default_storage.save(
+        os.path.join(posting_user.username, 'bulk_imports',
+                     '%s.zip' % uuid.uuid4().hex), postfile)
+    bulk_import = BulkImport.objects.create(
+        user=posting_user, zip_file=zip_file)
+    audit = {
+        "bulk_submission_log": {'bulk_import': bulk_import.pk}
+    }
+    audit_log(Actions.USER_BULK_SUBMISSION, request.user, posting_user,
+              _("Made bulk submissions."), audit, request)
+    import_instances_from_zip_async.delay(bulk_import.pk)
+
+    progress_url = request.build_absolute_uri(reverse(
+        'bulk-submission-progress',
+        kwargs={'username': posting_user.username, 'pk': bulk_import.pk}))
+    response = HttpResponse(json.dumps({
+        'id': bulk_import.pk,
+        'status': bulk_import.status,
+        'url': progress_url,
+    }), content_type='application/json')
+    response.status_code = 202
+    response['Location'] = progress_url
+    return response
+
+
+@login_required
+@require_GET
+def bulksubmission_progress(request, username, pk):
+    bulk_import = get_object_or_404(
+        BulkImport, pk=pk, user__username__iexact=username)
+    if bulk_import.user != request.user:
+        return HttpResponseForbidden(_(u'Not shared.'))
+    return HttpResponse(json.dumps(bulk_import.to_dict()),
+                        content_type='application/json')
+
+
 @login_required
 def bulksubmission_form(request, username=None):
     username = username if username is None else username.lower()
@@ -46,11 +46,15 @@ class XFormInstanceFS(object):
         if not filepath.endswith(".xml"):
             return False
         with open(filepath, 'r') as ff:
-            fxml = ff.read().strip()
-            if fxml.startswith('<?xml'):
-                return True
-            if 'http://opendatakit.org/submissions' in fxml:
-                return True
+            return cls.is_valid_instance_xml(ff.read())
+
+    @staticmethod
+    def is_valid_instance_xml(xml):
+        fxml = xml.strip()
+        if fxml.startswith('<?xml'):
+            return True
+        if 'http://opendatakit.org/submissions' in fxml:
+            return True
         return False
 
     def __str__(self):
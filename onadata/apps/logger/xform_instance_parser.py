@@ -1,7 +1,10 @@
 import re
 import logging
 import dateutil.parser
+from io import BytesIO
+from lxml import etree
 from xml.dom import minidom, Node
+from django.conf import settings
 from django.utils.encoding import smart_unicode, smart_str
 from django.utils.translation import ugettext as _
 
@@ -126,10 +129,13 @@ def get_deprecated_uuid_from_xml(xml):
     return None
 
 
-def clean_and_parse_xml(xml_string):
+def clean_xml(xml_string):
     clean_xml_str = xml_string.strip()
-    clean_xml_str = re.sub(ur">\s+<", u"><", smart_unicode(clean_xml_str))
-    xml_obj = minidom.parseString(smart_str(clean_xml_str))
+    return re.sub(ur">\s+<", u"><", smart_unicode(clean_xml_str))
+
+
+def clean_and_parse_xml(xml_string):
+    xml_obj = minidom.parseString(smart_str(clean_xml(xml_string)))
     return xml_obj
 
 
@@ -278,10 +284,129 @@ def _get_all_attributes(node):
             yield pair
 
 
+XML_NAMESPACE = u"http://www.w3.org/XML/1998/namespace"
+
+
+def _qualified_name(name, prefixes):
+    """
+    Turn lxml's `{namespace}localname` back into the `prefix:localname`
+    form minidom reports.
+    """
+    if not name.startswith(u"{"):
+        return unicode(name)
+    namespace, local_name = name[1:].split(u"}", 1)
+    prefix = prefixes.get(namespace)
+    return u"%s:%s" % (prefix, local_name) if prefix else local_name
+
+
+def _iterparse_xml_to_dict(xml_string, repeats=[]):
+    """
+    Build the same dict as `_xml_node_to_dict` in a single forward pass over
+    the document with lxml's `iterparse`.
+
+    The xpath of every node is carried down the stack instead of being
+    rebuilt from its parents, and elements are dropped as soon as they have
+    been converted so memory stays proportional to the document depth.
+
+    Returns a `(root_node_name, dict, attributes)` tuple where `attributes`
+    is the list of `(name, value)` pairs in document order, namespace
+    declarations included, like `_get_all_attributes`.
+    """
+    repeats = set(repeats)
+    source = BytesIO(smart_str(clean_xml(xml_string)))
+    attributes = []
+    namespaces = []
+    # one `[name, xpath, value, prefixes]` frame per open element
+    stack = []
+    root_node_name = None
+    root_dict = None
+
+    # submissions are untrusted: never load DTDs nor expand external
+    # entities, which could read local files or reach the network
+    for event, item in etree.iterparse(
+            source, events=("start-ns", "start", "end"), load_dtd=False,
+            resolve_entities=False, no_network=True):
+        if event == "start-ns":
+            namespaces.append(item)
+        elif event == "start":
+            # the `xml` prefix is bound without being declared
+            prefixes = stack[-1][3] if stack else {XML_NAMESPACE: u"xml"}
+            if namespaces:
+                prefixes = dict(prefixes)
+                for prefix, uri in namespaces:
+                    attributes.append(
+                        (u"xmlns:%s" % prefix if prefix else u"xmlns",
+                         unicode(uri)))
+                    if prefix:
+                        prefixes[uri] = prefix
+                namespaces = []
+            for key, value in item.attrib.items():
+                attributes.append(
+                    (_qualified_name(key, prefixes), unicode(value)))
+
+            local_name = unicode(etree.QName(item).localname)
+            # lxml hands back `str` for ASCII content, minidom always
+            # returns `unicode`
+            name = u"%s:%s" % (item.prefix, local_name) if item.prefix \
+                else local_name
+            if not stack:
+                root_node_name = name
+                xpath = None
+            elif stack[-1][1] is None:
+                xpath = name
+            else:
+                xpath = u"%s/%s" % (stack[-1][1], name)
+            stack.append([name, xpath, {}, prefixes])
+        else:
+            name, xpath, value, prefixes = stack.pop()
+            if len(item) == 0:
+                # a leaf node, only has data if it holds some text
+                d = None if item.text is None else {name: unicode(item.text)}
+            else:
+                d = {name: value} if value else None
+
+            if not stack:
+                root_dict = d
+            elif d is not None:
+                parent_value = stack[-1][2]
+                if xpath in repeats:
+                    parent_value.setdefault(name, []).append(d[name])
+                elif name not in parent_value:
+                    parent_value[name] = d[name]
+                else:
+                    # Same duplicate node handling as `_xml_node_to_dict`
+                    if not isinstance(parent_value[name], list):
+                        parent_value[name] = [parent_value[name]]
+                    parent_value[name].append(d[name])
+
+            # free the nodes we are done with
+            item.clear()
+            while item.getprevious() is not None:
+                del item.getparent()[0]
+
+    return root_node_name, root_dict, attributes
+
+
+def _parse_with_minidom(xml_str, repeats):
+    root_node = clean_and_parse_xml(xml_str).documentElement
+    return root_node.nodeName, _xml_node_to_dict(root_node, repeats),\
+        list(_get_all_attributes(root_node))
+
+
+PARSER_BACKENDS = {
+    'minidom': _parse_with_minidom,
+    'lxml': _iterparse_xml_to_dict,
+}
+
+
 class XFormInstanceParser(object):
 
-    def __init__(self, xml_str, data_dictionary):
+    def __init__(self, xml_str, data_dictionary, backend=None):
         self.dd = data_dictionary
+        self.backend = backend or getattr(
+            settings, 'XFORM_INSTANCE_PARSER_BACKEND', 'lxml')
+        self._xml_str = xml_str
+        self._root_node = None
         # The two following variables need to be initialized in the constructor, in case parsing fails.
         self._flat_dict = {}
         self._attributes = {}
@@ -293,22 +418,27 @@ class XFormInstanceParser(object):
                 "Failed to parse instance '%s'" % xml_str, exc_info=True)
 
     def parse(self, xml_str):
-        self._xml_obj = clean_and_parse_xml(xml_str)
-        self._root_node = self._xml_obj.documentElement
         repeats = [e.get_abbreviated_xpath()
                    for e in self.dd.get_survey_elements_of_type(u"repeat")]
-        self._dict = _xml_node_to_dict(self._root_node, repeats)
+        parse_xml = PARSER_BACKENDS[self.backend]
+        self._root_node_name, self._dict, all_attributes = parse_xml(
+            xml_str, repeats)
         if self._dict is None:
             raise InstanceEmptyError
         for path, value in _flatten_dict_nest_repeats(self._dict, []):
             self._flat_dict[u"/".join(path[1:])] = value
-        self._set_attributes()
+        self._set_attributes(all_attributes)
 
     def get_root_node(self):
+        # The DOM is only needed to re-serialize the submission, so it is
+        # built on demand rather than during `parse`
+        if self._root_node is None:
+            self._root_node = clean_and_parse_xml(
+                self._xml_str).documentElement
         return self._root_node
 
     def get_root_node_name(self):
-        return self._root_node.nodeName
+        return self._root_node_name
 
     def get(self, abbreviated_xpath):
         return self.to_flat_dict()[abbreviated_xpath]
@@ -322,8 +452,7 @@ class XFormInstanceParser(object):
     def get_attributes(self):
         return self._attributes
 
-    def _set_attributes(self):
-        all_attributes = list(_get_all_attributes(self._root_node))
+    def _set_attributes(self, all_attributes):
         for key, value in all_attributes:
             # commented since enketo forms may have the template attribute in
             # multiple xml tags and I dont see the harm in overiding
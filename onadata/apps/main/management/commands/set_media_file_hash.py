@@ -1,6 +1,9 @@
+from optparse import make_option
+
 from django.core.management.base import BaseCommand
 from django.utils.translation import ugettext_lazy
 
+from onadata.apps.logger.models import Attachment
 from onadata.apps.main.models import MetaData
 from onadata.libs.utils.model_tools import queryset_iterator
 
@@ -8,9 +11,36 @@ from onadata.libs.utils.model_tools import queryset_iterator
 class Command(BaseCommand):
     help = ugettext_lazy("Set media file_hash for all existing media files")
 
-    option_list = BaseCommand.option_list
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--attachments',
+            action='store_true',
+            dest='attachments',
+            default=False,
+            help=ugettext_lazy("Set the hash of the submission attachments "
+                               "instead of the form media files")),
+        make_option(
+            '--workers',
+            type='int',
+            dest='workers',
+            default=1,
+            help=ugettext_lazy("Number of attachments read in parallel")),
+        make_option(
+            '--chunk-size',
+            type='int',
+            dest='chunk_size',
+            default=100,
+            help=ugettext_lazy("Number of attachments updated at once")),
+    )
 
     def handle(self, *args, **kwargs):
+        if kwargs.get('attachments'):
+            updated = Attachment.populate_media_file_hashes(
+                chunk_size=kwargs.get('chunk_size', 100),
+                workers=kwargs.get('workers', 1))
+            self.stdout.write("Set the hash of %d attachments" % updated)
+            return
+
         for media in queryset_iterator(MetaData.objects.exclude(data_file='')):
             if media.data_file:
                 media.file_hash = media._set_hash()
@@ -153,6 +153,9 @@ urlpatterns = patterns(
     url(r"^(?P<username>\w+)/forms/(?P<id_string>[^/]+)/data\.sav.zip",
         'onadata.apps.viewer.views.data_export', name='sav_zip_export',
         kwargs={'export_type': 'sav_zip'}),
+    url(r"^(?P<username>\w+)/forms/(?P<id_string>[^/]+)/data\.parquet.zip",
+        'onadata.apps.viewer.views.data_export', name='parquet_zip_export',
+        kwargs={'export_type': 'parquet'}),
     url(r"^(?P<username>\w+)/forms/(?P<id_string>[^/]+)/data\.kml$",
         'onadata.apps.viewer.views.kml_export'),
     url(r"^(?P<username>\w+)/forms/(?P<id_string>[^/]+)/gdocs$",
@@ -222,6 +225,9 @@ urlpatterns = patterns(
         name='submissions'),
     url(r"^(?P<username>\w+)/bulk-submission$",
         'onadata.apps.logger.views.bulksubmission'),
+    url(r"^(?P<username>\w+)/bulk-submission/(?P<pk>\d+)$",
+        'onadata.apps.logger.views.bulksubmission_progress',
+        name='bulk-submission-progress'),
     url(r"^(?P<username>\w+)/bulk-submission-form$",
         'onadata.apps.logger.views.bulksubmission_form'),
     url(r"^(?P<username>\w+)/forms/(?P<pk>[\d+^/]+)/form\.xml$",
@@ -2,6 +2,7 @@ import os
 import time
 
 from django.core.urlresolvers import reverse
+from mock import patch
 from nose import SkipTest
 from pybamboo.connection import Connection
 from pybamboo.dataset import Dataset
@@ -9,6 +10,9 @@ from pybamboo.dataset import Dataset
 from onadata.apps.main.views import show, link_to_bamboo
 from onadata.apps.main.tests.test_base import TestBase
 from onadata.apps.logger.models.xform import XForm
+from onadata.apps.logger.xform_instance_parser import XFormInstanceParser
+from onadata.apps.viewer.models.parsed_instance import \
+    _get_attachments_from_instance
 from onadata.apps.restservice.views import add_service, delete_service
 from onadata.apps.restservice.RestServiceInterface import RestServiceInterface
 from onadata.apps.restservice.models import RestService
@@ -169,3 +173,23 @@ class RestServiceTest(TestBase):
                      'service_name': self.service_name}
         response = self.client.post(add_service_url, post_data)
         self.assertEqual(response.status_code, 404)
+
+    @patch('onadata.apps.restservice.utils.service_definition_task.delay')
+    def test_submission_is_parsed_once(self, mock_delay):
+        self._create_rest_service()
+        RestService(service_url=self.service_url, xform=self.xform,
+                    name=u'json').save()
+        xml_submission = os.path.join(self.this_directory, u'fixtures',
+                                      u'dhisform_submission1.xml')
+        with patch('onadata.apps.logger.submission_context'
+                   '.XFormInstanceParser',
+                   wraps=XFormInstanceParser) as mock_parser,\
+            patch('onadata.apps.viewer.models.parsed_instance'
+                  '._get_attachments_from_instance',
+                  wraps=_get_attachments_from_instance) as mock_attachments:
+            self._make_submission(xml_submission)
+        self.assertEqual(self.response.status_code, 201)
+        self.assertEqual(mock_parser.call_count, 1)
+        # the Mongo document is built once and shared by both services
+        self.assertEqual(mock_attachments.call_count, 1)
+        self.assertEqual(mock_delay.call_count, 2)
@@ -6,8 +6,12 @@ def call_service(parsed_instance):
     # lookup service
     instance = parsed_instance.instance
     rest_services = RestService.objects.filter(xform=instance.xform)
+    # Build the Mongo document once for all the services
+    mongo_document = None
     # call service send with url and data parameters
     for rest_service in rest_services:
+        if mongo_document is None:
+            mongo_document = parsed_instance.to_dict_for_mongo()
         # Celery can't pickle ParsedInstance object,
         # let's use build a serializable object instead
         # We don't really need `xform_id`, `xform_id_string`, `instance_uuid`
@@ -18,7 +22,7 @@ def call_service(parsed_instance):
             "instance_uuid": instance.uuid,
             "instance_id": instance.id,
             "xml": parsed_instance.instance.xml,
-            "json": parsed_instance.to_dict_for_mongo()
+            "json": mongo_document.copy()
         }
         service_definition_task.delay(rest_service, data)
 
@@ -1,5 +1,6 @@
 import os
 
+from django.contrib.auth.models import User
 from django.test import TestCase
 from mock import patch
 
@@ -47,3 +48,15 @@ class TestUtils(TestBase):
         data = get_form_submissions_per_day(self.xform)
         self.assertTrue(len(data) > 0)
         self.assertEqual(data[0]['count'], 4)
+
+    def test_submissions_per_submitter(self):
+        self._publish_xls_file()
+        self._make_submissions()
+        User.objects.create(username='alice')
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        response = self.client.get('/stats/submissions/')
+        self.assertEqual(response.status_code, 200)
+        submission_count = response.context['stats']['submission_count']
+        self.assertEqual(submission_count['total_submission_count'], 4)
+        self.assertEqual(submission_count[self.user.username], 4)
+        self.assertEqual(submission_count['alice'], 0)
@@ -1,6 +1,7 @@
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
+from django.db.models import Count
 from django.shortcuts import get_object_or_404
 from django.shortcuts import render
 
@@ -28,11 +29,11 @@ def submissions(request):
     stats['submission_count'] = {}
     stats['submission_count']['total_submission_count'] = 0
 
-    users = User.objects.all()
-    for user in users:
-        stats['submission_count'][user.username] = 0
-        stats['submission_count'][user.username] += user.instances.count()
-        stats['submission_count'][
-            'total_submission_count'] += user.instances.count()
+    # the submissions of every submitter, counted in a single query
+    users = User.objects.annotate(count=Count('instances'))\
+        .values_list('username', 'count')
+    for username, count in users:
+        stats['submission_count'][username] = count
+        stats['submission_count']['total_submission_count'] += count
 
     return render(request, "submissions.html", {'stats': stats})
@@ -0,0 +1,68 @@
+'''
+Django management command to recommend indexes of the `instances` collection
+for the shapes of the slow data API queries recorded in `query_shapes`.
+
+The shapes an existing index already serves are skipped.
+
+:Example:
+    python manage.py advise_mongo_indexes --min-count 10 --create
+'''
+
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from onadata.libs.utils.mongo_query_tools import QueryShape,\
+    get_instances_indexes
+
+
+class Command(BaseCommand):
+    help = 'Recommend Mongo indexes for the slow data API query shapes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-count',
+            type=int,
+            default=1,
+            help='Only advise on shapes recorded at least this many times.',
+        )
+        parser.add_argument(
+            '--create',
+            action='store_true',
+            default=False,
+            help='Create the recommended indexes in the background.',
+        )
+
+    def handle(self, *_, **options):
+        if options['min_count'] < 1:
+            raise CommandError('`--min-count` must be positive.')
+
+        indexes = get_instances_indexes(refresh=True)
+        recommended = []
+        shapes = settings.MONGO_DB.query_shapes.find(
+            {'count': {'$gte': options['min_count']}}).sort('total_ms', -1)
+        for record in shapes:
+            shape = QueryShape()
+            shape.filter_fields = record['filter_fields']
+            shape.sort = record['sort']
+            if shape.is_sort_indexed(indexes) and \
+                    shape.is_filter_indexed(indexes):
+                continue
+            index = shape.recommended_index()
+            if index in recommended:
+                continue
+            recommended.append(index)
+            self.stdout.write(u'%s (%d queries, %d ms max): %s' % (
+                shape.key, record['count'], record['max_ms'],
+                json.dumps(index)))
+
+            if options['create']:
+                settings.MONGO_DB.instances.create_index(
+                    [(key, direction) for key, direction in index],
+                    background=True)
+
+        if not recommended:
+            self.stdout.write('No index to recommend.')
+        elif options['create']:
+            get_instances_indexes(refresh=True)
@@ -0,0 +1,139 @@
+'''
+Django management command to measure the per-record cost of renaming the
+fields of Mongo records to the names of their form, on synthetic records
+with a repeat group and questions whose names hold dots.
+
+The per-record decoding `MongoKeyMap` replaced, which looked up the keys in
+the values of the mapping and recursed into the repeats, is measured as the
+baseline.
+
+:Example:
+    python manage.py benchmark_field_name_decoding --records 10000 \\
+        --fields 200 --repeats 10 --output decoding.json
+'''
+
+import copy
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from onadata.apps.api.mongo_helper import MongoHelper, MongoKeyMap
+from onadata.libs.utils.common_tags import ID
+
+
+def build_field_names(fields, dotted):
+    '''
+    The `DataDictionary.get_mongo_field_names_dict()` of a form with
+    `fields` questions, and as many in a repeat group, `dotted` of each
+    holding a dot.
+    '''
+    xpaths = []
+    for prefix in (u'', u'repeat/'):
+        xpaths.extend(
+            u'%sq%s%d' % (prefix, u'.' if i < dotted else u'_', i)
+            for i in range(fields))
+    return dict((MongoHelper.encode(xpath), xpath) for xpath in xpaths)
+
+
+def build_records(count, field_names, repeats):
+    keys = sorted(field_names)
+    top_keys = [key for key in keys if not key.startswith(u'repeat/')]
+    repeat_keys = [key for key in keys if key.startswith(u'repeat/')]
+    for i in range(count):
+        record = dict((key, u'value') for key in top_keys)
+        record[u'repeat'] = [dict((key, u'value') for key in repeat_keys)
+                             for _ in range(repeats)]
+        record[ID] = i + 1
+        yield record
+
+
+def legacy_decode(record, field_names):
+    if isinstance(record, dict):
+        for field in record.keys():
+            if isinstance(record[field], list):
+                record[field] = [legacy_decode(item, field_names)
+                                 for item in record[field]]
+            if field not in field_names.values() and \
+                    field in field_names.keys():
+                record[field_names[field]] = record.pop(field)
+    return record
+
+
+class Command(BaseCommand):
+    help = 'Measure the per-record cost of decoding Mongo field names.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--records',
+            type=int,
+            default=10000,
+            help='Number of records decoded.',
+        )
+        parser.add_argument(
+            '--fields',
+            type=int,
+            default=200,
+            help='Number of questions, at the top level and in the repeat.',
+        )
+        parser.add_argument(
+            '--dotted',
+            type=int,
+            default=50,
+            help='Number of the questions whose name holds a dot.',
+        )
+        parser.add_argument(
+            '--repeats',
+            type=int,
+            default=10,
+            help='Number of repetitions of the repeat group.',
+        )
+        parser.add_argument(
+            '--output',
+            help='Write the results to this JSON file.',
+        )
+
+    def handle(self, *_, **options):
+        if options['records'] < 1 or options['fields'] < 1:
+            raise CommandError('`--records` and `--fields` must be positive.')
+
+        field_names = build_field_names(
+            options['fields'], min(options['dotted'], options['fields']))
+        records = list(build_records(
+            options['records'], field_names, options['repeats']))
+
+        started = time.time()
+        key_map = MongoKeyMap(field_names)
+        build_seconds = time.time() - started
+
+        decoders = {
+            'legacy': lambda record: legacy_decode(record, field_names),
+            'key_map': key_map.decode_record,
+            'to_readable_dict': MongoHelper.to_readable_dict,
+        }
+        results = {
+            'config': dict((key, options[key]) for key in (
+                'records', 'fields', 'dotted', 'repeats')),
+            'key_map_build_seconds': build_seconds,
+        }
+        expected = None
+        for name, decode in sorted(decoders.items()):
+            batch = copy.deepcopy(records)
+            started = time.time()
+            for record in batch:
+                decode(record)
+            elapsed = time.time() - started
+            if name != 'to_readable_dict':
+                if expected is not None and batch != expected:
+                    raise CommandError('The decoded records differ.')
+                expected = batch
+            results[name] = {
+                'elapsed_seconds': elapsed,
+                'microseconds_per_record':
+                elapsed * 1000000 / len(records),
+            }
+
+        self.stdout.write(json.dumps(results, indent=4, sort_keys=True))
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=4, sort_keys=True)
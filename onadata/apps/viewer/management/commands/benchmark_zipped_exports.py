@@ -0,0 +1,142 @@
+'''
+Django management command to measure the wall time and peak memory of the
+zipped CSV and SPSS exports on synthetic records of a form with nested
+repeats.
+
+Peak memory is the maximum resident set size of the process, so run one
+export type per process and compare the JSON outputs of two checkouts.
+
+:Example:
+    python manage.py benchmark_zipped_exports --export-type csv_zip \\
+        --records 16000 --depth 5 --output after.json
+'''
+
+import json
+import os
+import resource
+import time
+import uuid
+from tempfile import NamedTemporaryFile
+
+from django.core.management.base import BaseCommand, CommandError
+
+from onadata.apps.logger.management.commands.benchmark_submissions import\
+    build_benchmark_survey
+from onadata.apps.viewer.models.export import Export
+from onadata.libs.utils.common_tags import ID, UUID, SUBMISSION_TIME
+from onadata.libs.utils.export_tools import ExportBuilder
+
+
+EXPORT_FUNCTIONS = {
+    Export.CSV_ZIP_EXPORT: 'to_zipped_csv',
+    Export.SAV_ZIP_EXPORT: 'to_zipped_sav',
+}
+
+
+def build_benchmark_records(count, repeats, depth, fields):
+    '''
+    Generate `count` Mongo records of the form built by
+    `build_benchmark_survey()`, each with `repeats` instances of the outermost
+    repeat group and 2 of every nested one.
+    '''
+    def _build_group(level, prefix):
+        group = dict((u'%sq_%d' % (prefix, i), u'value %d' % i)
+                     for i in range(fields))
+        if level < depth:
+            xpath = u'%srepeat_%d' % (prefix, level)
+            group[xpath] = [
+                _build_group(level + 1, xpath + u'/')
+                for _ in range(repeats if level == 0 else 2)]
+        return group
+
+    for i in range(count):
+        record = _build_group(0, u'')
+        record.update({
+            ID: i + 1,
+            UUID: unicode(uuid.uuid4()),
+            SUBMISSION_TIME: u'2017-01-01T00:00:00',
+        })
+        yield record
+
+
+def peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class Command(BaseCommand):
+    help = 'Measure the wall time and peak memory of the zipped exports.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--export-type',
+            default=Export.CSV_ZIP_EXPORT,
+            choices=sorted(EXPORT_FUNCTIONS),
+            help='Export to generate.',
+        )
+        parser.add_argument(
+            '--records',
+            type=int,
+            default=16000,
+            help='Number of records exported.',
+        )
+        parser.add_argument(
+            '--repeats',
+            type=int,
+            default=1,
+            help='Number of repetitions of the outermost repeat group.',
+        )
+        parser.add_argument(
+            '--depth',
+            type=int,
+            default=5,
+            help='Number of nested repeat groups.',
+        )
+        parser.add_argument(
+            '--fields',
+            type=int,
+            default=10,
+            help='Number of questions in each group.',
+        )
+        parser.add_argument(
+            '--output',
+            help='Write the results to this JSON file.',
+        )
+
+    def handle(self, *_, **options):
+        if options['depth'] < 1 or options['records'] < 1:
+            raise CommandError('`--depth` and `--records` must be positive.')
+
+        export_builder = ExportBuilder()
+        export_builder.set_survey(build_benchmark_survey(
+            options['depth'], options['fields'], 0))
+        export = getattr(
+            export_builder, EXPORT_FUNCTIONS[options['export_type']])
+        records = build_benchmark_records(
+            options['records'], options['repeats'], options['depth'],
+            options['fields'])
+
+        initial_rss = peak_rss_kb()
+        with NamedTemporaryFile(suffix='.zip') as temp_file:
+            started = time.time()
+            export(temp_file.name, records)
+            elapsed = time.time() - started
+            size = os.path.getsize(temp_file.name)
+
+        # the main row and, for every outermost repetition, 1 + 2 + ... +
+        # 2 ** (depth - 1) repeat rows
+        rows_per_record = 1 + options['repeats'] * (
+            2 ** options['depth'] - 1)
+        results = {
+            'config': dict((key, options[key]) for key in (
+                'export_type', 'records', 'repeats', 'depth', 'fields')),
+            'rows': options['records'] * rows_per_record,
+            'sections': len(export_builder.sections),
+            'elapsed_seconds': elapsed,
+            'initial_rss_kb': initial_rss,
+            'peak_rss_kb': peak_rss_kb(),
+            'output_bytes': size,
+        }
+        self.stdout.write(json.dumps(results, indent=4, sort_keys=True))
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=4, sort_keys=True)
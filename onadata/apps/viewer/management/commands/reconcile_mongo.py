@@ -0,0 +1,59 @@
+'''
+Django management command to sync to Mongo the instances modified since the
+last reconciliation, or whose previous write to Mongo failed.
+
+:Example:
+    python manage.py reconcile_mongo --username bob --batch-size 500
+'''
+
+from django.core.management.base import BaseCommand, CommandError
+
+from onadata.apps.logger.models import XForm
+from onadata.libs.utils.mongo_sync import DEFAULT_BATCH_SIZE,\
+    mongo_sync_report, reconcile_mongo
+
+
+class Command(BaseCommand):
+    help = 'Incrementally reconcile Mongo with Postgres.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--username',
+            help='Only reconcile the forms of this user.',
+        )
+        parser.add_argument(
+            '--id-string',
+            help='Only reconcile the forms with this `id_string`.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help='Number of instances written to Mongo at once.',
+        )
+        parser.add_argument(
+            '--report',
+            action='store_true',
+            default=False,
+            help='Only report the instances not synced with Mongo.',
+        )
+
+    def handle(self, *_, **options):
+        if options['report']:
+            self.stdout.write(mongo_sync_report())
+            return
+
+        xforms = None
+        if options['username'] or options['id_string']:
+            xforms = XForm.objects.all()
+            if options['username']:
+                xforms = xforms.filter(user__username=options['username'])
+            if options['id_string']:
+                xforms = xforms.filter(id_string=options['id_string'])
+            if not xforms.exists():
+                raise CommandError('No matching form found.')
+
+        written, failed_pks = reconcile_mongo(
+            options['batch_size'], xforms, self.stdout)
+        self.stdout.write('{} documents written, {} failed.'.format(
+            written, len(failed_pks)))
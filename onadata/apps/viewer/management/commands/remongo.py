@@ -5,6 +5,8 @@ from optparse import make_option
 
 from onadata.apps.viewer.models.parsed_instance import ParsedInstance
 from onadata.libs.utils.common_tags import USERFORM_ID
+from onadata.libs.utils.mongo_sync import FileCheckpoint,\
+    bulk_update_mongo_for_xform
 
 
 class Command(BaseCommand):
@@ -18,7 +20,23 @@ class Command(BaseCommand):
         make_option('-u', '--username',
                     help=ugettext_lazy("Username of the form user")),
         make_option('-i', '--id_string',
-                    help=ugettext_lazy("id string of the form")))
+                    help=ugettext_lazy("id string of the form")),
+        make_option(
+            '--bulk',
+            action='store_true',
+            default=False,
+            help=ugettext_lazy("Write the records with batched upserts, "
+                               "one form at a time")),
+        make_option(
+            '--workers',
+            type='int',
+            default=1,
+            help=ugettext_lazy("Number of processes building the records "
+                               "in bulk mode")),
+        make_option(
+            '--checkpoint',
+            help=ugettext_lazy("File recording the progress of a bulk run, "
+                               "which is resumed from it when it exists")))
 
     def handle(self, *args, **kwargs):
         ids = None
@@ -31,7 +49,13 @@ class Command(BaseCommand):
             from onadata.apps.logger.models import XForm, Instance
             xform = XForm.objects.get(user__username=kwargs.get('username'),
                                       id_string=kwargs.get('id_string'))
+            if kwargs.get('bulk'):
+                return self._bulk_remongo([xform], **kwargs)
             ids = [i.pk for i in Instance.objects.filter(xform=xform)]
+        elif kwargs.get('bulk'):
+            from onadata.apps.logger.models import XForm
+            return self._bulk_remongo(
+                XForm.objects.order_by('pk').iterator(), **kwargs)
         # num records per run
         batchsize = kwargs['batchsize']
         start = 0
@@ -60,3 +84,19 @@ class Command(BaseCommand):
         # add indexes after writing so the writing operation above is not
         # slowed
         settings.MONGO_DB.instances.create_index(USERFORM_ID)
+
+    def _bulk_remongo(self, xforms, **kwargs):
+        checkpoint = None
+        if kwargs.get('checkpoint'):
+            checkpoint = FileCheckpoint(kwargs['checkpoint'])
+        total = 0
+        for xform in xforms:
+            total += bulk_update_mongo_for_xform(
+                xform,
+                batch_size=kwargs.get('batchsize', 100),
+                workers=kwargs.get('workers', 1),
+                start_after=checkpoint.get(xform) if checkpoint else 0,
+                checkpoint=checkpoint,
+                stdout=self.stdout)
+        self.stdout.write('Updated %d records' % total)
+        settings.MONGO_DB.instances.create_index(USERFORM_ID)
@@ -25,7 +25,16 @@ class Command(BaseCommand):
                 "Update all instances for the selected "
                 "form(s), including existing ones. "
                 "Will delete and re-create mongo records. "
-                "Only makes sense when used with the -r option")))
+                "Only makes sense when used with the -r option")),
+        make_option(
+            '-b', '--bulk', action='store_true', dest='bulk',
+            default=False, help=ugettext_lazy(
+                "Update the records with batched upserts instead of one "
+                "at a time. Only makes sense when used with the -r option")),
+        make_option(
+            '-w', '--workers', type='int', dest='workers', default=1,
+            help=ugettext_lazy(
+                "Number of processes building the records in bulk mode")))
 
     def handle(self, *args, **kwargs):
         user = xform = None
@@ -46,5 +55,7 @@ class Command(BaseCommand):
         remongo = kwargs["remongo"]
         update_all = kwargs["update_all"]
 
-        report_string = mongo_sync_status(remongo, update_all, user, xform)
+        report_string = mongo_sync_status(
+            remongo, update_all, user, xform, bulk=kwargs["bulk"],
+            workers=kwargs["workers"])
         self.stdout.write(report_string)
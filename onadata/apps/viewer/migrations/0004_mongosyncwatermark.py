@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logger', '0012_add-index-on-instance-date-modified'),
+        ('viewer', '0003_auto_20171123_1521'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MongoSyncWatermark',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('synced_until', models.DateTimeField(null=True)),
+                ('date_modified', models.DateTimeField(auto_now=True)),
+                ('xform', models.OneToOneField(related_name='mongo_sync_watermark', to='logger.XForm')),
+            ],
+        ),
+    ]
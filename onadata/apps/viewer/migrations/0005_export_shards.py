@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('viewer', '0004_mongosyncwatermark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='export',
+            name='shards_done',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='export',
+            name='shards_total',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
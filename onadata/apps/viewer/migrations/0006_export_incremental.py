@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import jsonfield.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('viewer', '0005_export_shards'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='export',
+            name='instance_count',
+            field=models.PositiveIntegerField(default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='export',
+            name='last_instance_id',
+            field=models.PositiveIntegerField(default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='export',
+            name='options',
+            field=jsonfield.fields.JSONField(default={}, blank=True),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('viewer', '0008_parquet_zip_export'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cachedexport',
+            name='export_type',
+            field=models.CharField(max_length=10, choices=[(b'xls', b'Excel'), (b'csv', b'CSV'), (b'gdoc', b'GDOC'), (b'zip', b'ZIP'), (b'kml', b'kml'), (b'kmz', b'kmz'), (b'csv_zip', b'CSV ZIP'), (b'sav_zip', b'SAV ZIP'), (b'sav', b'SAV'), (b'parquet', b'Parquet ZIP'), (b'external', b'Excel'), (b'analyser', b'Analyser')]),
+        ),
+        migrations.AlterField(
+            model_name='export',
+            name='export_type',
+            field=models.CharField(default=b'xls', max_length=10, choices=[(b'xls', b'Excel'), (b'csv', b'CSV'), (b'gdoc', b'GDOC'), (b'zip', b'ZIP'), (b'kml', b'kml'), (b'kmz', b'kmz'), (b'csv_zip', b'CSV ZIP'), (b'sav_zip', b'SAV ZIP'), (b'sav', b'SAV'), (b'parquet', b'Parquet ZIP'), (b'external', b'Excel'), (b'analyser', b'Analyser')]),
+        ),
+    ]
@@ -2,3 +2,5 @@ from onadata.apps.viewer.models.parsed_instance import ParsedInstance  # flake8:
 from onadata.apps.viewer.models.data_dictionary import DataDictionary
 from onadata.apps.viewer.models.instance_modification import InstanceModification
 from onadata.apps.viewer.models.export import Export
+from onadata.apps.viewer.models.mongo_sync_watermark import MongoSyncWatermark
+from onadata.apps.viewer.models.cached_export import CachedExport
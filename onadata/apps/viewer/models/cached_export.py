@@ -0,0 +1,58 @@
+from django.core.files.storage import get_storage_class
+from django.db import models
+from django.db.models.signals import post_delete
+from django.utils import timezone
+
+from onadata.apps.logger.models import XForm
+from onadata.apps.viewer.models.export import Export
+
+
+def cached_export_delete_callback(sender, **kwargs):
+    cached_export = kwargs['instance']
+    storage = get_storage_class()()
+    if storage.exists(cached_export.filepath):
+        storage.delete(cached_export.filepath)
+
+
+class CachedExport(models.Model):
+    """
+    Export file of a filter query, served to the identical exports which
+    follow until its key changes or it is evicted.
+
+    The key hashes everything the content of the export depends on, see
+    `export_cache_key()`, so entries are never updated, only evicted, least
+    recently used first.
+    """
+    xform = models.ForeignKey(XForm)
+    key = models.CharField(max_length=64, unique=True)
+    export_type = models.CharField(
+        max_length=10, choices=Export.EXPORT_TYPES)
+    filepath = models.CharField(max_length=255)
+    size = models.BigIntegerField(default=0)
+    created_on = models.DateTimeField(auto_now_add=True)
+    last_used = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        app_label = "viewer"
+
+    def __unicode__(self):
+        return u'%s: %s' % (self.xform_id, self.key)
+
+    @classmethod
+    def evict(cls, max_size, max_entries, keep=None):
+        """
+        Delete the least recently used entries beyond `max_entries` or
+        `max_size` bytes in total, except `keep`, e.g. the entry just added
+        whose file is about to be served
+        """
+        total_size = 0
+        entries = cls.objects.order_by('-last_used').only('filepath', 'size')
+        if keep is not None:
+            entries = entries.exclude(pk=keep.pk)
+            total_size, max_entries = keep.size, max_entries - 1
+        for i, entry in enumerate(entries.iterator()):
+            total_size += entry.size
+            if i >= max_entries or total_size > max_size:
+                entry.delete()
+
+post_delete.connect(cached_export_delete_callback, sender=CachedExport)
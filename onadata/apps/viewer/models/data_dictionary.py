@@ -1,9 +1,12 @@
 import os
 import re
 import json
+from hashlib import md5
 
+from django.conf import settings
 from django.db import models
 from django.db.models.signals import post_save
+from django.utils.encoding import smart_str
 from guardian.shortcuts import assign_perm, get_perms_for_model
 from pyxform import SurveyElementBuilder
 from pyxform.builder import create_survey_from_xls
@@ -14,13 +17,19 @@ from xml.dom import Node
 
 from onadata.apps.logger.models.xform import XForm, title_pattern, xml_title
 from onadata.apps.logger.xform_instance_parser import clean_and_parse_xml
-from onadata.apps.api.mongo_helper import MongoHelper
+from onadata.apps.api.mongo_helper import MongoHelper, MongoKeyMap
 from onadata.libs.utils.common_tags import UUID, SUBMISSION_TIME, TAGS, NOTES
 from onadata.libs.utils.export_tools import question_types_to_exclude,\
     DictOrganizer
+from onadata.libs.utils.cache_tools import LRUCache
 from onadata.libs.utils.model_tools import queryset_iterator, set_uuid
 
 
+# Compiled surveys shared by every `DataDictionary` of the process, keyed by
+# `(xform pk, content hash)`
+compiled_surveys = LRUCache(getattr(settings, 'SURVEY_CACHE_SIZE', 200))
+
+
 class ColumnRename(models.Model):
     xpath = models.CharField(max_length=255, unique=True)
     column_name = models.CharField(max_length=32)
@@ -43,6 +52,36 @@ def upload_to(instance, filename, username=None):
     )
 
 
+class CompiledSurvey(object):
+    """
+    A pyxform survey along with the indexes `DataDictionary` derives from
+    its elements, computed once when the survey is built.
+    """
+
+    def __init__(self, survey):
+        self.survey = survey
+        self.elements = list(survey.iter_descendants())
+        self.elements_by_xpath = {}
+        self.elements_by_type = {}
+        self.mongo_field_names = {}
+        self.geopoint_xpaths = []
+        self.select_multiples = {}
+
+        for e in self.elements:
+            xpath = e.get_abbreviated_xpath()
+            self.elements_by_xpath[xpath] = e
+            self.elements_by_type.setdefault(e.type, []).append(e)
+            self.mongo_field_names[MongoHelper.encode(unicode(xpath))] = xpath
+            bind_type = e.bind.get(u'type')
+            if bind_type == u'geopoint':
+                self.geopoint_xpaths.append(xpath)
+            elif bind_type == u'select':
+                self.select_multiples[xpath] = [
+                    c.get_abbreviated_xpath() for c in e.children]
+
+        self.mongo_key_map = MongoKeyMap(self.mongo_field_names)
+
+
 class DataDictionary(XForm):
 
     GEODATA_SUFFIXES = [
@@ -167,21 +206,34 @@ class DataDictionary(XForm):
     def file_name(self):
         return os.path.split(self.xls.name)[-1]
 
+    def _build_survey(self):
+        try:
+            builder = SurveyElementBuilder()
+            return builder.create_survey_element_from_json(self.json)
+        except ValueError:
+            xml = bytes(bytearray(self.xml, encoding='utf-8'))
+            return create_survey_element_from_xml(xml)
+
+    def _get_compiled_survey(self):
+        if not hasattr(self, "_compiled_survey"):
+            content_hash = md5(
+                smart_str(self.json) + smart_str(self.xml)).hexdigest()
+            key = (self.pk, content_hash)
+            compiled_survey = compiled_surveys.get(key)
+            if compiled_survey is None:
+                compiled_survey = CompiledSurvey(self._build_survey())
+                if self.pk is not None:
+                    compiled_surveys.set(key, compiled_survey)
+            self._compiled_survey = compiled_survey
+        return self._compiled_survey
+
     def get_survey(self):
-        if not hasattr(self, "_survey"):
-            try:
-                builder = SurveyElementBuilder()
-                self._survey = \
-                    builder.create_survey_element_from_json(self.json)
-            except ValueError:
-                xml = bytes(bytearray(self.xml, encoding='utf-8'))
-                self._survey = create_survey_element_from_xml(xml)
-        return self._survey
+        return self._get_compiled_survey().survey
 
     survey = property(get_survey)
 
     def get_survey_elements(self):
-        return self.survey.iter_descendants()
+        return iter(self._get_compiled_survey().elements)
 
     def get_survey_element(self, name_or_xpath):
         element = self.get_element(name_or_xpath)
@@ -210,22 +262,26 @@ class DataDictionary(XForm):
         Return a dictionary of fieldnames as saved in mongodb with
         corresponding xform field names e.g {"Q1Lg==1": "Q1.1"}
         """
-        names = {}
-        for elem in self.get_survey_elements():
-            names[MongoHelper.encode(unicode(elem.get_abbreviated_xpath()))] = \
-                elem.get_abbreviated_xpath()
-        return names
+        return dict(self._get_compiled_survey().mongo_field_names)
+
+    def get_mongo_key_map(self):
+        """
+        Return the `MongoKeyMap` of the fields, shared by every
+        `DataDictionary` of the form in the process: don't modify it
+        """
+        return self._get_compiled_survey().mongo_key_map
 
     survey_elements = property(get_survey_elements)
 
     def geopoint_xpaths(self):
-        geo_xpaths = []
-
-        for e in self.get_survey_elements():
-            if e.bind.get(u'type') == u'geopoint':
-                geo_xpaths.append(e.get_abbreviated_xpath())
+        return list(self._get_compiled_survey().geopoint_xpaths)
 
-        return geo_xpaths
+    def get_select_multiples(self):
+        """
+        Return a dictionary of select multiple xpaths with the xpaths of
+        their choices e.g. {"browsers": ["browsers/firefox", ...]}
+        """
+        return dict(self._get_compiled_survey().select_multiples)
 
     def xpath_of_first_geopoint(self):
         geo_xpaths = self.geopoint_xpaths()
@@ -314,16 +370,11 @@ class DataDictionary(XForm):
         return [remove_first_index(header) for header in self.get_headers()]
 
     def get_element(self, abbreviated_xpath):
-        if not hasattr(self, "_survey_elements"):
-            self._survey_elements = {}
-            for e in self.get_survey_elements():
-                self._survey_elements[e.get_abbreviated_xpath()] = e
-
         def remove_all_indices(xpath):
             return re.sub(r"\[\d+\]", u"", xpath)
 
         clean_xpath = remove_all_indices(abbreviated_xpath)
-        return self._survey_elements.get(clean_xpath)
+        return self._get_compiled_survey().elements_by_xpath.get(clean_xpath)
 
     def get_label(self, abbreviated_xpath):
         e = self.get_element(abbreviated_xpath)
@@ -420,8 +471,8 @@ class DataDictionary(XForm):
             self.has_start_time = False
 
     def get_survey_elements_of_type(self, element_type):
-        return [e for e in self.get_survey_elements()
-                if e.type == element_type]
+        return list(
+            self._get_compiled_survey().elements_by_type.get(element_type, []))
 
 
 def set_object_permissions(sender, instance=None, created=False, **kwargs):
@@ -430,3 +481,13 @@ def set_object_permissions(sender, instance=None, created=False, **kwargs):
             assign_perm(perm.codename, instance.user, instance)
 post_save.connect(set_object_permissions, sender=DataDictionary,
                   dispatch_uid='xform_object_permissions')
+
+
+def invalidate_compiled_survey(sender, instance=None, **kwargs):
+    compiled_surveys.invalidate(instance.pk)
+    if hasattr(instance, '_compiled_survey'):
+        del instance._compiled_survey
+post_save.connect(invalidate_compiled_survey, sender=XForm,
+                  dispatch_uid='xform_invalidate_compiled_survey')
+post_save.connect(invalidate_compiled_survey, sender=DataDictionary,
+                  dispatch_uid='data_dictionary_invalidate_compiled_survey')
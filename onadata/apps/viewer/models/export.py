@@ -5,6 +5,7 @@ from django.core.files.storage import get_storage_class
 from django.db import models
 from django.db.models.signals import post_delete
 from django.utils.translation import ugettext as _
+from jsonfield import JSONField
 
 from onadata.apps.logger.models import XForm
 
@@ -12,8 +13,9 @@ from onadata.apps.logger.models import XForm
 def export_delete_callback(sender, **kwargs):
     export = kwargs['instance']
     storage = get_storage_class()()
-    if export.filepath and storage.exists(export.filepath):
-        storage.delete(export.filepath)
+    for filepath in export.volume_filepaths:
+        if storage.exists(filepath):
+            storage.delete(filepath)
 
 
 class Export(models.Model):
@@ -27,11 +29,13 @@ class Export(models.Model):
     XLS_EXPORT = 'xls'
     CSV_EXPORT = 'csv'
     KML_EXPORT = 'kml'
+    KMZ_EXPORT = 'kmz'
     ZIP_EXPORT = 'zip'
     GDOC_EXPORT = 'gdoc'
     CSV_ZIP_EXPORT = 'csv_zip'
     SAV_ZIP_EXPORT = 'sav_zip'
     SAV_EXPORT = 'sav'
+    PARQUET_ZIP_EXPORT = 'parquet'
     EXTERNAL_EXPORT = 'external'
     ANALYSER_EXPORT= 'analyser'
 
@@ -42,8 +46,10 @@ class Export(models.Model):
         'zip': 'zip',
         'csv_zip': 'zip',
         'sav_zip': 'zip',
+        'parquet': 'zip',
         'sav': 'sav',
-        'kml': 'vnd.google-earth.kml+xml'
+        'kml': 'vnd.google-earth.kml+xml',
+        'kmz': 'vnd.google-earth.kmz'
     }
 
     EXPORT_TYPES = [
@@ -52,9 +58,11 @@ class Export(models.Model):
         (GDOC_EXPORT, 'GDOC'),
         (ZIP_EXPORT, 'ZIP'),
         (KML_EXPORT, 'kml'),
+        (KMZ_EXPORT, 'kmz'),
         (CSV_ZIP_EXPORT, 'CSV ZIP'),
         (SAV_ZIP_EXPORT, 'SAV ZIP'),
         (SAV_EXPORT, 'SAV'),
+        (PARQUET_ZIP_EXPORT, 'Parquet ZIP'),
         (EXTERNAL_EXPORT, 'Excel'),
         (ANALYSER_EXPORT, 'Analyser')
     ]
@@ -84,6 +92,17 @@ class Export(models.Model):
     # status
     internal_status = models.SmallIntegerField(default=PENDING)
     export_url = models.URLField(null=True, default=None)
+    # progress of exports generated in shards by several workers, or number
+    # of files added to an attachments ZIP export
+    shards_total = models.PositiveIntegerField(default=0)
+    shards_done = models.PositiveIntegerField(default=0)
+    # largest submission id and number of submissions in the export, and
+    # the options it was generated with, for the next export to only append
+    # the submissions made since; the `volumes` option lists the files
+    # following `filename` of an export split into several volumes
+    last_instance_id = models.PositiveIntegerField(null=True, default=None)
+    instance_count = models.PositiveIntegerField(null=True, default=None)
+    options = JSONField(default={}, blank=True)
 
     class Meta:
         app_label = "viewer"
@@ -150,6 +169,18 @@ class Export(models.Model):
             return os.path.join(self.filedir, self.filename)
         return None
 
+    @property
+    def volume_filepaths(self):
+        """
+        The paths of all the files of the export, the first one being
+        `filepath`
+        """
+        if not self.filepath:
+            return []
+        return [self.filepath] + [
+            os.path.join(self.filedir, filename)
+            for filename in (self.options or {}).get('volumes', [])]
+
     @property
     def full_filepath(self):
         if self.filepath:
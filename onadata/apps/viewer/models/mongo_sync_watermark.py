@@ -0,0 +1,23 @@
+from django.db import models
+
+from onadata.apps.logger.models import XForm
+
+
+class MongoSyncWatermark(models.Model):
+    """
+    High-water mark of the incremental Postgres to Mongo reconciliation of a
+    form: every instance of `xform` modified before `synced_until` has been
+    checked by `reconcile_mongo()`.
+
+    Kept out of `XForm` because `XForm.save()` writes every column and would
+    overwrite a newer mark with the one it loaded.
+    """
+    xform = models.OneToOneField(XForm, related_name='mongo_sync_watermark')
+    synced_until = models.DateTimeField(null=True)
+    date_modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        app_label = "viewer"
+
+    def __unicode__(self):
+        return u'%s: %s' % (self.xform_id, self.synced_until)
@@ -1,11 +1,14 @@
 import datetime
 import json
 import logging
+import math
+import random
 
 from bson import json_util, ObjectId
 from celery import task
 from dateutil import parser
 from django.conf import settings
+from django.core.cache import cache
 from django.db import models
 from django.db.models.signals import post_save, pre_delete
 from django.utils.translation import ugettext as _
@@ -18,12 +21,23 @@ from onadata.libs.utils.common_tags import ID, UUID, ATTACHMENTS, GEOLOCATION,\
     NOTES, SUBMITTED_BY, VALIDATION_STATUS
 from onadata.libs.utils.decorators import apply_form_field_names
 from onadata.libs.utils.model_tools import queryset_iterator
+from onadata.libs.utils.mongo_query_tools import QueryShape,\
+    limit_query_time
 from onadata.apps.api.mongo_helper import MongoHelper
 
 
 # this is Mongo Collection where we will store the parsed submissions
 xform_instances = settings.MONGO_DB.instances
 DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
+# Cache key set while a write-behind flush is running
+MONGO_FLUSH_LOCK_KEY = 'mongo-write-behind-flush-lock'
+# Cache key set while a write-behind flush is scheduled, so that a burst of
+# submissions schedules a single one; it expires in case the task is lost
+MONGO_FLUSH_PENDING_KEY = 'mongo-write-behind-flush-pending'
+MONGO_FLUSH_PENDING_TIMEOUT = 60
+# Number of times the flush of an instance is retried while it isn't synced,
+# e.g. because the transaction which saved it hadn't committed yet
+MONGO_FLUSH_MAX_ATTEMPTS = 5
 
 
 class ParseError(Exception):
@@ -56,6 +70,48 @@ def update_mongo_instance(record):
     return False
 
 
+def _is_synced_with_mongo(instance_id):
+    return Instance.objects.filter(
+        pk=instance_id, is_synced_with_mongo=True).exists()
+
+
+@task
+def flush_mongo_write_behind(instance_id, attempt=1):
+    """
+    Flush the write-behind queue for the instances queued since the flush
+    was scheduled, by `instance_id` for the first of them, and try again
+    later while that instance is still not synced, or while the flush still
+    finds instances to write: it only sees those whose transaction committed.
+    """
+    from onadata.libs.utils.mongo_sync import flush_write_behind_queue
+    # the instances queued from now on schedule the next flush
+    cache.delete(MONGO_FLUSH_PENDING_KEY)
+    written = 0
+    if cache.add(MONGO_FLUSH_LOCK_KEY, True, 60):
+        try:
+            written, _ = flush_write_behind_queue(
+                getattr(settings, 'MONGO_WRITE_BEHIND_BATCH_SIZE', 500))
+        finally:
+            cache.delete(MONGO_FLUSH_LOCK_KEY)
+    if attempt < MONGO_FLUSH_MAX_ATTEMPTS and (
+            written or not _is_synced_with_mongo(instance_id)):
+        schedule_mongo_flush(instance_id, attempt + 1)
+
+
+def schedule_mongo_flush(instance_id, attempt=1):
+    """
+    Schedule a write-behind flush, after a delay doubling with every
+    attempt, unless one is already scheduled: the documents queued in the
+    meantime are written together.
+    """
+    if not cache.add(MONGO_FLUSH_PENDING_KEY, True,
+                     MONGO_FLUSH_PENDING_TIMEOUT):
+        return
+    delay = getattr(settings, 'MONGO_WRITE_BEHIND_DELAY', 500) / 1000.0
+    flush_mongo_write_behind.apply_async(
+        (instance_id, attempt), countdown=delay * 2 ** (attempt - 1))
+
+
 class ParsedInstance(models.Model):
     USERFORM_ID = u'_userform_id'
     STATUS = u'_status'
@@ -126,7 +182,7 @@ class ParsedInstance(models.Model):
     @apply_form_field_names
     def query_mongo_minimal(
             cls, query, fields, sort, start=0, limit=DEFAULT_LIMIT,
-            count=False, hide_deleted=True):
+            count=False, hide_deleted=True, stream=False):
 
         cursor = cls._get_mongo_cursor(query, fields, hide_deleted)
 
@@ -143,7 +199,153 @@ class ParsedInstance(models.Model):
         if limit > cls.DEFAULT_LIMIT:
             limit = cls.DEFAULT_LIMIT
 
-        return cls._get_paginated_and_sorted_cursor(cursor, start, limit, sort)
+        cursor = cls._get_paginated_and_sorted_cursor(
+            cursor, start, limit, sort)
+        limit_query_time(
+            cursor, cls.get_query_shape(query, sort), stream=stream)
+        return cursor
+
+    @classmethod
+    def query_mongo_keyset(cls, query, fields, sort, after=None,
+                           limit=DEFAULT_LIMIT, hide_deleted=True):
+        """
+        Page through the records in the order of the key of `sort`, if any,
+        then of `_id`, from after the last record of the previous page
+        instead of skipping the previous pages, which is linear in the depth
+        of the page
+
+        The values of the sort key should all have the same type: Mongo only
+        compares values of the same type.
+
+        :param after: None for the first page, or the keyset returned with
+            the previous page
+        :return: The records of the page, and the keyset of its last record,
+            or None for the last page
+        """
+        if isinstance(sort, basestring):
+            sort = json.loads(sort, object_hook=json_util.object_hook)
+        sort = MongoHelper.to_safe_dict(sort, reading=True) if sort else {}
+        if type(sort) != dict or len(sort) > 1:
+            raise ValueError(_("Invalid sort param: a single key is "
+                               "expected"))
+        # an empty page has no last record to continue from
+        if limit < 1:
+            raise ValueError(_("Invalid limit param"))
+        limit = min(limit, cls.DEFAULT_LIMIT)
+
+        sort_key, sort_dir = sort.items()[0] if sort else (ID, 1)
+        sort_dir = int(sort_dir)  # -1 for desc, 1 for asc
+        order = [(sort_key, sort_dir)]
+        # top-level field selected only for the keyset
+        extra_field = None
+        if sort_key != ID:
+            order.append((ID, sort_dir))
+            if isinstance(fields, basestring):
+                fields = json.loads(
+                    fields, object_hook=json_util.object_hook)
+            field = sort_key.split('.')[0]
+            if fields and field not in [
+                    MongoHelper.encode(f) for f in fields]:
+                extra_field = field
+                fields = list(fields) + [extra_field]
+
+        cursor = cls._get_mongo_cursor(
+            query, fields, hide_deleted,
+            keyset_query=cls._get_keyset_query(sort_key, sort_dir, after))
+        limit_query_time(cursor, cls.get_query_shape(query, sort))
+        records = list(cursor.sort(order).limit(limit + 1))
+
+        keyset = None
+        if len(records) > limit:
+            records = records[:limit]
+            last = records[-1]
+            keyset = [last[ID]] if sort_key == ID else [
+                last[ID], cls._get_sort_value(last, sort_key)]
+        if extra_field is not None:
+            for record in records:
+                record.pop(extra_field, None)
+        return records, keyset
+
+    @classmethod
+    def count_mongo(cls, query, hide_deleted=True, ids=None):
+        """
+        The number of records matching `query`, only among those whose `_id`
+        is in `ids` if given
+        """
+        keyset_query = None if ids is None else {ID: {'$in': ids}}
+        cursor = cls._get_mongo_cursor(
+            query, None, hide_deleted, keyset_query=keyset_query)
+        limit_query_time(cursor, cls.get_query_shape(query, None))
+        return cursor.count()
+
+    @classmethod
+    def sample_mongo_ids(cls, query, size, id_range, windows=10,
+                         hide_deleted=True):
+        """
+        The `_id`s of up to `size` records matching `query`, read in
+        `windows` runs of consecutive records from random `_id`s within
+        `id_range`, so that the sample spreads over all the records rather
+        than being the oldest ones
+        """
+        min_id, max_id = id_range
+        per_window = int(math.ceil(size / float(windows)))
+        ids = set()
+        for start in sorted(random.randint(min_id, max_id)
+                            for _ in range(windows)):
+            cursor = cls._get_mongo_cursor(
+                query, [ID], hide_deleted, keyset_query={ID: {'$gte': start}})
+            limit_query_time(cursor, cls.get_query_shape(query, {ID: 1}))
+            ids.update(record[ID]
+                       for record in cursor.sort(ID, 1).limit(per_window))
+        return sorted(ids)
+
+    @classmethod
+    def get_query_shape(cls, query, sort):
+        """
+        The `QueryShape` of the `query` and `sort` arguments of
+        `query_mongo_minimal()` or `query_mongo_keyset()`
+        """
+        if isinstance(query, basestring):
+            query = json.loads(query, object_hook=json_util.object_hook)
+        query = MongoHelper.to_safe_dict(query or {}, reading=True)
+        if isinstance(sort, basestring):
+            sort = json.loads(sort, object_hook=json_util.object_hook)
+        # other sorts are ignored
+        sort = MongoHelper.to_safe_dict(sort, reading=True) \
+            if type(sort) == dict and len(sort) == 1 else {}
+        return QueryShape(query, sort)
+
+    @classmethod
+    def _get_sort_value(cls, record, sort_key):
+        value = record
+        for key in sort_key.split('.'):
+            value = value.get(key) if isinstance(value, dict) else None
+        return value
+
+    @classmethod
+    def _get_keyset_query(cls, sort_key, sort_dir, after):
+        """
+        The query matching the records after the keyset `after` in the
+        order of `sort_key` then `_id`
+        """
+        if after is None:
+            return None
+        after_operator = '$gt' if sort_dir > 0 else '$lt'
+        if sort_key == ID:
+            return {ID: {after_operator: after[0]}}
+
+        last_id, last_value = after
+        tie_query = {sort_key: last_value, ID: {after_operator: last_id}}
+        # null and missing values sort before any other one, and the
+        # comparison operators never match them
+        if last_value is None:
+            if sort_dir < 0:
+                return tie_query
+            return {'$or': [{sort_key: {'$ne': None}}, tie_query]}
+        after_query = [{sort_key: {after_operator: last_value}}, tie_query]
+        if sort_dir < 0:
+            after_query.append({sort_key: None})
+        return {'$or': after_query}
 
     @classmethod
     @apply_form_field_names
@@ -157,7 +359,8 @@ class ParsedInstance(models.Model):
             return cursor
 
     @classmethod
-    def _get_mongo_cursor(cls, query, fields, hide_deleted, username=None, id_string=None):
+    def _get_mongo_cursor(cls, query, fields, hide_deleted, username=None,
+                          id_string=None, keyset_query=None):
         """
         Returns a Mongo cursor based on the query.
 
@@ -166,6 +369,8 @@ class ParsedInstance(models.Model):
         :param hide_deleted: boolean
         :param username: string
         :param id_string: string
+        :param keyset_query: dict, trusted query on encoded keys joined to
+            `query`
         :return: pymongo Cursor
         """
         fields_to_select = {cls.USERFORM_ID: 0}
@@ -187,6 +392,9 @@ class ParsedInstance(models.Model):
             # join existing query with deleted_at_query on an $and
             query = {"$and": [query, {"_deleted_at": None}]}
 
+        if keyset_query is not None:
+            query = {"$and": [query, keyset_query]}
+
         # fields must be a string array i.e. '["name", "age"]'
         if isinstance(fields, basestring):
             fields = json.loads(fields, object_hook=json_util.object_hook)
@@ -223,8 +431,30 @@ class ParsedInstance(models.Model):
         cursor.batch_size = cls.DEFAULT_BATCHSIZE
         return cursor
 
+    @property
+    def submission_context(self):
+        return getattr(self.instance, 'submission_context', None)
+
     def to_dict_for_mongo(self):
+        context = self.submission_context
+        if context is not None and context.mongo_document is not None:
+            return context.mongo_document
+
         d = self.to_dict()
+        d.update(self.get_mongo_metadata())
+        d = MongoHelper.to_safe_dict(d)
+
+        if context is not None:
+            context.mongo_document = d
+
+        return d
+
+    def get_mongo_metadata(self):
+        """
+        Return the fields the Mongo document holds on top of the submitted
+        data. Attachments, tags and notes are read through `.all()` so that
+        they can be prefetched when documents are built in bulk.
+        """
         data = {
             UUID: self.instance.uuid,
             ID: self.instance.id,
@@ -237,7 +467,7 @@ class ParsedInstance(models.Model):
             GEOLOCATION: [self.lat, self.lng],
             SUBMISSION_TIME: self.instance.date_created.strftime(
                 MONGO_STRFTIME),
-            TAGS: list(self.instance.tags.names()),
+            TAGS: [tag.name for tag in self.instance.tags.all()],
             NOTES: self.get_notes(),
             VALIDATION_STATUS: self.instance.get_validation_status(),
             SUBMITTED_BY: self.instance.user.username
@@ -247,18 +477,25 @@ class ParsedInstance(models.Model):
         if isinstance(self.instance.deleted_at, datetime.datetime):
             data[DELETEDAT] = self.instance.deleted_at.strftime(MONGO_STRFTIME)
 
-        d.update(data)
-
-        return MongoHelper.to_safe_dict(d)
+        return data
 
-    def update_mongo(self, async=True):
+    def update_mongo(self, async=True, write_behind=False):
         d = self.to_dict_for_mongo()
         if d.get("_xform_id_string") is None:
             # if _xform_id_string, Instance could not be parsed.
             # so, we don't update mongo.
             return False
         else:
-            if async:
+            if write_behind:
+                # Queue the document: an instance not synced with Mongo is
+                # written by the next write-behind flush, which only flags it
+                # as synced once Mongo acknowledged the write
+                if self.instance.is_synced_with_mongo:
+                    Instance.objects.filter(pk=self.instance.id).update(
+                        is_synced_with_mongo=False)
+                    self.instance.is_synced_with_mongo = False
+                schedule_mongo_flush(self.instance.id)
+            elif async:
                 # TODO update self.instance after async save is made
                 update_mongo_instance.apply_async((), {"record": d})
             else:
@@ -320,7 +557,7 @@ class ParsedInstance(models.Model):
             self.lat = self.instance.point.y
             self.lng = self.instance.point.x
 
-    def save(self, async=False, *args, **kwargs):
+    def save(self, async=False, write_behind=False, *args, **kwargs):
         # start/end_time obsolete: originally used to approximate for
         # instanceID, before instanceIDs were implemented
         created = self.pk is None
@@ -332,7 +569,7 @@ class ParsedInstance(models.Model):
         # insert into Mongo.
         # Signal has been removed because of a race condition.
         # Rest Services were called before data was saved in DB.
-        success = self.update_mongo(async)
+        success = self.update_mongo(async, write_behind)
         if success and created:
             call_service(self)
         return success
@@ -347,14 +584,13 @@ class ParsedInstance(models.Model):
 
     def get_notes(self):
         notes = []
-        note_qs = self.instance.notes.values(
-            'id', 'note', 'date_created', 'date_modified')
-        for note in note_qs:
-            note['date_created'] = \
-                note['date_created'].strftime(MONGO_STRFTIME)
-            note['date_modified'] = \
-                note['date_modified'].strftime(MONGO_STRFTIME)
-            notes.append(note)
+        for note in self.instance.notes.all():
+            notes.append({
+                'id': note.id,
+                'note': note.note,
+                'date_created': note.date_created.strftime(MONGO_STRFTIME),
+                'date_modified': note.date_modified.strftime(MONGO_STRFTIME),
+            })
         return notes
 
 
@@ -365,7 +601,7 @@ def _get_attachments_from_instance(instance):
         attachment['download_url'] = a.media_file.url
         attachment['mimetype'] = a.mimetype
         attachment['filename'] = a.media_file.name
-        attachment['instance'] = a.instance.pk
+        attachment['instance'] = a.instance_id
         attachment['xform'] = instance.xform.id
         attachment['id'] = a.id
         attachments.append(attachment)
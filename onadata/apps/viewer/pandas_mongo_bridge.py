@@ -1,7 +1,11 @@
 from collections import OrderedDict
 from itertools import chain
+import csv
+import json
+import shutil
 import time
 
+from bson import json_util
 from django.conf import settings
 from pandas.core.frame import DataFrame
 
@@ -17,11 +21,13 @@ from pyxform.question import Question
 
 from onadata.apps.viewer.models.data_dictionary import DataDictionary
 from onadata.apps.viewer.models.parsed_instance import ParsedInstance
-from onadata.libs.exceptions import NoRecordsFoundError
+from onadata.libs.exceptions import IncrementalExportError,\
+    NoRecordsFoundError
 from onadata.libs.utils.common_tags import ID, XFORM_ID_STRING, STATUS,\
     ATTACHMENTS, GEOLOCATION, UUID, SUBMISSION_TIME, NA_REP,\
     BAMBOO_DATASET_ID, DELETEDAT, TAGS, NOTES, SUBMITTED_BY
-from onadata.libs.utils.export_tools import question_types_to_exclude
+from onadata.libs.utils.export_tools import dump_shard_line,\
+    load_shard_line, question_types_to_exclude
 
 
 # this is Mongo Collection where we will store the parsed submissions
@@ -107,10 +113,7 @@ class AbstractDataFrameBuilder(object):
 
     @classmethod
     def _collect_select_multiples(cls, dd):
-        return dict([(e.get_abbreviated_xpath(), [c.get_abbreviated_xpath()
-                    for c in e.children])
-                    for e in dd.get_survey_elements()
-                    if e.bind.get("type") == "select"])
+        return dd.get_select_multiples()
 
     @classmethod
     def _split_select_multiples(cls, record, select_multiples,
@@ -153,8 +156,7 @@ class AbstractDataFrameBuilder(object):
 
     @classmethod
     def _collect_gps_fields(cls, dd):
-        return [e.get_abbreviated_xpath() for e in dd.get_survey_elements()
-                if e.bind.get("type") == "geopoint"]
+        return dd.geopoint_xpaths()
 
     @classmethod
     def _tag_edit_string(cls, record):
@@ -577,8 +579,7 @@ class CSVDataFrameBuilder(AbstractDataFrameBuilder):
                     # generated when we reindex
                 ordered_columns[child.get_abbreviated_xpath()] = None
 
-    def _format_for_dataframe(self, cursor):
-        # TODO: check for and handle empty results
+    def _add_split_columns(self):
         # add ordered columns for select multiples
         if self.split_select_multiples:
             for key, choices in self.select_multiples.items():
@@ -589,52 +590,183 @@ class CSVDataFrameBuilder(AbstractDataFrameBuilder):
         for key in self.gps_fields:
             gps_xpaths = self.dd.get_additional_geopoint_xpaths(key)
             self.ordered_columns[key] = [key] + gps_xpaths
-        data = []
+
+    def _format_record(self, record):
+        """
+        Flatten a record into a dict keyed by column, adding the columns of
+        its repeats to `ordered_columns`
+        """
+        # split select multiples
+        if self.split_select_multiples:
+            record = self._split_select_multiples(
+                record, self.select_multiples,
+                self.BINARY_SELECT_MULTIPLES)
+        # check for gps and split into components i.e. latitude, longitude,
+        # altitude, precision
+        self._split_gps_fields(record, self.gps_fields)
+        self._tag_edit_string(record)
+        flat_dict = {}
+        # re index repeats
+        for key, value in record.iteritems():
+            reindexed = self._reindex(key, value, self.ordered_columns)
+            flat_dict.update(reindexed)
+
+        # if delimetr is diferent, replace within record as well
+        if self.group_delimiter != DEFAULT_GROUP_DELIMITER:
+            flat_dict = dict((self.group_delimiter.join(k.split('/')), v)
+                             for k, v in flat_dict.iteritems())
+        return flat_dict
+
+    def _format_for_dataframe(self, cursor):
+        # TODO: check for and handle empty results
+        self._add_split_columns()
+        return [self._format_record(record) for record in cursor]
+
+    def _iter_records(self, fields=None,
+                      batch_size=ParsedInstance.DEFAULT_BATCHSIZE,
+                      id_range=None):
+        """
+        Walk the records matching `filter_query`, and optionally whose `_id`
+        is within `id_range`, whose last `_id` may be None, with a single
+        cursor in `_id` order, decoding
+        their field names one record at a time rather than loading them all
+        like `ParsedInstance.query_mongo()`
+        """
+        query = self.filter_query
+        if id_range is not None:
+            query = json.loads(query, object_hook=json_util.object_hook)\
+                if query else {}
+            id_query = {"$gte": id_range[0]}
+            if id_range[1] is not None:
+                id_query["$lte"] = id_range[1]
+            query = {"$and": [query, {ID: id_query}]}
+        cursor = ParsedInstance._get_mongo_cursor(
+            query, fields, True, self.username, self.id_string)
+        cursor.sort(ID, 1).batch_size(batch_size)
+        key_map = self.dd.get_mongo_key_map()
         for record in cursor:
-            # split select multiples
-            if self.split_select_multiples:
-                record = self._split_select_multiples(
-                    record, self.select_multiples,
-                    self.BINARY_SELECT_MULTIPLES)
-            # check for gps and split into components i.e. latitude, longitude,
-            # altitude, precision
-            self._split_gps_fields(record, self.gps_fields)
-            self._tag_edit_string(record)
-            flat_dict = {}
-            # re index repeats
-            for key, value in record.iteritems():
-                reindexed = self._reindex(key, value, self.ordered_columns)
-                flat_dict.update(reindexed)
-
-            # if delimetr is diferent, replace within record as well
-            if self.group_delimiter != DEFAULT_GROUP_DELIMITER:
-                flat_dict = dict((self.group_delimiter.join(k.split('/')), v)
-                                 for k, v in flat_dict.iteritems())
-            data.append(flat_dict)
-        return data
+            yield key_map.decode_record(record)
 
-    def export_to(self, file_or_path, data_frame_max_size=30000):
-        from math import ceil
-        # get record count
-        record_count = self._query_mongo(query=self.filter_query, count=True)
+    def _top_level_repeats(self):
+        repeats = [xpath for xpath, cols in self.ordered_columns.iteritems()
+                   if cols == []]
+        return [xpath for xpath in repeats
+                if not any(xpath.startswith(u'%s/' % r) for r in repeats)]
 
+    @classmethod
+    def _encode_csv_value(cls, value, na_rep):
+        # match the output of `DataFrame.to_csv()`
+        if value is None or (isinstance(value, float) and value != value):
+            return na_rep
+        if isinstance(value, unicode):
+            return value.encode('utf-8')
+        if isinstance(value, float):
+            return repr(value)
+        return str(value)
+
+    def _find_columns(self, batch_size=ParsedInstance.DEFAULT_BATCHSIZE,
+                      id_range=None):
         self.ordered_columns = OrderedDict()
         self._build_ordered_columns(self.dd.survey, self.ordered_columns)
+        repeats = self._top_level_repeats()
+        self._add_split_columns()
+
+        # the columns of the repeats depend on the largest number of
+        # repetitions, find them first by only fetching the repeats
+        if repeats:
+            for record in self._iter_records(repeats, batch_size, id_range):
+                self._format_record(record)
+        return self._get_columns()
+
+    def export_to(self, file_or_path,
+                  batch_size=ParsedInstance.DEFAULT_BATCHSIZE,
+                  watermark=None):
+        """
+        :param watermark: Optional `RecordWatermark` tracking the exported
+            records
+        """
+        columns = self._find_columns(batch_size)
+        records = self._iter_records(batch_size=batch_size)
+        if watermark is not None:
+            records = watermark.track(records)
+        first_record = next(records, None)
+        if first_record is None:
+            raise NoRecordsFoundError("No records found for your query")
 
-        # pandas will only export 30k records in a dataframe to a csv
-        # - we need to create multiple 30k dataframes if required,
-        # we need to go through all the records though so that
-        # we can figure out the columns we need for repeats
-        datas = []
-        num_data_frames = \
-            int(ceil(float(record_count) / float(data_frame_max_size)))
-        for i in range(num_data_frames):
-            cursor = self._query_mongo(
-                self.filter_query, start=(i * data_frame_max_size),
-                limit=data_frame_max_size)
-            data = self._format_for_dataframe(cursor)
-            datas.append(data)
+        self._write_csv(
+            file_or_path, columns,
+            (self._format_record(record)
+             for record in chain([first_record], records)))
+
+    def append_to(self, path, previous_path, id_range, watermark=None,
+                  batch_size=ParsedInstance.DEFAULT_BATCHSIZE):
+        """
+        Write the CSV export at `previous_path` followed by the records
+        whose `_id` is within `id_range`, the records submitted since
+
+        :raises IncrementalExportError: If the records have columns the
+            previous export lacks, e.g. more repetitions of a repeat
+        """
+        with open(previous_path, 'rb') as previous_file:
+            header = next(csv.reader(previous_file), None)
+        na_rep = getattr(settings, 'NA_REP', NA_REP)
+        columns = self._find_columns(batch_size, id_range)
+        if header is None or not set(
+                self._encode_csv_value(col, na_rep) for col in columns)\
+                .issubset(header):
+            raise IncrementalExportError(
+                "The records have columns missing from the previous export")
+
+        records = self._iter_records(batch_size=batch_size, id_range=id_range)
+        if watermark is not None:
+            records = watermark.track(records)
+        with open(path, 'wb') as csv_file:
+            with open(previous_path, 'rb') as previous_file:
+                shutil.copyfileobj(previous_file, csv_file)
+            self._write_csv(
+                csv_file, [col.decode('utf-8') for col in header],
+                (self._format_record(record) for record in records),
+                write_header=False)
+
+    def export_shard_to(self, shard_file, id_range):
+        """
+        Write the formatted records whose `_id` is within `id_range` as JSON
+        lines, one shard of the records of an export merged by
+        `export_shards_to()`
+
+        :returns: The columns of the shard, to pass to `export_shards_to()`
+        """
+        self.ordered_columns = OrderedDict()
+        self._build_ordered_columns(self.dd.survey, self.ordered_columns)
+        self._add_split_columns()
+        for record in self._iter_records(id_range=id_range):
+            shard_file.write(dump_shard_line(self._format_record(record)))
+        return self.ordered_columns.items()
 
+    def export_shards_to(self, file_or_path, shard_files, shard_columns):
+        """
+        Write the records written by `export_shard_to()` in `shard_files`,
+        in order, with the union of the columns of the shards
+        """
+        self.ordered_columns = OrderedDict()
+        for columns in shard_columns:
+            for xpath, cols in columns:
+                if cols is None:
+                    self.ordered_columns.setdefault(xpath, None)
+                else:
+                    merged_cols = self.ordered_columns.setdefault(xpath, [])
+                    merged_cols.extend(
+                        [col for col in cols if col not in merged_cols])
+
+        def _iter_shard_records():
+            for shard_file in shard_files:
+                for line in shard_file:
+                    yield load_shard_line(line)
+
+        self._write_csv(
+            file_or_path, self._get_columns(), _iter_shard_records())
+
+    def _get_columns(self):
         columns = list(chain.from_iterable(
             [[xpath] if cols is None else cols
              for xpath, cols in self.ordered_columns.iteritems()]))
@@ -646,8 +778,11 @@ class CSVDataFrameBuilder(AbstractDataFrameBuilder):
 
         # add extra columns
         columns += [col for col in self.ADDITIONAL_COLUMNS]
+        # remove columns we don't want
+        return [col for col in columns if col not in self.IGNORED_COLUMNS]
 
-        header = True
+    def _write_csv(self, file_or_path, columns, flat_dicts,
+                   write_header=True):
         if hasattr(file_or_path, 'read'):
             csv_file = file_or_path
             close = False
@@ -655,12 +790,19 @@ class CSVDataFrameBuilder(AbstractDataFrameBuilder):
             csv_file = open(file_or_path, "wb")
             close = True
 
-        for data in datas:
-            writer = CSVDataFrameWriter(data, columns)
-            writer.write_to_csv(csv_file, header=header)
-            header = False
-        if close:
-            csv_file.close()
+        na_rep = getattr(settings, 'NA_REP', NA_REP)
+        try:
+            writer = csv.writer(csv_file, lineterminator='\n')
+            if write_header:
+                writer.writerow(
+                    [self._encode_csv_value(col, na_rep) for col in columns])
+            for flat_dict in flat_dicts:
+                writer.writerow(
+                    [self._encode_csv_value(flat_dict.get(col), na_rep)
+                     for col in columns])
+        finally:
+            if close:
+                csv_file.close()
 
 
 class XLSDataFrameWriter(object):
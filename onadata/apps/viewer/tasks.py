@@ -2,18 +2,23 @@ import logging
 import pytz
 import re
 import sys
-from celery import task, shared_task
+from celery import chord, task, shared_task
 from datetime import datetime, timedelta
 from django.conf import settings
 from django.core.mail import mail_admins
+from django.db.models import F
 from requests import ConnectionError
 
 from onadata.apps.viewer.models.export import Export
 from onadata.libs.exceptions import NoRecordsFoundError
 from onadata.libs.utils.export_tools import generate_export,\
     generate_attachments_zip_export, generate_kml_export,\
-    generate_external_export
-from onadata.libs.utils.logger_tools import mongo_sync_status, report_exception
+    generate_external_export, should_shard_export, plan_export_shards,\
+    generate_export_shard, generate_export_from_shards,\
+    delete_export_shards, delete_export_shard_files,\
+    get_incremental_base_export
+from onadata.libs.utils.logger_tools import report_exception
+from onadata.libs.utils.mongo_sync import mongo_sync_report, reconcile_mongo
 
 
 def create_async_export(xform, export_type, query, force_xlsx, options=None):
@@ -34,7 +39,7 @@ def create_async_export(xform, export_type, query, force_xlsx, options=None):
     }
     if export_type in [Export.XLS_EXPORT, Export.GDOC_EXPORT,
                        Export.CSV_EXPORT, Export.CSV_ZIP_EXPORT,
-                       Export.SAV_ZIP_EXPORT]:
+                       Export.SAV_ZIP_EXPORT, Export.PARQUET_ZIP_EXPORT]:
         if options and "group_delimiter" in options:
             arguments["group_delimiter"] = options["group_delimiter"]
         if options and "split_select_multiples" in options:
@@ -44,8 +49,21 @@ def create_async_export(xform, export_type, query, force_xlsx, options=None):
             arguments["binary_select_multiples"] =\
                 options["binary_select_multiples"]
 
+        # appending to the previous export beats regenerating it in shards
+        export_options = dict(
+            (key, arguments[key]) for key in (
+                'group_delimiter', 'split_select_multiples',
+                'binary_select_multiples') if key in arguments)
+        shard = export_type != Export.GDOC_EXPORT and\
+            should_shard_export(xform, export_type) and not (
+                query is None and get_incremental_base_export(
+                    xform, export_type, **export_options))
+
         # start async export
-        if export_type in [Export.XLS_EXPORT, Export.GDOC_EXPORT]:
+        if shard:
+            result = create_sharded_export.apply_async(
+                (), dict(arguments, export_type=export_type), countdown=10)
+        elif export_type in [Export.XLS_EXPORT, Export.GDOC_EXPORT]:
             result = create_xls_export.apply_async((), arguments, countdown=10)
         elif export_type == Export.CSV_EXPORT:
             result = create_csv_export.apply_async(
@@ -56,13 +74,20 @@ def create_async_export(xform, export_type, query, force_xlsx, options=None):
         elif export_type == Export.SAV_ZIP_EXPORT:
             result = create_sav_zip_export.apply_async(
                 (), arguments, countdown=10)
+        elif export_type == Export.PARQUET_ZIP_EXPORT:
+            result = create_parquet_zip_export.apply_async(
+                (), arguments, countdown=10)
         else:
             raise Export.ExportTypeError
     elif export_type == Export.ZIP_EXPORT:
         # start async export
         result = create_zip_export.apply_async(
             (), arguments, countdown=10)
-    elif export_type == Export.KML_EXPORT:
+    elif export_type in [Export.KML_EXPORT, Export.KMZ_EXPORT]:
+        arguments["export_type"] = export_type
+        for key in ("bbox", "start", "end"):
+            if options and key in options:
+                arguments[key] = options[key]
         # start async export
         result = create_kml_export.apply_async(
             (), arguments, countdown=10)
@@ -205,7 +230,9 @@ def create_csv_export(username, id_string, export_id, query=None,
 
 
 @task()
-def create_kml_export(username, id_string, export_id, query=None):
+def create_kml_export(username, id_string, export_id, query=None,
+                      export_type=Export.KML_EXPORT, bbox=None, start=None,
+                      end=None):
     # we re-query the db instead of passing model objects according to
     # http://docs.celeryproject.org/en/latest/userguide/tasks.html#state
 
@@ -214,7 +241,8 @@ def create_kml_export(username, id_string, export_id, query=None):
         # though export is not available when for has 0 submissions, we
         # catch this since it potentially stops celery
         gen_export = generate_kml_export(
-            Export.KML_EXPORT, 'kml', username, id_string, export_id, query)
+            export_type, export_type, username, id_string, export_id, query,
+            bbox=bbox, start=start, end=end)
     except (Exception, NoRecordsFoundError) as e:
         export.internal_status = Export.FAILED
         export.save()
@@ -318,6 +346,143 @@ def create_sav_zip_export(username, id_string, export_id, query=None,
         return gen_export.id
 
 
+@task()
+def create_parquet_zip_export(username, id_string, export_id, query=None,
+                              group_delimiter='/', split_select_multiples=True,
+                              binary_select_multiples=False):
+    export = Export.objects.get(id=export_id)
+    try:
+        # though export is not available when for has 0 submissions, we
+        # catch this since it potentially stops celery
+        gen_export = generate_export(
+            Export.PARQUET_ZIP_EXPORT, 'zip', username, id_string, export_id,
+            query, group_delimiter, split_select_multiples,
+            binary_select_multiples)
+    except (Exception, NoRecordsFoundError) as e:
+        export.internal_status = Export.FAILED
+        export.save()
+        # mail admins
+        details = {
+            'export_id': export_id,
+            'username': username,
+            'id_string': id_string
+        }
+        report_exception("Parquet ZIP Export Exception: Export ID - "
+                         "%(export_id)s, /%(username)s/%(id_string)s"
+                         % details, e, sys.exc_info())
+        raise
+    else:
+        return gen_export.id
+
+
+def _mark_sharded_export_failed(export_type, username, id_string,
+                                export_id, e):
+    Export.objects.filter(id=export_id).update(
+        internal_status=Export.FAILED)
+    if isinstance(e, NoRecordsFoundError):
+        return
+    # mail admins
+    details = {
+        'export_type': export_type.upper(),
+        'export_id': export_id,
+        'username': username,
+        'id_string': id_string
+    }
+    report_exception("%(export_type)s Sharded Export Exception: Export ID - "
+                     "%(export_id)s, /%(username)s/%(id_string)s"
+                     % details, e, sys.exc_info())
+
+
+@task()
+def create_sharded_export(export_type, username, id_string, export_id,
+                          query=None, group_delimiter='/',
+                          split_select_multiples=True,
+                          binary_select_multiples=False):
+    """
+    Generate an export in shards of `EXPORT_SHARD_SIZE` records, one task
+    per shard, and merge them in `merge_export_shards()` once they are all
+    done
+    """
+    options = {
+        'group_delimiter': group_delimiter,
+        'split_select_multiples': split_select_multiples,
+        'binary_select_multiples': binary_select_multiples,
+    }
+    try:
+        id_ranges = plan_export_shards(username, id_string, query)
+        if not id_ranges:
+            raise NoRecordsFoundError("No records found for your query")
+        Export.objects.filter(id=export_id).update(
+            shards_total=len(id_ranges), shards_done=0)
+    except (Exception, NoRecordsFoundError) as e:
+        _mark_sharded_export_failed(
+            export_type, username, id_string, export_id, e)
+        raise
+
+    header = [
+        create_export_shard.si(
+            export_type, username, id_string, export_id, shard_index,
+            id_range, query, **options)
+        for shard_index, id_range in enumerate(id_ranges)]
+    body = merge_export_shards.s(
+        export_type, username, id_string, export_id, query, **options)
+    # the body of a chord doesn't run when one of its tasks fails
+    body.link_error(cleanup_export_shards.s(
+        export_type, username, id_string, export_id))
+    return chord(header)(body).id
+
+
+@task()
+def create_export_shard(export_type, username, id_string, export_id,
+                        shard_index, id_range, query=None,
+                        group_delimiter='/', split_select_multiples=True,
+                        binary_select_multiples=False):
+    try:
+        shard = generate_export_shard(
+            export_type, username, id_string, export_id, shard_index,
+            id_range, query, group_delimiter, split_select_multiples,
+            binary_select_multiples)
+    except Exception as e:
+        _mark_sharded_export_failed(
+            export_type, username, id_string, export_id, e)
+        raise
+    else:
+        Export.objects.filter(id=export_id).update(
+            shards_done=F('shards_done') + 1)
+        return shard
+
+
+@task()
+def merge_export_shards(shards, export_type, username, id_string, export_id,
+                        query=None, group_delimiter='/',
+                        split_select_multiples=True,
+                        binary_select_multiples=False):
+    try:
+        gen_export = generate_export_from_shards(
+            export_type, username, id_string, export_id, shards, query,
+            group_delimiter, split_select_multiples, binary_select_multiples)
+    except Exception as e:
+        _mark_sharded_export_failed(
+            export_type, username, id_string, export_id, e)
+        raise
+    else:
+        return gen_export.id
+    finally:
+        delete_export_shards(shards)
+
+
+@task()
+def cleanup_export_shards(task_id, export_type, username, id_string,
+                          export_id):
+    """
+    Errback of `merge_export_shards()`: delete the shards left by the tasks
+    of a failed sharded export, and mark it failed
+    """
+    Export.objects.filter(id=export_id).update(
+        internal_status=Export.FAILED)
+    delete_export_shard_files(username, id_string, export_type, export_id)
+
+
 @task()
 def create_external_export(username, id_string, export_id, query=None,
                            token=None, meta=None):
@@ -370,21 +535,26 @@ python manage.py sync_mongo -ra [username] [id_string]\
 --settings='settings.local_settings'
 """
 
+# Runs are scheduled by `CELERYBEAT_SCHEDULE`; stop before the next one starts
+MONGO_RECONCILE_TIME_LIMIT = getattr(
+    settings, 'MONGO_RECONCILE_INTERVAL', 15 * 60) - 60
+
 REMONGO_PATTERN = re.compile(r'Total # of records to remongo: -?[1-9]+',
                              re.IGNORECASE)
 
 
 @task()
 def email_mongo_sync_status():
-    """Check the status of records in the mysql db versus mongodb, and, if
-    necessary, invoke the command to re-sync the two databases, sending an
-    email report to the admins of before and after, so that manual syncing (if
-    necessary) can be done."""
+    """Report the records not synced between the SQL db and mongodb, and, if
+    necessary, reconcile the two databases, sending an email report to the
+    admins of before and after, so that manual syncing (if necessary) can be
+    done."""
 
-    before_report = mongo_sync_status()
+    before_report = mongo_sync_report()
     if REMONGO_PATTERN.search(before_report):
         # synchronization is necessary
-        after_report = mongo_sync_status(remongo=True)
+        reconcile_mongo()
+        after_report = mongo_sync_report()
     else:
         # no synchronization is needed
         after_report = "No synchronization needed"
@@ -397,6 +567,14 @@ def email_mongo_sync_status():
                              SYNC_MONGO_MANUAL_INSTRUCTIONS]))
 
 
+@shared_task(soft_time_limit=MONGO_RECONCILE_TIME_LIMIT,
+             time_limit=MONGO_RECONCILE_TIME_LIMIT + 30)
+def reconcile_mongo_with_postgres():
+    """Sync to mongodb the records modified since the last run, or whose
+    previous write to mongodb failed."""
+    reconcile_mongo()
+
+
 @shared_task(soft_time_limit=60, time_limit=90)
 def log_stuck_exports_and_mark_failed():
     # How long can an export possibly run, not including time spent waiting in
@@ -0,0 +1,81 @@
+import json
+from zipfile import ZipFile
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import get_storage_class
+from django.test.utils import override_settings
+
+from onadata.apps.logger.models import Attachment
+from onadata.apps.main.tests.test_base import TestBase
+from onadata.apps.viewer.models.export import Export
+from onadata.libs.utils.common_tags import ID
+from onadata.libs.utils.export_tools import generate_attachments_zip_export
+
+
+class TestAttachmentsZipExport(TestBase):
+
+    def setUp(self):
+        super(TestAttachmentsZipExport, self).setUp()
+        self._publish_transportation_form()
+        self._make_submissions()
+        self.attachments = {}
+        for i, instance in enumerate(self.xform.instances.order_by('pk')):
+            attachment = Attachment.objects.create(
+                instance=instance, media_file=ContentFile(
+                    'photo %d' % i * 20, name='photo_%d.jpg' % i))
+            self.attachments[attachment.media_file.name] = 'photo %d' % i * 20
+
+    def _read_export(self, export):
+        storage = get_storage_class()()
+        files = {}
+        for filepath in export.volume_filepaths:
+            with storage.open(filepath) as f:
+                with ZipFile(f) as zip_file:
+                    for name in zip_file.namelist():
+                        files[name] = zip_file.read(name)
+        return files
+
+    def _generate_export(self, filter_query=None):
+        return generate_attachments_zip_export(
+            Export.ZIP_EXPORT, 'zip', self.user.username,
+            self.xform.id_string, filter_query=filter_query)
+
+    def test_attachments_zip_export(self):
+        export = self._generate_export()
+        self.assertEqual(export.options, {'volumes': []})
+        self.assertEqual(self._read_export(export), self.attachments)
+        self.assertEqual(export.shards_total, 4)
+        self.assertEqual(export.shards_done, 4)
+
+    def test_attachments_zip_export_honors_the_query(self):
+        instance = self.xform.instances.order_by('pk')[0]
+        export = self._generate_export(json.dumps({ID: instance.pk}))
+        attachment = instance.attachments.get()
+        self.assertEqual(self._read_export(export), {
+            attachment.media_file.name:
+            self.attachments[attachment.media_file.name]})
+        self.assertEqual(export.shards_total, 1)
+
+    def test_attachments_zip_export_skips_missing_files(self):
+        attachment = Attachment.objects.filter(
+            instance__xform=self.xform)[0]
+        get_storage_class()().delete(attachment.media_file.name)
+        del self.attachments[attachment.media_file.name]
+        export = self._generate_export()
+        self.assertEqual(self._read_export(export), self.attachments)
+
+    def test_attachments_zip_export_is_split_into_volumes(self):
+        # every volume only has room for a single attachment
+        with override_settings(ATTACHMENTS_EXPORT_VOLUME_SIZE=200):
+            export = self._generate_export()
+        self.assertEqual(len(export.volume_filepaths), 4)
+        self.assertEqual(export.options['volumes'], [
+            export.filename.replace('.zip', '_part%d.zip' % i)
+            for i in range(2, 5)])
+        self.assertEqual(self._read_export(export), self.attachments)
+
+        storage = get_storage_class()()
+        filepaths = export.volume_filepaths
+        export.delete()
+        for filepath in filepaths:
+            self.assertFalse(storage.exists(filepath))
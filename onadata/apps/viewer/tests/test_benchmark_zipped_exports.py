@@ -0,0 +1,25 @@
+import json
+import os
+from tempfile import NamedTemporaryFile
+
+from django.core.management import call_command
+
+from onadata.apps.main.tests.test_base import TestBase
+
+
+class TestBenchmarkZippedExports(TestBase):
+    def test_benchmark_zipped_csv_export(self):
+        with NamedTemporaryFile(suffix='.json', delete=False) as f:
+            path = f.name
+        call_command('benchmark_zipped_exports', export_type='csv_zip',
+                     records=5, repeats=2, depth=2, fields=2, output=path)
+        with open(path) as f:
+            results = json.load(f)
+        os.unlink(path)
+
+        # 1 main row, 2 repeat_0 rows and 4 repeat_1 rows per record
+        self.assertEqual(results['rows'], 35)
+        self.assertEqual(results['sections'], 3)
+        self.assertGreater(results['output_bytes'], 0)
+        self.assertGreaterEqual(
+            results['peak_rss_kb'], results['initial_rss_kb'])
@@ -3,10 +3,15 @@ import json
 
 from django.test import TestCase
 from django.contrib.auth.models import User
-from onadata.apps.logger.models.xform import title_pattern
+from onadata.apps.logger.models.xform import XForm, title_pattern
 
+from onadata.apps.api.mongo_helper import MongoKeyMap
+from onadata.apps.main.tests.test_base import TestBase
+from onadata.libs.utils.decorators import form_key_maps,\
+    get_form_mongo_key_map
 from onadata.libs.utils.viewer_tools import django_file
 from onadata.apps.viewer.models import DataDictionary
+from onadata.apps.viewer.models.data_dictionary import compiled_surveys
 
 
 class TestDataDictionary(TestCase):
@@ -39,3 +44,75 @@ class TestDataDictionary(TestCase):
         data_dictionary._set_title_in_xml()
         data_dictionary_title = title_pattern.findall(data_dictionary.xml)[0]
         self.assertEqual(data_dictionary_title, 'Desired title')
+
+
+class TestCompiledSurveyCache(TestBase):
+    def setUp(self):
+        super(TestCompiledSurveyCache, self).setUp()
+        compiled_surveys.clear()
+        self._publish_transportation_form()
+
+    def test_data_dictionary_reuses_compiled_survey(self):
+        data_dictionary = self.xform.data_dictionary()
+        survey = data_dictionary.survey
+        with self.assertNumQueries(0):
+            other_data_dictionary = self.xform.data_dictionary()
+            self.assertIs(other_data_dictionary.survey, survey)
+            self.assertEqual(other_data_dictionary.geopoint_xpaths(),
+                             data_dictionary.geopoint_xpaths())
+
+    def test_xform_save_invalidates_compiled_survey(self):
+        survey = self.xform.data_dictionary().survey
+        self.xform.save()
+        self.assertIsNot(self.xform.data_dictionary().survey, survey)
+
+    def test_precomputed_indexes_match_survey_elements(self):
+        data_dictionary = self.xform.data_dictionary()
+        elements = list(data_dictionary.survey.iter_descendants())
+        self.assertEqual(list(data_dictionary.get_survey_elements()),
+                         elements)
+        self.assertEqual(
+            data_dictionary.get_survey_elements_of_type(u'repeat'),
+            [e for e in elements if e.type == u'repeat'])
+        self.assertEqual(
+            sorted(data_dictionary.get_mongo_field_names_dict().values()),
+            sorted(set(e.get_abbreviated_xpath() for e in elements)))
+
+    def test_mongo_key_map(self):
+        key_map = self.xform.data_dictionary().get_mongo_key_map()
+        self.assertIs(self.xform.data_dictionary().get_mongo_key_map(),
+                      key_map)
+
+        key_map = MongoKeyMap({
+            u'name': u'name',
+            u'tel/telLg==office': u'tel/tel.office',
+            u'kids/kids/ageLg==years': u'kids/kids/age.years',
+        })
+        self.assertEqual(key_map.encode(u'tel/tel.office'),
+                         u'tel/telLg==office')
+        self.assertEqual(key_map.decode(u'name'), u'name')
+        record = {
+            u'name': u'Abe',
+            u'tel/telLg==office': u'123-456-789',
+            u'kids/kids': [{u'kids/kids/ageLg==years': 5}],
+        }
+        self.assertEqual(key_map.decode_record(record), {
+            u'name': u'Abe',
+            u'tel/tel.office': u'123-456-789',
+            u'kids/kids': [{u'kids/kids/age.years': 5}],
+        })
+
+    def test_form_mongo_key_map(self):
+        key_map = get_form_mongo_key_map(
+            self.user.username, self.xform.id_string)
+        self.assertIs(
+            key_map, self.xform.data_dictionary().get_mongo_key_map())
+        with self.assertNumQueries(1):
+            self.assertIs(get_form_mongo_key_map(
+                self.user.username, self.xform.id_string), key_map)
+        # replacing the form builds it again
+        self.xform.save()
+        get_form_mongo_key_map(self.user.username, self.xform.id_string)
+        date_modified = XForm.objects.get(pk=self.xform.pk).date_modified
+        self.assertIsNotNone(
+            form_key_maps.get((self.xform.pk, date_modified)))
@@ -517,6 +517,25 @@ class TestExportBuilder(TestBase):
             }
         self.assertEqual(new_row, expected_row)
 
+    def test_pre_process_row_matches_the_split_functions(self):
+        survey = self._create_childrens_survey()
+        export_builder = ExportBuilder()
+        export_builder.set_survey(survey)
+        section = export_builder.section_by_name('children')
+        row = {
+            'children/name': 'Mike',
+            'children/age': '5',
+            'children/fav_colors': 'red blue',
+            'children/iceLg==creams': 'vanilla chocolate',
+        }
+        expected_row = ExportBuilder.decode_mongo_encoded_fields(
+            dict(row), export_builder.encoded_fields['children'])
+        expected_row = ExportBuilder.split_select_multiples(
+            expected_row, export_builder.select_multiples['children'])
+        expected_row['children/age'] = 5
+        self.assertEqual(
+            export_builder.pre_process_row(dict(row), section), expected_row)
+
     def test_generation_of_gps_fields_works(self):
         survey = self._create_childrens_survey()
         export_builder = ExportBuilder()
@@ -829,6 +848,35 @@ class TestExportBuilder(TestBase):
         self.assertEqual(wb.get_sheet_names(), expected_sheet_names)
         xls_file.close()
 
+    def test_to_xls_export_continues_long_sections_on_other_sheets(self):
+        survey = self._create_childrens_survey()
+        export_builder = ExportBuilder()
+        export_builder.set_survey(survey)
+        # the headers and 2 rows per worksheet
+        export_builder.XLSX_MAX_ROWS = 3
+        xls_file = NamedTemporaryFile(suffix='.xlsx')
+        filename = xls_file.name
+        export_builder.to_xls_export(filename, self.data)
+        wb = load_workbook(filename)
+        expected_sheet_names = ['childrens_survey', 'children',
+                                'children_cartoons',
+                                'children_cartoons_characters',
+                                'children_2', 'children_cartoons_2']
+        self.assertEqual(wb.get_sheet_names(), expected_sheet_names)
+
+        cartoons_sheet = wb.get_sheet_by_name('children_cartoons_2')
+        rows = [[c.value for c in row] for row in cartoons_sheet.rows]
+        self.assertEqual(len(rows), 3)
+        headers = rows[0]
+        self.assertEqual(
+            [row[headers.index('children/cartoons/name')]
+             for row in rows[1:]],
+            [u'Shrek', u"Dexter's Lab"])
+        self.assertEqual(
+            [row[headers.index('_parent_table_name')] for row in rows[1:]],
+            [u'children', u'children'])
+        xls_file.close()
+
     def test_child_record_parent_table_is_updated_when_sheet_is_renamed(self):
         survey = create_survey_from_xls(_logger_fixture_path(
             'childrens_survey_with_a_very_long_name.xls'))
@@ -931,6 +979,27 @@ class TestExportBuilder(TestBase):
         temp_xls_file.close()
         # this should error if there is a problem, not sure what to assert
 
+    def test_export_shard_keeps_dates(self):
+        survey = create_survey_from_xls(viewer_fixture_path(
+            'test_data_types/test_data_types.xls'))
+        export_builder = ExportBuilder()
+        export_builder.set_survey(survey)
+        data = [
+            {
+                'name': 'Abe',
+                'when': '1899-07-03',
+            }
+        ]
+        with tempfile.TemporaryFile() as shard_file:
+            export_builder.to_export_shard(shard_file, data)
+            shard_file.seek(0)
+            rows = list(export_builder.iter_shard_rows([shard_file]))
+        self.assertEqual(len(rows), 1)
+        section, row = rows[0]
+        self.assertEqual(section['name'], survey.name)
+        self.assertIsInstance(row['when'], datetime.date)
+        self.assertEqual(row['when'], datetime.date(1899, 7, 3))
+
     def test_convert_types(self):
         val = '1'
         expected_val = 1
@@ -950,6 +1019,50 @@ class TestExportBuilder(TestBase):
         self.assertIsInstance(converted_val, datetime.date)
         self.assertEqual(converted_val, expected_val)
 
+    def test_to_zipped_parquet(self):
+        import pyarrow
+        import pyarrow.parquet
+
+        survey = self._create_childrens_survey()
+        export_builder = ExportBuilder()
+        export_builder.set_survey(survey)
+        export_builder.PARQUET_ROW_GROUP_SIZE = 2
+        temp_zip_file = NamedTemporaryFile(suffix='.zip')
+        export_builder.to_zipped_parquet(temp_zip_file.name, self.data)
+        temp_dir = tempfile.mkdtemp()
+        with zipfile.ZipFile(temp_zip_file.name, "r") as zip_file:
+            self.assertEqual(sorted(zip_file.namelist()), [
+                'children.parquet', 'children_cartoons.parquet',
+                'children_cartoons_characters.parquet',
+                'childrens_survey.parquet'])
+            zip_file.extractall(temp_dir)
+        temp_zip_file.close()
+
+        parquet_file = pyarrow.parquet.ParquetFile(
+            os.path.join(temp_dir, 'children.parquet'))
+        # 3 children in row groups of 2
+        self.assertEqual(parquet_file.metadata.num_row_groups, 2)
+        table = parquet_file.read()
+        schema = table.schema
+        self.assertEqual(
+            schema.field_by_name('children/age').type, pyarrow.int64())
+        self.assertEqual(
+            schema.field_by_name('children/fav_colors/red').type,
+            pyarrow.bool_())
+        self.assertEqual(
+            schema.field_by_name('children/name').type, pyarrow.string())
+        self.assertEqual(
+            schema.field_by_name('_parent_index').type, pyarrow.int64())
+        columns = table.to_pydict()
+        self.assertEqual(columns['children/name'], [u'Mike', u'John',
+                                                     u'Imora'])
+        self.assertEqual(columns['children/age'], [5, 2, 3])
+        self.assertEqual(
+            columns['children/fav_colors/red'], [True, None, None])
+        self.assertEqual(columns['_index'], [1, 2, 3])
+        self.assertEqual(columns['_parent_index'], [1, 1, 1])
+        shutil.rmtree(temp_dir)
+
     def test_to_sav_export(self):
         survey = self._create_childrens_survey()
         export_builder = ExportBuilder()
@@ -0,0 +1,78 @@
+from django.core.files.storage import get_storage_class
+from django.test.utils import override_settings
+from mock import patch
+
+from onadata.apps.main.tests.test_base import TestBase
+from onadata.apps.viewer.models.cached_export import CachedExport
+from onadata.apps.viewer.models.export import Export
+from onadata.libs.utils.export_tools import ExportBuilder, generate_export
+
+
+class TestExportCache(TestBase):
+
+    def setUp(self):
+        super(TestExportCache, self).setUp()
+        self._publish_transportation_form()
+        self._submit_transport_instance()
+
+    def _generate_export(self, query, export_type=Export.CSV_EXPORT,
+                         extension='csv'):
+        return generate_export(
+            export_type, extension, self.user.username, self.xform.id_string,
+            filter_query=query)
+
+    def test_identical_export_is_served_from_cache(self):
+        export = self._generate_export('{"_id": {"$gt": 0}}')
+        self.assertEqual(CachedExport.objects.count(), 1)
+        self.assertFalse(Export.objects.filter(xform=self.xform).exists())
+
+        # the key doesn't depend on the formatting of the query
+        with patch.object(ExportBuilder, 'to_flat_csv_export',
+                          side_effect=AssertionError):
+            cached_export = self._generate_export('{ "_id" : {"$gt":0} }')
+        self.assertEqual(cached_export.filepath, export.filepath)
+        self.assertEqual(CachedExport.objects.count(), 1)
+
+    def test_other_options_or_submissions_miss_the_cache(self):
+        export = self._generate_export('{}')
+        other_export = self._generate_export(
+            '{}', Export.CSV_ZIP_EXPORT, 'zip')
+        self.assertNotEqual(other_export.filepath, export.filepath)
+
+        self._submit_transport_instance(1)
+        new_export = self._generate_export('{}')
+        self.assertNotEqual(new_export.filepath, export.filepath)
+        self.assertEqual(CachedExport.objects.count(), 3)
+
+    def test_notes_miss_the_cache(self):
+        export = self._generate_export('{}')
+        instance = self.xform.instances.get()
+        instance.parsed_instance.add_note(u'Checked')
+        noted_export = self._generate_export('{}')
+        self.assertNotEqual(noted_export.filepath, export.filepath)
+
+        instance.parsed_instance.remove_note(instance.notes.get().pk)
+        self.assertNotEqual(
+            self._generate_export('{}').filepath, noted_export.filepath)
+
+    def test_export_larger_than_the_cache_is_served(self):
+        storage = get_storage_class()()
+        with override_settings(EXPORT_CACHE_MAX_SIZE=1):
+            export = self._generate_export('{}')
+        self.assertTrue(storage.exists(export.filepath))
+        self.assertFalse(CachedExport.objects.exists())
+        # it isn't left in the directory of the cache
+        self.assertNotIn('/cache/', export.filepath)
+
+    def test_least_recently_used_export_is_evicted(self):
+        storage = get_storage_class()()
+        with override_settings(EXPORT_CACHE_MAX_ENTRIES=1):
+            export = self._generate_export('{}')
+            self._generate_export('{"_id": {"$gt": 0}}')
+        self.assertEqual(CachedExport.objects.count(), 1)
+        self.assertFalse(storage.exists(export.filepath))
+
+    def test_cache_can_be_disabled(self):
+        with override_settings(EXPORT_CACHE_MAX_SIZE=0):
+            self._generate_export('{}')
+        self.assertFalse(CachedExport.objects.exists())
@@ -0,0 +1,124 @@
+import os
+from zipfile import ZipFile
+
+from django.core.files.storage import get_storage_class
+from django.utils import timezone
+from mock import patch
+
+from onadata.apps.logger.models import XForm
+from onadata.apps.main.tests.test_base import TestBase
+from onadata.apps.viewer.models.export import Export
+from onadata.apps.viewer.pandas_mongo_bridge import CSVDataFrameBuilder
+from onadata.libs.models.signals import xform_tags_add, xform_tags_delete
+from onadata.libs.utils.export_tools import ExportBuilder, generate_export,\
+    get_incremental_base_export
+
+
+class TestIncrementalExports(TestBase):
+
+    def setUp(self):
+        super(TestIncrementalExports, self).setUp()
+        self._publish_transportation_form()
+        self._submit_transport_instances(self.surveys[:2])
+
+    def _submit_transport_instances(self, surveys):
+        for survey in surveys:
+            self._make_submission(os.path.join(
+                self.this_directory, 'fixtures', 'transportation',
+                'instances', survey, survey + '.xml'))
+
+    def _read_export(self, export):
+        storage = get_storage_class()()
+        with storage.open(export.filepath) as f:
+            return f.read()
+
+    def _read_zip_export(self, export):
+        storage = get_storage_class()()
+        with storage.open(export.filepath) as f:
+            with ZipFile(f) as zip_file:
+                return dict((name, zip_file.read(name))
+                            for name in zip_file.namelist())
+
+    def _generate_export(self, export_type, extension):
+        return generate_export(
+            export_type, extension, self.user.username, self.xform.id_string)
+
+    def test_export_records_what_it_covers(self):
+        export = self._generate_export(Export.CSV_EXPORT, 'csv')
+        ids = self.xform.instances.values_list('id', flat=True)
+        self.assertEqual(export.last_instance_id, max(ids))
+        self.assertEqual(export.instance_count, 2)
+        self.assertEqual(export.options, {
+            'group_delimiter': '/', 'split_select_multiples': True,
+            'binary_select_multiples': False, 'xform_hash': self.xform.hash})
+        self.assertEqual(
+            get_incremental_base_export(self.xform, Export.CSV_EXPORT),
+            export)
+
+    def test_csv_export_appends_new_submissions(self):
+        self._generate_export(Export.CSV_EXPORT, 'csv')
+        self._submit_transport_instances(self.surveys[2:])
+        with patch.object(CSVDataFrameBuilder, 'export_to',
+                          side_effect=AssertionError):
+            export = self._generate_export(Export.CSV_EXPORT, 'csv')
+        self.assertEqual(export.instance_count, 4)
+
+        # a filtered export is always a full one
+        expected = generate_export(
+            Export.CSV_EXPORT, 'csv', self.user.username,
+            self.xform.id_string, filter_query='{}')
+        self.assertEqual(
+            self._read_export(export), self._read_export(expected))
+
+    def test_csv_zip_export_appends_new_submissions(self):
+        self._generate_export(Export.CSV_ZIP_EXPORT, 'zip')
+        self._submit_transport_instances(self.surveys[2:])
+        with patch.object(ExportBuilder, 'to_zipped_csv',
+                          side_effect=AssertionError):
+            export = self._generate_export(Export.CSV_ZIP_EXPORT, 'zip')
+        self.assertEqual(export.instance_count, 4)
+
+        expected = generate_export(
+            Export.CSV_ZIP_EXPORT, 'zip', self.user.username,
+            self.xform.id_string, filter_query='{}')
+        self.assertEqual(
+            self._read_zip_export(export), self._read_zip_export(expected))
+
+    def test_deleted_submission_forces_full_export(self):
+        self._generate_export(Export.CSV_EXPORT, 'csv')
+        self.xform.instances.all()[0].set_deleted(timezone.now())
+        self.assertIsNone(
+            get_incremental_base_export(self.xform, Export.CSV_EXPORT))
+        export = self._generate_export(Export.CSV_EXPORT, 'csv')
+        self.assertEqual(export.instance_count, 1)
+
+    def test_note_forces_full_export(self):
+        self._generate_export(Export.CSV_EXPORT, 'csv')
+        self.xform.instances.all()[0].parsed_instance.add_note(u'Checked')
+        self.assertIsNone(
+            get_incremental_base_export(self.xform, Export.CSV_EXPORT))
+
+    def test_form_tags_force_full_export(self):
+        self._generate_export(Export.CSV_EXPORT, 'csv')
+        xform_tags_add.send(
+            sender=XForm, xform=self.xform, tags=[u'checked'])
+        self.assertIsNone(
+            get_incremental_base_export(self.xform, Export.CSV_EXPORT))
+
+        self._generate_export(Export.CSV_EXPORT, 'csv')
+        xform_tags_delete.send(
+            sender=XForm, xform=self.xform, tag=u'checked')
+        self.assertIsNone(
+            get_incremental_base_export(self.xform, Export.CSV_EXPORT))
+
+    def test_replaced_form_forces_full_export(self):
+        self._generate_export(Export.CSV_EXPORT, 'csv')
+        # e.g. a new version of the form was deployed
+        self.xform.xml += u'\n'
+        self.assertIsNone(
+            get_incremental_base_export(self.xform, Export.CSV_EXPORT))
+
+    def test_other_options_force_full_export(self):
+        self._generate_export(Export.CSV_EXPORT, 'csv')
+        self.assertIsNone(get_incremental_base_export(
+            self.xform, Export.CSV_EXPORT, group_delimiter='.'))
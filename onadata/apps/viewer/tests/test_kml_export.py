@@ -1,11 +1,16 @@
 import os
 import unittest
+from zipfile import ZipFile
 
+from django.core.files.storage import get_storage_class
 from django.core.urlresolvers import reverse
 
 from onadata.apps.main.tests.test_base import TestBase
 from onadata.apps.logger.models.instance import Instance
+from onadata.apps.viewer.models.export import Export
 from onadata.apps.viewer.views import kml_export
+from onadata.libs.utils.export_tools import generate_kml_export,\
+    kml_export_data
 
 
 class TestKMLExport(TestBase):
@@ -43,3 +48,47 @@ class TestKMLExport(TestBase):
 
             self.assertMultiLineEqual(
                 expected_content.strip(), response.content.strip())
+
+    def _read_export(self, export):
+        storage = get_storage_class()()
+        with storage.open(export.filepath) as f:
+            return f.read()
+
+    def test_generate_kml_export(self):
+        self._publish_survey()
+        self._make_submissions_gps()
+        export = generate_kml_export(
+            Export.KML_EXPORT, 'kml', self.user.username, 'gps')
+        content = self._read_export(export)
+        self.assertEqual(content.count('<Placemark>'), 2)
+        self.assertIn('-73.9644670486, 40.8110171556', content)
+        self.assertTrue(content.strip().endswith('</kml>'))
+
+        export = generate_kml_export(
+            Export.KMZ_EXPORT, 'kmz', self.user.username, 'gps')
+        storage = get_storage_class()()
+        with storage.open(export.filepath) as f:
+            with ZipFile(f) as zip_file:
+                self.assertEqual(zip_file.namelist(), ['doc.kml'])
+                self.assertEqual(zip_file.read('doc.kml'), content)
+
+    def test_kml_export_data_filters(self):
+        self._publish_survey()
+        self._make_submissions_gps()
+
+        def _count(**filters):
+            return len(list(kml_export_data('gps', self.user, **filters)))
+
+        self.assertEqual(_count(), 2)
+        self.assertEqual(_count(bbox=(-74, 40, -73, 41)), 2)
+        self.assertEqual(_count(bbox=(0, 0, 1, 1)), 0)
+        self.assertEqual(_count(end='2000-01-01 00:00:00'), 0)
+        self.assertEqual(_count(start='2000-01-01 00:00:00'), 2)
+
+    def test_kml_export_rejects_invalid_filters(self):
+        self._publish_survey()
+        url = reverse(
+            kml_export,
+            kwargs={'username': self.user.username, 'id_string': 'gps'})
+        response = self.client.get(url, {'bbox': '1,2,3'})
+        self.assertEqual(response.status_code, 400)
@@ -1,5 +1,6 @@
 import csv
 import os
+from StringIO import StringIO
 from tempfile import NamedTemporaryFile
 
 from django.utils.dateparse import parse_datetime
@@ -12,6 +13,7 @@ from onadata.apps.viewer.pandas_mongo_bridge import AbstractDataFrameBuilder,\
     CSVDataFrameBuilder, CSVDataFrameWriter, ExcelWriter,\
     get_prefix_from_xpath, get_valid_sheet_name, XLSDataFrameBuilder,\
     XLSDataFrameWriter, remove_dups_from_list_maintain_order
+from onadata.libs.exceptions import NoRecordsFoundError
 from onadata.libs.utils.common_tags import NA_REP
 
 
@@ -554,10 +556,10 @@ class TestPandasMongoBridge(TestBase):
         prefix = get_prefix_from_xpath(xpath)
         self.assertTrue(prefix is None)
 
-    def test_csv_export_with_df_size_limit(self):
+    def test_csv_export_in_batches(self):
         """
-        To fix pandas limitation of 30k rows on csv export, we specify a max
-        number of records in a dataframe on export - lets test it
+        The csv export walks the records with a single cursor, test that
+        records spanning several batches are all exported
         """
         self._publish_single_level_repeat_form()
         # submit 7 instances
@@ -571,7 +573,7 @@ class TestPandasMongoBridge(TestBase):
         record_count = csv_df_builder._query_mongo(count=True)
         self.assertEqual(record_count, 7)
         temp_file = NamedTemporaryFile(suffix=".csv", delete=False)
-        csv_df_builder.export_to(temp_file.name, data_frame_max_size=3)
+        csv_df_builder.export_to(temp_file.name, batch_size=3)
         csv_file = open(temp_file.name)
         csv_reader = csv.reader(csv_file)
         header = csv_reader.next()
@@ -586,6 +588,33 @@ class TestPandasMongoBridge(TestBase):
         csv_file.close()
         os.unlink(temp_file.name)
 
+    def test_csv_export_repeat_columns(self):
+        """
+        The columns of the repeats are those of the record with the most
+        repetitions, whichever batch it is in
+        """
+        self._publish_single_level_repeat_form()
+        self._submit_fixture_instance("new_repeats", "02")
+        for i in range(3):
+            self._submit_fixture_instance("new_repeats", "01")
+        csv_df_builder = CSVDataFrameBuilder(self.user.username,
+                                             self.xform.id_string)
+        csv_file = StringIO()
+        csv_df_builder.export_to(csv_file, batch_size=1)
+        csv_file.seek(0)
+        rows = [row for row in csv.reader(csv_file)]
+        self.assertEqual(len(rows), 5)
+        self.assertIn('kids/kids_details[2]/kids_name', rows[0])
+        self.assertTrue(all(len(row) == len(rows[0]) for row in rows))
+        self.assertNotIn('_id', rows[0])
+
+    def test_csv_export_without_records(self):
+        self._publish_single_level_repeat_form()
+        csv_df_builder = CSVDataFrameBuilder(self.user.username,
+                                             self.xform.id_string)
+        with self.assertRaises(NoRecordsFoundError):
+            csv_df_builder.export_to(StringIO())
+
     def test_csv_column_indices_in_groups_within_repeats(self):
         self._publish_xls_fixture_set_xform("groups_in_repeats")
         self._submit_fixture_instance("groups_in_repeats", "01")
@@ -1,13 +1,24 @@
 import os
+from datetime import timedelta
+from tempfile import NamedTemporaryFile
 
 from django.conf import settings
 from django.core.management import call_command
+from django.test.utils import override_settings
+from django.utils import timezone
 from django_digest.test import DigestAuth
+from mock import patch
 
+from onadata.apps.logger.models import Instance
 from onadata.apps.main.tests.test_base import TestBase
-from onadata.apps.viewer.models.parsed_instance import ParsedInstance
+from onadata.apps.viewer.models import MongoSyncWatermark
+from onadata.apps.viewer.models.parsed_instance import ParsedInstance,\
+    MONGO_FLUSH_MAX_ATTEMPTS, flush_mongo_write_behind
 from onadata.apps.viewer.management.commands.remongo import Command
 from onadata.libs.utils.common_tags import USERFORM_ID
+from onadata.libs.utils.mongo_sync import FileCheckpoint,\
+    bulk_update_mongo_for_xform, flush_write_behind_queue,\
+    mongo_sync_report, reconcile_mongo
 
 
 class TestRemongo(TestBase):
@@ -105,3 +116,147 @@ class TestRemongo(TestBase):
             {USERFORM_ID: userform_id}).count()
         self.assertEqual(mongo_count,
                          initial_mongo_count + len(self.surveys))
+
+    def test_bulk_remongo_matches_remongo(self):
+        self._publish_transportation_form()
+        self._make_submissions()
+        expected = dict((record['_id'], record)
+                        for record in settings.MONGO_DB.instances.find())
+        settings.MONGO_DB.instances.drop()
+        c = Command()
+        c.handle(batchsize=3, bulk=True)
+        documents = dict((record['_id'], record)
+                         for record in settings.MONGO_DB.instances.find())
+        self.assertEqual(documents, expected)
+
+    def test_bulk_remongo_resumes_from_checkpoint(self):
+        self._publish_transportation_form()
+        self._make_submissions()
+        pks = sorted(ParsedInstance.objects.values_list(
+            'instance_id', flat=True))
+        settings.MONGO_DB.instances.drop()
+        with NamedTemporaryFile(suffix='.json') as f:
+            path = f.name
+        checkpoint = FileCheckpoint(path)
+        checkpoint.set(self.xform, pks[1])
+        written = bulk_update_mongo_for_xform(
+            self.xform, batch_size=1, start_after=checkpoint.get(self.xform),
+            checkpoint=FileCheckpoint(path))
+        os.unlink(path)
+        self.assertEqual(written, len(pks) - 2)
+        self.assertEqual(
+            sorted(r['_id'] for r in settings.MONGO_DB.instances.find()),
+            pks[2:])
+
+    def test_reconcile_mongo_syncs_failed_instances(self):
+        self._publish_transportation_form()
+        self._make_submissions()
+        settings.MONGO_DB.instances.drop()
+        pk = Instance.objects.order_by('pk').values_list(
+            'pk', flat=True)[0]
+        Instance.objects.filter(pk=pk).update(is_synced_with_mongo=False)
+        self.assertIn('Total # of records to remongo: 1', mongo_sync_report())
+
+        written, failed_pks = reconcile_mongo()
+        self.assertEqual((written, failed_pks), (1, []))
+        self.assertEqual(
+            [r['_id'] for r in settings.MONGO_DB.instances.find()], [pk])
+        self.assertTrue(Instance.objects.get(pk=pk).is_synced_with_mongo)
+        self.assertIn('Total # of records to remongo: 0', mongo_sync_report())
+        self.assertIsNotNone(MongoSyncWatermark.objects.get(
+            xform=self.xform).synced_until)
+
+    def test_reconcile_mongo_skips_legacy_instances(self):
+        self._publish_transportation_form()
+        self._make_submissions()
+        # instances saved before `is_synced_with_mongo` was added
+        Instance.objects.update(is_synced_with_mongo=None)
+        report = mongo_sync_report()
+        self.assertIn('Total # of records to remongo: 0', report)
+        self.assertIn('Total # of records of unknown sync status: 4', report)
+        self.assertEqual(reconcile_mongo(), (0, []))
+
+        # one of them never reached Mongo
+        pk = Instance.objects.order_by('pk').values_list(
+            'pk', flat=True)[0]
+        settings.MONGO_DB.instances.remove({'_id': pk})
+        call_command('update_is_sync_with_mongo', only_unknown=True,
+                     batchsize=3)
+        self.assertFalse(Instance.objects.filter(
+            is_synced_with_mongo__isnull=True).exists())
+        report = mongo_sync_report()
+        self.assertIn('Total # of records to remongo: 1', report)
+        self.assertNotIn('unknown sync status', report)
+        self.assertEqual(reconcile_mongo(), (1, []))
+
+    def test_reconcile_mongo_syncs_modified_instances(self):
+        self._publish_transportation_form()
+        self._make_submissions()
+        reconcile_mongo()
+        settings.MONGO_DB.instances.drop()
+
+        # nothing changed since the watermark
+        MongoSyncWatermark.objects.filter(xform=self.xform).update(
+            synced_until=timezone.now() + timedelta(hours=1))
+        self.assertEqual(reconcile_mongo(), (0, []))
+
+        MongoSyncWatermark.objects.filter(xform=self.xform).update(
+            synced_until=timezone.now() - timedelta(days=1))
+        written, failed_pks = reconcile_mongo()
+        self.assertEqual(written, Instance.objects.count())
+        self.assertEqual(settings.MONGO_DB.instances.count(), written)
+
+    @override_settings(MONGO_WRITE_BEHIND=True)
+    def test_write_behind_submissions_are_flushed(self):
+        self._publish_transportation_form()
+        self._make_submissions()
+        # Celery runs the flush eagerly during the tests
+        self.assertEqual(settings.MONGO_DB.instances.count(), 4)
+        self.assertFalse(Instance.objects.filter(
+            is_synced_with_mongo=False).exists())
+
+    def test_write_behind_flush_only_writes_queued_instances(self):
+        self._publish_transportation_form()
+        self._make_submissions()
+        settings.MONGO_DB.instances.drop()
+        pk = Instance.objects.order_by('pk').values_list(
+            'pk', flat=True)[0]
+        ParsedInstance.objects.get(instance_id=pk).update_mongo(write_behind=True)
+        self.assertEqual(
+            [r['_id'] for r in settings.MONGO_DB.instances.find()], [pk])
+        self.assertTrue(Instance.objects.get(pk=pk).is_synced_with_mongo)
+        self.assertEqual(flush_write_behind_queue(), (0, []))
+
+    def test_write_behind_burst_schedules_one_flush(self):
+        self._publish_transportation_form()
+        self._make_submissions()
+        settings.MONGO_DB.instances.drop()
+        pks = list(Instance.objects.order_by('pk').values_list(
+            'pk', flat=True))
+        with patch('onadata.apps.viewer.models.parsed_instance.'
+                   'flush_mongo_write_behind') as flush:
+            for pi in ParsedInstance.objects.filter(instance_id__in=pks):
+                pi.update_mongo(write_behind=True)
+        self.assertEqual(flush.apply_async.call_count, 1)
+        self.assertEqual(settings.MONGO_DB.instances.count(), 0)
+
+        # the scheduled flush writes the whole burst
+        flush_mongo_write_behind(*flush.apply_async.call_args[0][0])
+        self.assertEqual(
+            sorted(r['_id'] for r in settings.MONGO_DB.instances.find()),
+            pks)
+
+    def test_write_behind_flush_retries_until_synced(self):
+        self._publish_transportation_form()
+        self._make_submissions()
+        pk = Instance.objects.order_by('pk').values_list(
+            'pk', flat=True)[0]
+        Instance.objects.filter(pk=pk).update(is_synced_with_mongo=False)
+        # e.g. the transaction which saved the instance isn't committed yet
+        with patch('onadata.libs.utils.mongo_sync.flush_write_behind_queue',
+                   return_value=(0, [])) as flush:
+            flush_mongo_write_behind(pk)
+        self.assertEqual(flush.call_count, MONGO_FLUSH_MAX_ATTEMPTS)
+
+        flush_mongo_write_behind(pk)
+        self.assertTrue(Instance.objects.get(pk=pk).is_synced_with_mongo)
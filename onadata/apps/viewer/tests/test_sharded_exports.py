@@ -0,0 +1,132 @@
+import os
+from zipfile import ZipFile
+
+from django.core.files.storage import get_storage_class
+from django.test.utils import override_settings
+from mock import patch
+
+from onadata.apps.main.tests.test_base import TestBase
+from onadata.apps.viewer.models.export import Export
+from onadata.apps.viewer.tasks import cleanup_export_shards,\
+    create_async_export
+from onadata.libs.utils.export_tools import generate_export,\
+    generate_export_shard, plan_export_shards, should_shard_export
+
+
+class TestShardedExports(TestBase):
+
+    def setUp(self):
+        super(TestShardedExports, self).setUp()
+        self._publish_transportation_form()
+        self._make_submissions()
+
+    def _read_export(self, export):
+        storage = get_storage_class()()
+        with storage.open(export.filepath) as f:
+            return f.read()
+
+    def _create_sharded_export(self, export_type):
+        with override_settings(EXPORT_SHARD_SIZE=2):
+            self.assertTrue(should_shard_export(self.xform, export_type))
+            export, _ = create_async_export(
+                self.xform, export_type, None, False)
+        export = Export.objects.get(id=export.id)
+        self.assertEqual(export.internal_status, Export.SUCCESSFUL)
+        self.assertEqual(export.shards_total, 2)
+        self.assertEqual(export.shards_done, 2)
+        return export
+
+    def _list_shard_files(self, export_type):
+        storage = get_storage_class()()
+        shards_dir = os.path.join(
+            self.user.username, 'exports', self.xform.id_string,
+            export_type, 'shards')
+        if not storage.exists(shards_dir):
+            return []
+        return storage.listdir(shards_dir)[1]
+
+    def test_plan_export_shards(self):
+        ids = sorted(self.xform.instances.values_list('id', flat=True))
+        shards = plan_export_shards(
+            self.user.username, self.xform.id_string, shard_size=3)
+        self.assertEqual(shards, [[ids[0], ids[2]], [ids[3], ids[3]]])
+
+    def test_should_shard_export(self):
+        with override_settings(EXPORT_SHARD_SIZE=0):
+            self.assertFalse(
+                should_shard_export(self.xform, Export.CSV_EXPORT))
+        with override_settings(EXPORT_SHARD_SIZE=10):
+            self.assertFalse(
+                should_shard_export(self.xform, Export.CSV_EXPORT))
+        with override_settings(EXPORT_SHARD_SIZE=2):
+            self.assertFalse(
+                should_shard_export(self.xform, Export.SAV_ZIP_EXPORT))
+
+    def test_sharded_csv_export(self):
+        export = self._create_sharded_export(Export.CSV_EXPORT)
+        expected = generate_export(
+            Export.CSV_EXPORT, 'csv', self.user.username,
+            self.xform.id_string)
+        self.assertEqual(
+            self._read_export(export), self._read_export(expected))
+
+    def test_sharded_csv_zip_export(self):
+        export = self._create_sharded_export(Export.CSV_ZIP_EXPORT)
+        expected = generate_export(
+            Export.CSV_ZIP_EXPORT, 'zip', self.user.username,
+            self.xform.id_string)
+        storage = get_storage_class()()
+        with storage.open(export.filepath) as f:
+            with storage.open(expected.filepath) as g:
+                sharded_zip, expected_zip = ZipFile(f), ZipFile(g)
+                self.assertEqual(
+                    sharded_zip.namelist(), expected_zip.namelist())
+                for name in expected_zip.namelist():
+                    self.assertEqual(
+                        sharded_zip.read(name), expected_zip.read(name))
+
+    def test_sharded_xls_export(self):
+        export = self._create_sharded_export(Export.XLS_EXPORT)
+        self.assertTrue(export.filename.endswith('.xlsx'))
+
+    def test_failed_export_shard_deletes_its_columns(self):
+        export = Export.objects.create(
+            xform=self.xform, export_type=Export.CSV_EXPORT)
+        id_range = plan_export_shards(
+            self.user.username, self.xform.id_string)[0]
+        with patch('onadata.libs.utils.export_tools.File',
+                   side_effect=IOError):
+            with self.assertRaises(IOError):
+                generate_export_shard(
+                    Export.CSV_EXPORT, self.user.username,
+                    self.xform.id_string, export.id, 0, id_range)
+        self.assertEqual(self._list_shard_files(Export.CSV_EXPORT), [])
+
+    def test_cleanup_export_shards(self):
+        export = Export.objects.create(
+            xform=self.xform, export_type=Export.CSV_EXPORT)
+        other_export = Export.objects.create(
+            xform=self.xform, export_type=Export.CSV_EXPORT)
+        id_ranges = plan_export_shards(
+            self.user.username, self.xform.id_string, shard_size=2)
+        for shard_index, id_range in enumerate(id_ranges):
+            generate_export_shard(
+                Export.CSV_EXPORT, self.user.username, self.xform.id_string,
+                export.id, shard_index, id_range)
+        other_shard = generate_export_shard(
+            Export.CSV_EXPORT, self.user.username, self.xform.id_string,
+            other_export.id, 0, id_ranges[0])
+        self.assertEqual(len(self._list_shard_files(Export.CSV_EXPORT)), 6)
+
+        cleanup_export_shards(
+            None, Export.CSV_EXPORT, self.user.username,
+            self.xform.id_string, export.id)
+        self.assertEqual(
+            sorted(self._list_shard_files(Export.CSV_EXPORT)),
+            sorted(os.path.basename(path)
+                   for path in other_shard.values()))
+        self.assertEqual(Export.objects.get(id=export.id).internal_status,
+                         Export.FAILED)
+        self.assertNotEqual(
+            Export.objects.get(id=other_export.id).internal_status,
+            Export.FAILED)
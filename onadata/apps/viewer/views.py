@@ -17,7 +17,7 @@ from django.core.urlresolvers import reverse
 from django.db.models import Q
 from django.http import (
     HttpResponseForbidden, HttpResponseRedirect, HttpResponseNotFound,
-    HttpResponseBadRequest, HttpResponse)
+    HttpResponseBadRequest, HttpResponse, StreamingHttpResponse)
 from django.shortcuts import get_object_or_404
 from django.shortcuts import redirect
 from django.shortcuts import render
@@ -35,6 +35,7 @@ from onadata.libs.utils.common_tags import SUBMISSION_TIME
 from onadata.libs.utils.export_tools import (
     generate_export,
     should_create_new_export,
+    iter_kml,
     kml_export_data,
     newset_export_for)
 from onadata.libs.utils.image_tools import image_url
@@ -51,6 +52,9 @@ from onadata.libs.utils.chart_tools import build_chart_data
 
 media_file_logger = logging.getLogger('media_files')
 
+KML_FILTERS_ERROR = u'bbox must be 4 comma separated numbers and times ' \
+    u'must be in the format YY_MM_DD_hh_mm_ss'
+
 
 def _set_submission_time_to_query(query, request):
     query[SUBMISSION_TIME] = {}
@@ -78,6 +82,26 @@ def format_date_for_mongo(x):
         .strftime('%Y-%m-%dT%H:%M:%S')
 
 
+def kml_filters_for_params(params):
+    """
+    The `bbox`, `start` and `end` filters of a KML export: a comma separated
+    minimum longitude, minimum latitude, maximum longitude and maximum
+    latitude, and submission times in the YY_MM_DD_hh_mm_ss format
+
+    :raises ValueError: if a filter is invalid
+    """
+    filters = {}
+    if params.get('bbox'):
+        bbox = tuple(float(x) for x in params['bbox'].split(','))
+        if len(bbox) != 4:
+            raise ValueError(params['bbox'])
+        filters['bbox'] = bbox
+    for key in ('start', 'end'):
+        if params.get(key):
+            filters[key] = encode(params[key])
+    return filters
+
+
 def instances_for_export(dd, start=None, end=None):
     if start and not end:
         return dd.instances.filter(date_created__gte=start)
@@ -238,7 +262,8 @@ def data_export(request, username, id_string, export_type):
     force_xlsx = request.GET.get('xls') != 'true'
     if export_type == Export.XLS_EXPORT and force_xlsx:
         extension = 'xlsx'
-    elif export_type in [Export.CSV_ZIP_EXPORT, Export.SAV_ZIP_EXPORT]:
+    elif export_type in [Export.CSV_ZIP_EXPORT, Export.SAV_ZIP_EXPORT,
+                         Export.PARQUET_ZIP_EXPORT]:
         extension = 'zip'
 
     audit = {
@@ -334,6 +359,13 @@ def create_export(request, username, id_string, export_type):
         'binary_select_multiples': binary_select_multiples,
         'meta': meta.replace(",", "") if meta else None
     }
+    if export_type in (Export.KML_EXPORT, Export.KMZ_EXPORT):
+        try:
+            options.update(kml_filters_for_params(dict(
+                (key, request.POST.get("options[%s]" % key))
+                for key in ('bbox', 'start', 'end'))))
+        except ValueError:
+            return HttpResponseBadRequest(_(KML_FILTERS_ERROR))
 
     try:
         create_async_export(xform, export_type, query, force_xlsx, options)
@@ -441,7 +473,9 @@ def export_progress(request, username, id_string, export_type):
             'complete': False,
             'url': None,
             'filename': None,
-            'export_id': export.id
+            'export_id': export.id,
+            'shards_total': export.shards_total,
+            'shards_done': export.shards_done
         }
 
         if export.status == Export.SUCCESSFUL:
@@ -452,6 +486,10 @@ def export_progress(request, username, id_string, export_type):
                 'filename': export.filename
             })
             status['filename'] = export.filename
+            # the next volumes of a split attachments ZIP export
+            status['volumes'] = [
+                u'%s?volume=%d' % (status['url'], i)
+                for i in range(2, len(export.volume_filepaths) + 1)]
             if export.export_type == Export.GDOC_EXPORT and \
                     export.export_url is None:
                 redirect_url = reverse(
@@ -500,7 +538,17 @@ def export_download(request, username, id_string, export_type, filename):
             and export.export_url is not None:
         return HttpResponseRedirect(export.export_url)
 
-    ext, mime_type = export_def_from_filename(export.filename)
+    filepaths = export.volume_filepaths
+    try:
+        volume = int(request.GET.get('volume', 1))
+    except ValueError:
+        return HttpResponseBadRequest(_(u'Invalid volume.'))
+    if not 1 <= volume <= len(filepaths):
+        return HttpResponseNotFound(_(u'Volume not found.'))
+    filepath = filepaths[volume - 1]
+    filename = os.path.basename(filepath)
+
+    ext, mime_type = export_def_from_filename(filename)
 
     audit = {
         "xform": xform.id_string,
@@ -512,7 +560,7 @@ def export_download(request, username, id_string, export_type, filename):
           "on '%(id_string)s'.") %
         {
             'export_type': export.export_type.upper(),
-            'filename': export.filename,
+            'filename': filename,
             'id_string': xform.id_string,
         }, audit, request)
     if request.GET.get('raw'):
@@ -520,11 +568,11 @@ def export_download(request, username, id_string, export_type, filename):
 
     default_storage = get_storage_class()()
     if not isinstance(default_storage, FileSystemStorage):
-        return HttpResponseRedirect(default_storage.url(export.filepath))
-    basename = os.path.splitext(export.filename)[0]
+        return HttpResponseRedirect(default_storage.url(filepath))
+    basename = os.path.splitext(filename)[0]
     response = response_with_mimetype_and_name(
         mime_type, name=basename, extension=ext,
-        file_path=export.filepath, show_date=False)
+        file_path=filepath, show_date=False)
     return response
 
 
@@ -571,10 +619,14 @@ def kml_export(request, username, id_string):
     helper_auth_helper(request)
     if not has_permission(xform, owner, request):
         return HttpResponseForbidden(_(u'Not shared.'))
-    data = {'data': kml_export_data(id_string, user=owner)}
-    response = \
-        render(request, "survey.kml", data,
-               content_type="application/vnd.google-earth.kml+xml")
+    try:
+        filters = kml_filters_for_params(request.GET)
+    except ValueError:
+        return HttpResponseBadRequest(_(KML_FILTERS_ERROR))
+    data = kml_export_data(id_string, user=owner, **filters)
+    response = StreamingHttpResponse(
+        (chunk.encode('utf-8') for chunk in iter_kml(id_string, data)),
+        content_type="application/vnd.google-earth.kml+xml")
     response['Content-Disposition'] = \
         disposition_ext_and_date(id_string, 'kml')
     audit = {
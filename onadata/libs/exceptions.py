@@ -4,3 +4,11 @@ class NoRecordsFoundError(Exception):
 
 class J2XException(Exception):
     pass
+
+
+class IncrementalExportError(Exception):
+    pass
+
+
+class UnindexedQueryError(Exception):
+    pass
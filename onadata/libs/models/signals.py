@@ -1,6 +1,7 @@
 import django.dispatch
+from django.utils import timezone
 
-from onadata.apps.logger.models import XForm
+from onadata.apps.logger.models import Instance, XForm
 
 xform_tags_add = django.dispatch.Signal(providing_args=['xform', 'tags'])
 xform_tags_delete = django.dispatch.Signal(providing_args=['xform', 'tag'])
@@ -12,12 +13,17 @@ def add_tags_to_xform_instances(sender, **kwargs):
     tags = kwargs.get('tags', None)
     if isinstance(xform, XForm) and isinstance(tags, list):
         # update existing instances with the new tag
+        modified_ids = []
         for instance in xform.instances.all():
             for tag in tags:
                 if tag not in instance.tags.names():
                     instance.tags.add(tag)
+                    modified_ids.append(instance.pk)
             # ensure mongodb is updated
             instance.parsed_instance.save()
+        # the exports of the form are out of date
+        Instance.objects.filter(pk__in=set(modified_ids)).update(
+            date_modified=timezone.now())
 
 
 @django.dispatch.receiver(xform_tags_delete, sender=XForm)
@@ -26,8 +32,13 @@ def delete_tag_from_xform_instances(sender, **kwargs):
     tag = kwargs.get('tag', None)
     if isinstance(xform, XForm) and isinstance(tag, basestring):
         # update existing instances with the new tag
+        modified_ids = []
         for instance in xform.instances.all():
             if tag in instance.tags.names():
                 instance.tags.remove(tag)
+                modified_ids.append(instance.pk)
                 # ensure mongodb is updated
                 instance.parsed_instance.save()
+        # the exports of the form are out of date
+        Instance.objects.filter(pk__in=modified_ids).update(
+            date_modified=timezone.now())
@@ -5,6 +5,7 @@ from django.utils import six
 from django.utils.six.moves import StringIO
 from django.utils.encoding import smart_text
 from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
 from rest_framework.renderers import TemplateHTMLRenderer
 from rest_framework.renderers import StaticHTMLRenderer
 from rest_framework_xml.renderers import XMLRenderer
@@ -41,6 +42,50 @@ class SAVZIPRenderer(BaseRenderer):
     charset = None
 
 
+class ParquetZIPRenderer(BaseRenderer):
+    media_type = 'application/octet-stream'
+    format = 'parquetzip'
+    charset = None
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Newline delimited JSON: one JSON document per line. The data endpoint
+    streams it instead, see `stream_json_records()`.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return bytes()
+        if not isinstance(data, list):
+            data = [data]
+        return bytes().join(stream_json_records(data, ndjson=True))
+
+
+def stream_json_records(records, ndjson=False):
+    """
+    Serialize `records` a record at a time, as a JSON array or as
+    newline delimited JSON
+
+    :returns: An iterator over the UTF-8 encoded JSON
+    """
+    encoder = JSONEncoder(ensure_ascii=False)
+    if not ndjson:
+        yield b'['
+    for i, record in enumerate(records):
+        chunk = encoder.encode(record)
+        if ndjson:
+            chunk += u'\n'
+        elif i:
+            chunk = u',' + chunk
+        yield chunk.encode('utf-8')
+    if not ndjson:
+        yield b']'
+
+
 # TODO add KML, ZIP(attachments) support
 
 
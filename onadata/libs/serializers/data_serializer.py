@@ -1,12 +1,21 @@
+import base64
 import json
+import time
+from contextlib import contextmanager
 
-from django.utils.translation import ugettext as _
-from rest_framework import serializers
-from rest_framework.exceptions import ParseError
+from bson import json_util
+from django.utils.translation import ugettext as _, ugettext_lazy
+from pymongo.errors import ExecutionTimeout
+from rest_framework import serializers, status
+from rest_framework.exceptions import APIException, ParseError
+from rest_framework.utils.urls import replace_query_param
 
 from onadata.apps.logger.models.xform import XForm
 from onadata.apps.viewer.models.parsed_instance import ParsedInstance
 from onadata.apps.api.mongo_helper import MongoHelper
+from onadata.libs.exceptions import UnindexedQueryError
+from onadata.libs.utils.count_tools import get_data_count
+from onadata.libs.utils.mongo_query_tools import log_query_shape
 
 
 class DataSerializer(serializers.HyperlinkedModelSerializer):
@@ -19,51 +28,157 @@ class DataSerializer(serializers.HyperlinkedModelSerializer):
         lookup_field = 'pk'
 
 
-class DataListSerializer(serializers.Serializer):
-    def to_representation(self, obj):
-        request = self.context.get('request')
+def encode_cursor(keyset):
+    """
+    The opaque continuation token of a keyset of
+    `ParsedInstance.query_mongo_keyset()`
+    """
+    return base64.urlsafe_b64encode(
+        json.dumps(keyset, default=json_util.default))
+
+
+def _is_valid_keyset(keyset):
+    # the `_id` of the last record of the previous page, then the value of
+    # its sort key, if any
+    if not isinstance(keyset, list) or len(keyset) not in (1, 2):
+        return False
+    last_id = keyset[0]
+    if not isinstance(last_id, (int, long)) or isinstance(last_id, bool):
+        return False
+    return len(keyset) == 1 or not isinstance(keyset[1], (dict, list))
+
+
+def decode_cursor(cursor):
+    """
+    The keyset of a continuation token, None for the first page
+
+    :raises ParseError: if `cursor` isn't a valid token
+    """
+    if not cursor:
+        return None
+    try:
+        keyset = json.loads(base64.urlsafe_b64decode(str(cursor)),
+                            object_hook=json_util.object_hook)
+    except (TypeError, ValueError, UnicodeEncodeError):
+        keyset = None
+    if not _is_valid_keyset(keyset):
+        raise ParseError(_(u"Invalid cursor: %(cursor)s")
+                         % {'cursor': cursor})
+    return keyset
+
+
+class QueryTimeout(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = ugettext_lazy(
+        u"The query took too long, narrow it down with `query` or `limit`.")
+
+
+@contextmanager
+def data_query(query_kwargs):
+    """
+    Run the Mongo query of the block: record its shape if it is slow, and
+    turn the errors due to the request parameters into `ParseError`s, and
+    the timeouts into `QueryTimeout`s
+    """
+    started = time.time()
+    try:
+        yield
+    except (ValueError, UnindexedQueryError) as e:
+        raise ParseError(unicode(e))
+    except ExecutionTimeout:
+        raise QueryTimeout()
+    log_query_shape(ParsedInstance.get_query_shape(
+        query_kwargs['query'], query_kwargs.get('sort')),
+        (time.time() - started) * 1000)
 
-        if not isinstance(obj, XForm):
-            return super(DataListSerializer, self).to_representation(obj)
 
-        query_params = (request and request.query_params) or {}
+class DataListSerializer(serializers.Serializer):
+    @classmethod
+    def get_query_kwargs(cls, xform, query_params):
+        """
+        The `query`, `fields` and `sort` arguments of the `ParsedInstance`
+        queries of the submissions of `xform` for the request parameters
+        """
         query = {
             ParsedInstance.USERFORM_ID:
-            u'%s_%s' % (obj.user.username, obj.id_string)
+            u'%s_%s' % (xform.user.username, xform.id_string)
         }
-        limit = query_params.get('limit', False)
-        start = query_params.get('start', False)
-        count = query_params.get('count', False)
-
         try:
             query.update(json.loads(query_params.get('query', '{}')))
         except ValueError:
             raise ParseError(_("Invalid query: %(query)s"
                              % {'query': query_params.get('query')}))
 
-        query_kwargs = {
+        return {
             'query': json.dumps(query),
             'fields': query_params.get('fields'),
             'sort': query_params.get('sort')
         }
 
+    def _to_keyset_page(self, request, query_kwargs, limit):
+        """
+        The records after the `cursor` query parameter, with the link to the
+        next page, or None on the last one
+        """
+        after = decode_cursor(request.query_params.get('cursor'))
+        with data_query(query_kwargs):
+            records, keyset = ParsedInstance.query_mongo_keyset(
+                after=after, limit=int(limit) if limit else
+                ParsedInstance.DEFAULT_LIMIT, **query_kwargs)
+        next_url = None
+        if keyset is not None:
+            next_url = replace_query_param(
+                request.build_absolute_uri(), 'cursor',
+                encode_cursor(keyset))
+        return {
+            'next': next_url,
+            'results': [MongoHelper.to_readable_dict(record)
+                        for record in records],
+        }
+
+    def _to_count(self, xform, query_params, query_kwargs):
+        """
+        The number of records matching the query, estimated from a sample of
+        them with the `estimate` query parameter
+        """
+        estimate = query_params.get('estimate') == 'true'
+        with data_query(query_kwargs):
+            count, estimated = get_data_count(
+                xform, query_kwargs['query'], estimate=estimate)
+        if estimate:
+            return {'count': count, 'estimated': estimated}
+        return {'count': count}
+
+    def to_representation(self, obj):
+        request = self.context.get('request')
+
+        if not isinstance(obj, XForm):
+            return super(DataListSerializer, self).to_representation(obj)
+
+        query_params = (request and request.query_params) or {}
+        limit = query_params.get('limit', False)
+        start = query_params.get('start', False)
+        count = query_params.get('count', False)
+        query_kwargs = self.get_query_kwargs(obj, query_params)
+
+        # an opaque `cursor`, empty for the first page, pages through the
+        # records in linear time instead of skipping `start` records
+        if 'cursor' in query_params and not count:
+            return self._to_keyset_page(request, query_kwargs, limit)
+
         # if we want the count, we don't kwow to paginate the records.
         # start and limit are useless then.
         if count:
-            query_kwargs['count'] = True
-        else:
-            if limit:
-                query_kwargs['limit'] = int(limit)
+            return self._to_count(obj, query_params, query_kwargs)
 
-            if start:
-                query_kwargs['start'] = int(start)
+        if limit:
+            query_kwargs['limit'] = int(limit)
 
-        cursor = ParsedInstance.query_mongo_minimal(**query_kwargs)
+        if start:
+            query_kwargs['start'] = int(start)
 
-        # if we want the count, we only need the first index of the list.
-        if count:
-            return cursor[0]
-        else:
+        with data_query(query_kwargs):
+            cursor = ParsedInstance.query_mongo_minimal(**query_kwargs)
             return [MongoHelper.to_readable_dict(record) for record in cursor]
 
 
@@ -0,0 +1,60 @@
+from django.core.cache import cache
+from django.test import TestCase
+from django.test.utils import override_settings
+from mock import MagicMock
+
+from onadata.libs.exceptions import UnindexedQueryError
+from onadata.libs.utils.mongo_query_tools import MONGO_INDEXES_CACHE_KEY,\
+    QueryShape, limit_query_time
+
+
+INDEXES = [['_id'], ['_userform_id'], ['_userform_id', '_submission_time']]
+
+
+class TestMongoQueryTools(TestCase):
+    def setUp(self):
+        cache.set(MONGO_INDEXES_CACHE_KEY, INDEXES)
+
+    def tearDown(self):
+        cache.delete(MONGO_INDEXES_CACHE_KEY)
+
+    def test_query_shape(self):
+        shape = QueryShape(
+            {'_userform_id': 'bob_form', '_deleted_at': None,
+             '$or': [{'age': {'$gt': 5}}, {'name': 'Alice'}]},
+            {'_submission_time': -1})
+        self.assertEqual(shape.filter_fields, ['age', 'name'])
+        self.assertEqual(shape.sort, [['_submission_time', -1]])
+        self.assertTrue(shape.is_sort_indexed(INDEXES))
+        self.assertFalse(shape.is_filter_indexed(INDEXES))
+        self.assertEqual(shape.recommended_index(), [
+            ['_userform_id', 1], ['age', 1], ['name', 1],
+            ['_submission_time', -1]])
+
+        self.assertTrue(QueryShape({'_id': 5}).is_filter_indexed(INDEXES))
+        self.assertTrue(QueryShape(sort={'_id': 1}).is_sort_indexed(INDEXES))
+        self.assertFalse(
+            QueryShape(sort={'age': 1}).is_sort_indexed(INDEXES))
+
+    def test_limit_query_time(self):
+        cursor = MagicMock()
+        with override_settings(MONGO_QUERY_MAX_TIME_MS=100,
+                               MONGO_UNINDEXED_QUERY_MAX_TIME_MS=10):
+            limit_query_time(cursor, QueryShape(sort={'_id': 1}))
+            cursor.max_time_ms.assert_called_with(100)
+            limit_query_time(cursor, QueryShape({'age': 5}))
+            cursor.max_time_ms.assert_called_with(10)
+
+        cursor = MagicMock()
+        with override_settings(MONGO_STREAM_QUERY_MAX_TIME_MS=0):
+            limit_query_time(cursor, QueryShape({'age': 5}), stream=True)
+            self.assertFalse(cursor.max_time_ms.called)
+        with override_settings(MONGO_STREAM_QUERY_MAX_TIME_MS=1000):
+            limit_query_time(cursor, QueryShape({'age': 5}), stream=True)
+            cursor.max_time_ms.assert_called_with(1000)
+
+    @override_settings(MONGO_REJECT_UNINDEXED_SORTS=True)
+    def test_limit_query_time_rejects_unindexed_sorts(self):
+        with self.assertRaises(UnindexedQueryError):
+            limit_query_time(MagicMock(), QueryShape(sort={'age': 1}))
+        limit_query_time(MagicMock(), QueryShape(sort={'_submission_time': 1}))
@@ -0,0 +1,34 @@
+import zipfile
+import zlib
+from tempfile import NamedTemporaryFile
+
+from django.test import TestCase
+
+from onadata.libs.utils.zip_tools import DeflatedZipMember, write_file_to_zip
+
+
+class TestZipTools(TestCase):
+    def test_members_written_at_the_same_time(self):
+        members = [DeflatedZipMember('a.csv', spool_max_size=16),
+                   DeflatedZipMember('b.csv', zlib.Z_BEST_SPEED)]
+        for i in range(1000):
+            for member in members:
+                member.write('%s,%d\r\n' % (member.arcname, i))
+
+        with NamedTemporaryFile(suffix='.txt') as text_file:
+            text_file.write('text')
+            text_file.flush()
+            with NamedTemporaryFile(suffix='.zip') as temp_file:
+                with zipfile.ZipFile(temp_file.name, 'w') as zip_file:
+                    for member in members:
+                        member.write_to(zip_file)
+                    write_file_to_zip(zip_file, text_file.name, 'c.txt', 0)
+
+                with zipfile.ZipFile(temp_file.name) as zip_file:
+                    self.assertIsNone(zip_file.testzip())
+                    self.assertEqual(zip_file.namelist(),
+                                     ['a.csv', 'b.csv', 'c.txt'])
+                    lines = zip_file.read('b.csv').splitlines()
+                    self.assertEqual(len(lines), 1000)
+                    self.assertEqual(lines[-1], 'b.csv,999')
+                    self.assertEqual(zip_file.read('c.txt'), 'text')
@@ -0,0 +1,81 @@
+import json
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max, Min
+
+from onadata.apps.viewer.models.parsed_instance import ParsedInstance
+
+# Prefix of the cache keys of the counts of filtered queries
+DATA_COUNT_CACHE_PREFIX = 'data-count-'
+
+
+def get_filter_query(query):
+    """
+    The filters of `query`, a JSON string or dict as passed to
+    `ParsedInstance.query_mongo_minimal()`, without the `_userform_id` every
+    query of the submissions of a form has, normalized to a JSON string with
+    sorted keys, or None if it doesn't filter the submissions
+    """
+    if isinstance(query, basestring):
+        query = json.loads(query)
+    query = dict(query or {})
+    query.pop(ParsedInstance.USERFORM_ID, None)
+    return json.dumps(query, sort_keys=True) if query else None
+
+
+def get_count_cache_key(xform, filter_query):
+    return DATA_COUNT_CACHE_PREFIX + md5(
+        u'%s:%s' % (xform.pk, filter_query)).hexdigest()
+
+
+def estimate_data_count(xform, query):
+    """
+    Extrapolate the number of submissions of `xform` matching `query` from
+    those matching it among a sample of `DATA_COUNT_ESTIMATE_SAMPLE_SIZE`
+    submissions spread over the whole form, or count them if there are no
+    more
+
+    :returns: The count, and whether it is estimated
+    """
+    size = settings.DATA_COUNT_ESTIMATE_SAMPLE_SIZE
+    total = xform.num_of_submissions
+    if total <= size:
+        return ParsedInstance.count_mongo(query), False
+
+    id_range = xform.instances.aggregate(Min('pk'), Max('pk'))
+    ids = ParsedInstance.sample_mongo_ids({
+        ParsedInstance.USERFORM_ID:
+        u'%s_%s' % (xform.user.username, xform.id_string)},
+        size, (id_range['pk__min'], id_range['pk__max']))
+    if not ids:
+        return 0, True
+    count = ParsedInstance.count_mongo(query, ids=ids)
+    return int(round(count * float(total) / len(ids))), True
+
+
+def get_data_count(xform, query, estimate=False):
+    """
+    The number of submissions of `xform` matching `query`, and whether it is
+    estimated.
+
+    The count of all the submissions is the counter of the form. Those of
+    filtered queries are cached for `DATA_COUNT_CACHE_TIMEOUT` seconds, and,
+    with `estimate`, extrapolated from a sample on a cache miss instead of
+    counting every submission.
+    """
+    filter_query = get_filter_query(query)
+    if filter_query is None:
+        return xform.num_of_submissions, False
+
+    cache_key = get_count_cache_key(xform, filter_query)
+    count = cache.get(cache_key)
+    if count is not None:
+        return count, False
+    if estimate:
+        return estimate_data_count(xform, query)
+
+    count = ParsedInstance.count_mongo(query)
+    cache.set(cache_key, count, settings.DATA_COUNT_CACHE_TIMEOUT)
+    return count, False
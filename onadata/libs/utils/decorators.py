@@ -7,7 +7,13 @@ from django.conf import settings
 from django.http import HttpResponseRedirect
 from pymongo.cursor import Cursor
 
+from onadata.apps.api.mongo_helper import MongoKeyMap
 from onadata.apps.logger.models import XForm
+from onadata.libs.utils.cache_tools import LRUCache
+
+# The `MongoKeyMap`s of the forms, by primary key and modification date, so
+# that decoding the records of a query doesn't load the whole form
+form_key_maps = LRUCache(getattr(settings, 'SURVEY_CACHE_SIZE', 200))
 
 
 def check_obj(f):
@@ -43,34 +49,42 @@ def is_owner(view_func):
     return _wrapped_view
 
 
+def decode_mongo_field_names(record, field_names):
+    """
+    Rename the fields of a Mongo record, and of its repeats, from their
+    Mongo-safe names to the names of the form, given the `MongoKeyMap`
+    returned by `DataDictionary.get_mongo_key_map()` or the mapping returned
+    by `DataDictionary.get_mongo_field_names_dict()`.
+    """
+    if not isinstance(field_names, MongoKeyMap):
+        field_names = MongoKeyMap(field_names)
+    return field_names.decode_record(record)
+
+
+def get_form_mongo_key_map(username, id_string):
+    """
+    The `MongoKeyMap` of a form, built again once the form is modified
+    """
+    pk, date_modified = XForm.objects.filter(
+        id_string=id_string, user__username=username).values_list(
+        'pk', 'date_modified').get()
+    key = (pk, date_modified)
+    key_map = form_key_maps.get(key)
+    if key_map is None:
+        key_map = XForm.objects.get(pk=pk).data_dictionary()\
+            .get_mongo_key_map()
+        form_key_maps.set(key, key_map)
+    return key_map
+
+
 def apply_form_field_names(func):
     @wraps(func)
     def wrapper(*args, **kwargs):
-        def _get_decoded_record(record):
-            if isinstance(record, dict):
-                for field in record:
-                    if isinstance(record[field], list):
-                        tmp_items = []
-                        items = record[field]
-                        for item in items:
-                            tmp_items.append(_get_decoded_record(item))
-                        record[field] = tmp_items
-                    if field not in field_names.values() and \
-                            field in field_names.keys():
-                        record[field_names[field]] = record.pop(field)
-            return record
-
         cursor = func(*args, **kwargs)
         if isinstance(cursor, Cursor) and 'id_string' in kwargs and\
                 'username' in kwargs:
-            username = kwargs.get('username')
-            id_string = kwargs.get('id_string')
-            dd = XForm.objects.get(
-                id_string=id_string, user__username=username)
-            records = []
-            field_names = dd.data_dictionary().get_mongo_field_names_dict()
-            for record in cursor:
-                records.append(_get_decoded_record(record))
-            return records
+            key_map = get_form_mongo_key_map(
+                kwargs.get('username'), kwargs.get('id_string'))
+            return [key_map.decode_record(record) for record in cursor]
         return cursor
     return wrapper
@@ -1,12 +1,17 @@
 import csv
+from collections import defaultdict
 from datetime import datetime, date
+import hashlib
 import json
 import os
 import re
+import shutil
 import six
 import tempfile
+import zlib
+from itertools import chain
 from urlparse import urlparse
-from zipfile import ZipFile
+from zipfile import ZipFile, ZIP_DEFLATED, ZIP_STORED
 
 from bson import json_util
 from django.conf import settings
@@ -14,7 +19,10 @@ from django.core.files.base import File, ContentFile
 from django.core.files.temp import NamedTemporaryFile
 from django.core.files.storage import get_storage_class
 from django.contrib.auth.models import User
-from django.shortcuts import render_to_response
+from django.contrib.gis.geos import Polygon
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.html import escape
 from django.utils.text import slugify
 from openpyxl.date_time import SharedDate
 from openpyxl.workbook import Workbook
@@ -26,15 +34,23 @@ from json2xlsclient.client import Client
 from onadata.apps.logger.models import Attachment, Instance, XForm
 from onadata.apps.main.models.meta_data import MetaData
 from onadata.apps.viewer.models.export import Export
+from onadata.apps.viewer.models.cached_export import CachedExport
 from onadata.apps.api.mongo_helper import MongoHelper
-from onadata.libs.utils.viewer_tools import create_attachments_zipfile
+from onadata.libs.utils.viewer_tools import read_attachments
+from onadata.libs.utils.zip_tools import DeflatedZipMember, write_file_to_zip
 from onadata.libs.utils.common_tags import (
     ID, XFORM_ID_STRING, STATUS, ATTACHMENTS, GEOLOCATION, BAMBOO_DATASET_ID,
     DELETEDAT, USERFORM_ID, INDEX, PARENT_INDEX, PARENT_TABLE_NAME,
     SUBMISSION_TIME, UUID, TAGS, NOTES)
-from onadata.libs.exceptions import J2XException
+from onadata.libs.exceptions import J2XException, IncrementalExportError
 from .analyser_export import generate_analyser
 
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
 
 # this is Mongo Collection where we will store the parsed submissions
 xform_instances = settings.MONGO_DB.instances
@@ -47,6 +63,37 @@ MULTIPLE_SELECT_BIND_TYPE = u"select"
 GEOPOINT_BIND_TYPE = u"geopoint"
 
 
+def _parquet_unicode(value):
+    if value is None or isinstance(value, unicode):
+        return value
+    if isinstance(value, str):
+        return value.decode('utf-8')
+    return unicode(value)
+
+
+# Arrow type, and conversion to it, of the columns of the Parquet exports by
+# element type. Values of another type, e.g. answers `convert_type()` could
+# not convert, are written as nulls
+PARQUET_COLUMN_TYPES = {
+    'int': ('int64', lambda v: v if isinstance(v, six.integer_types) and
+            not isinstance(v, bool) else None),
+    'decimal': ('float64', lambda v: float(v) if isinstance(
+        v, (float, ) + six.integer_types) and not isinstance(v, bool)
+        else None),
+    'date': ('date32', lambda v: v.date() if isinstance(v, datetime) else
+             v if isinstance(v, date) else None),
+    # the choices of split select multiples
+    'boolean': ('bool_', lambda v: v if isinstance(v, bool) else None),
+    'binary': ('int8', lambda v: v if v in (0, 1) else None),
+    'string': ('string', _parquet_unicode),
+}
+PARQUET_EXTRA_FIELD_TYPES = {
+    ID: 'int',
+    INDEX: 'int',
+    PARENT_INDEX: 'int',
+}
+
+
 def encode_if_str(row, key, encode_dates=False):
     val = row.get(key)
 
@@ -66,6 +113,47 @@ def question_types_to_exclude(_type):
     return _type in QUESTION_TYPES_TO_EXCLUDE
 
 
+# Keys marking the dates and datetimes of the JSON lines of export shards,
+# which `json_util` doesn't round-trip
+SHARD_DATE_KEY = u'$shard_date'
+SHARD_DATETIME_KEY = u'$shard_datetime'
+
+
+def _encode_shard_value(value):
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            return json_util.default(value)
+        # isoformat(), unlike strftime(), handles the years before 1900
+        return {SHARD_DATETIME_KEY: value.isoformat()}
+    if isinstance(value, date):
+        return {SHARD_DATE_KEY: value.isoformat()}
+    return json_util.default(value)
+
+
+def _decode_shard_value(d):
+    if len(d) == 1:
+        if SHARD_DATETIME_KEY in d:
+            value = d[SHARD_DATETIME_KEY]
+            return datetime.strptime(
+                value, '%Y-%m-%dT%H:%M:%S.%f' if '.' in value
+                else '%Y-%m-%dT%H:%M:%S')
+        if SHARD_DATE_KEY in d:
+            return datetime.strptime(d[SHARD_DATE_KEY], '%Y-%m-%d').date()
+    return json_util.object_hook(d)
+
+
+def dump_shard_line(value):
+    """
+    A line of an export shard holding `value`, whose dates and datetimes
+    `load_shard_line()` reads back as such
+    """
+    return json.dumps(value, default=_encode_shard_value) + '\n'
+
+
+def load_shard_line(line):
+    return json.loads(line, object_hook=_decode_shard_value)
+
+
 class DictOrganizer(object):
 
     def set_dict_iterator(self, dict_iterator):
@@ -192,6 +280,15 @@ class ExportBuilder(object):
     }
 
     XLS_SHEET_NAME_MAX_CHARS = 31
+    # rows of a worksheet, headers included, past which a section continues
+    # on another worksheet
+    XLSX_MAX_ROWS = 1048576
+    # deflate level of the zipped exports, and whether they may exceed the
+    # 2 GiB and 65535 files limits of the zip format
+    ZIP_COMPRESS_LEVEL = zlib.Z_DEFAULT_COMPRESSION
+    ALLOW_ZIP64 = True
+    # rows of a section written to a Parquet file at once
+    PARQUET_ROW_GROUP_SIZE = 10000
 
     @classmethod
     def string_to_date_with_xls_validation(cls, date_str):
@@ -312,6 +409,27 @@ class ExportBuilder(object):
             main_section, self.survey, self.sections,
             self.select_multiples, self.gps_fields, self.encoded_fields,
             self.GROUP_DELIMITER)
+        self.section_plans = dict(
+            (section['name'], self._compile_section_plan(section))
+            for section in self.sections)
+
+    def _compile_section_plan(self, section):
+        """
+        Gather what `pre_process_row()` does to the rows of `section` into
+        lists of fields, so that rows don't look them up element by element
+        """
+        section_name = section['name']
+        return {
+            'encoded_fields': self.encoded_fields.get(
+                section_name, {}).items(),
+            'select_multiples': self.select_multiples.get(
+                section_name, {}).items(),
+            'gps_fields': self.gps_fields.get(section_name, {}).items(),
+            'converters': [
+                (element['xpath'], self.CONVERT_FUNCS[element['type']])
+                for element in section['elements']
+                if element['type'] in self.TYPES_TO_CONVERT],
+        }
 
     def section_by_name(self, name):
         matches = filter(lambda s: s['name'] == name, self.sections)
@@ -382,54 +500,52 @@ class ExportBuilder(object):
         """
         Split select multiples, gps and decode . and $
         """
-        section_name = section['name']
+        plan = self.section_plans[section['name']]
 
         # first decode fields so that subsequent lookups
         # have decoded field names
-        if section_name in self.encoded_fields:
-            row = ExportBuilder.decode_mongo_encoded_fields(
-                row, self.encoded_fields[section_name])
-
-        if self.SPLIT_SELECT_MULTIPLES and\
-                section_name in self.select_multiples:
-            row = ExportBuilder.split_select_multiples(
-                row, self.select_multiples[section_name])
-
-        if section_name in self.gps_fields:
-            row = ExportBuilder.split_gps_components(
-                row, self.gps_fields[section_name])
-
-        # convert to native types
-        for elm in section['elements']:
-            # only convert if its in our list and its not empty, just to
-            # optimize
-            value = row.get(elm['xpath'])
-            if elm['type'] in ExportBuilder.TYPES_TO_CONVERT\
-                    and value is not None and value != '':
-                row[elm['xpath']] = ExportBuilder.convert_type(
-                    value, elm['type'])
-
-        return row
+        for xpath, encoded_xpath in plan['encoded_fields']:
+            if row.get(encoded_xpath):
+                row[xpath] = row.pop(encoded_xpath)
+
+        if self.SPLIT_SELECT_MULTIPLES:
+            # like `split_select_multiples()`, which is called on the class
+            binary = ExportBuilder.BINARY_SELECT_MULTIPLES
+            for xpath, choices in plan['select_multiples']:
+                data = row.get(xpath)
+                selections = set(
+                    u'{0}/{1}'.format(xpath, selection)
+                    for selection in data.split()) if data else None
+                if binary:
+                    for choice in choices:
+                        row[choice] = 1 if selections and\
+                            choice in selections else 0
+                else:
+                    for choice in choices:
+                        row[choice] = choice in selections\
+                            if selections else None
 
-    def to_zipped_csv(self, path, data, *args):
-        def write_row(row, csv_writer, fields):
-            csv_writer.writerow(
-                [encode_if_str(row, field) for field in fields])
+        for xpath, gps_components in plan['gps_fields']:
+            data = row.get(xpath)
+            if data:
+                row.update(zip(gps_components, data.split()))
 
-        csv_defs = {}
-        for section in self.sections:
-            csv_file = NamedTemporaryFile(suffix=".csv")
-            csv_writer = csv.writer(csv_file)
-            csv_defs[section['name']] = {
-                'csv_file': csv_file, 'csv_writer': csv_writer}
+        # convert to native types, only if not empty
+        for xpath, func in plan['converters']:
+            value = row.get(xpath)
+            if value is not None and value != '':
+                try:
+                    row[xpath] = func(value)
+                except ValueError:
+                    pass
 
-        # write headers
-        for section in self.sections:
-            fields = [element['title'] for element in section['elements']]\
-                + self.EXTRA_FIELDS
-            csv_defs[section['name']]['csv_writer'].writerow(
-                [f.encode('utf-8') for f in fields])
+        return row
 
+    def iter_section_rows(self, data):
+        """
+        Yield the section and the pre-processed row of every row exported
+        from the records in `data`, in order
+        """
         index = 1
         indices = {}
         survey_name = self.survey.name
@@ -446,38 +562,166 @@ class ExportBuilder(object):
             output[survey_name][INDEX] = index
             output[survey_name][PARENT_INDEX] = -1
             for section in self.sections:
-                # get data for this section and write to csv
-                section_name = section['name']
-                csv_def = csv_defs[section_name]
-                fields = [
-                    element['xpath'] for element in
-                    section['elements']] + self.EXTRA_FIELDS
-                csv_writer = csv_def['csv_writer']
-                # section name might not exist within the output, e.g. data was
-                # not provided for said repeat - write test to check this
-                row = output.get(section_name, None)
+                # section name might not exist within the output, e.g. data
+                # was not provided for said repeat
+                row = output.get(section['name'], None)
                 if type(row) == dict:
-                    write_row(
-                        self.pre_process_row(row, section),
-                        csv_writer, fields)
+                    yield section, self.pre_process_row(row, section)
                 elif type(row) == list:
                     for child_row in row:
-                        write_row(
-                            self.pre_process_row(child_row, section),
-                            csv_writer, fields)
+                        yield section, self.pre_process_row(child_row, section)
             index += 1
 
+    def section_fields(self):
+        """
+        Map the name of every section to the xpaths of its columns
+        """
+        return dict(
+            (section['name'],
+             [element['xpath'] for element in section['elements']] +
+             self.EXTRA_FIELDS)
+            for section in self.sections)
+
+    def to_export_shard(self, shard_file, data):
+        """
+        Write the rows exported from `data`, one shard of the records of an
+        export, as JSON lines, to be merged with the other shards by
+        `iter_shard_rows()`
+        """
+        section_fields = self.section_fields()
+        for section, row in self.iter_section_rows(data):
+            fields = section_fields[section['name']]
+            shard_file.write(dump_shard_line(
+                [section['name'], [row.get(field) for field in fields]]))
+
+    def iter_shard_rows(self, shard_files):
+        """
+        Yield the section and the row of every row written by
+        `to_export_shard()` in `shard_files`, in order, renumbering their
+        indices to follow the rows of the previous shards
+        """
+        sections = dict((section['name'], section)
+                        for section in self.sections)
+        section_fields = self.section_fields()
+        offsets = defaultdict(int)
+        for shard_file in shard_files:
+            counts = defaultdict(int)
+            for line in shard_file:
+                section_name, values = load_shard_line(line)
+                row = dict(zip(section_fields[section_name], values))
+                counts[section_name] += 1
+                yield sections[section_name], self.offset_row_indices(
+                    section_name, row, offsets)
+            for section_name, count in counts.iteritems():
+                offsets[section_name] += count
+
+    @classmethod
+    def offset_row_indices(cls, section_name, row, offsets):
+        """
+        Shift the index of `row`, and of its parent row, by the number of
+        rows of their sections in `offsets`
+        """
+        row[INDEX] += offsets[section_name]
+        if row.get(PARENT_TABLE_NAME) is not None:
+            row[PARENT_INDEX] += offsets[
+                MongoHelper.decode(row[PARENT_TABLE_NAME])]
+        return row
+
+    @classmethod
+    def _csv_filename(cls, section):
+        return "_".join(section['name'].split("/")) + ".csv"
+
+    def _csv_header(self, section):
+        fields = [element['title'] for element in section['elements']]\
+            + self.EXTRA_FIELDS
+        return [f.encode('utf-8') for f in fields]
+
+    def to_zipped_csv(self, path, data, *args):
+        self._write_zipped_csv(path, self.iter_section_rows(data))
+
+    def shards_to_zipped_csv(self, path, shard_files):
+        self._write_zipped_csv(path, self.iter_shard_rows(shard_files))
+
+    def append_to_zipped_csv(self, path, previous_path, data):
+        """
+        Write the zipped CSV export at `previous_path` followed by the rows
+        exported from `data`, the records submitted since
+
+        :raises IncrementalExportError: If the sections or the columns of
+            the previous export differ, e.g. the form was replaced
+        """
+        with ZipFile(previous_path) as previous_zip:
+            for section in self.sections:
+                try:
+                    with previous_zip.open(self._csv_filename(section)) as f:
+                        header = next(csv.reader(f), None)
+                except KeyError:
+                    header = None
+                if header != self._csv_header(section):
+                    raise IncrementalExportError(
+                        "The columns of %s changed" % section['name'])
+
+            offsets = defaultdict(int)
+
+            def _append_rows():
+                for section, row in self.iter_section_rows(data):
+                    yield section, self.offset_row_indices(
+                        section['name'], row, offsets)
+
+            self._write_zipped_csv(
+                path, _append_rows(), previous_zip, offsets)
+
+    def _write_zipped_csv(self, path, section_rows, previous_zip=None,
+                          offsets=None):
+        """
+        :param previous_zip: Optional zipped CSV export whose rows are copied
+            before `section_rows`, counting them in `offsets`
+        """
+        def write_row(row, csv_writer, fields):
+            csv_writer.writerow(
+                [encode_if_str(row, field) for field in fields])
+
+        def copy_lines(lines, csv_file):
+            for line in lines:
+                csv_file.write(line)
+                yield line
+
+        # the rows of every section are deflated as they are written and
+        # only copied into the zip file at the end
+        csv_defs = {}
+        for section in self.sections:
+            csv_file = DeflatedZipMember(
+                self._csv_filename(section), self.ZIP_COMPRESS_LEVEL)
+            csv_writer = csv.writer(csv_file)
+            csv_defs[section['name']] = {
+                'csv_file': csv_file, 'csv_writer': csv_writer}
+
+        # write headers, or copy the previous rows
+        for section in self.sections:
+            csv_def = csv_defs[section['name']]
+            if previous_zip is None:
+                csv_def['csv_writer'].writerow(self._csv_header(section))
+                continue
+            with previous_zip.open(self._csv_filename(section)) as f:
+                # count rows rather than lines, values may span lines
+                rows = csv.reader(copy_lines(f, csv_def['csv_file']))
+                offsets[section['name']] = sum(1 for _ in rows) - 1
+
+        section_fields = self.section_fields()
+        for section, row in section_rows:
+            write_row(row, csv_defs[section['name']]['csv_writer'],
+                      section_fields[section['name']])
+
         # write zipfile
-        with ZipFile(path, 'w') as zip_file:
+        try:
+            with ZipFile(path, 'w', ZIP_DEFLATED,
+                         allowZip64=self.ALLOW_ZIP64) as zip_file:
+                for section in self.sections:
+                    csv_defs[section['name']]['csv_file'].write_to(zip_file)
+        finally:
+            # close files when we are done
             for section_name, csv_def in csv_defs.iteritems():
-                csv_file = csv_def['csv_file']
-                csv_file.seek(0)
-                zip_file.write(
-                    csv_file.name, "_".join(section_name.split("/")) + ".csv")
-
-        # close files when we are done
-        for section_name, csv_def in csv_defs.iteritems():
-            csv_def['csv_file'].close()
+                csv_def['csv_file'].close()
 
     @classmethod
     def get_valid_sheet_name(cls, desired_name, existing_names):
@@ -502,69 +746,59 @@ class ExportBuilder(object):
         return generated_name
 
     def to_xls_export(self, path, data, *args):
-        def write_row(data, work_sheet, fields, work_sheet_titles):
-            # update parent_table with the generated sheet's title
-            data[PARENT_TABLE_NAME] = work_sheet_titles.get(
-                data.get(PARENT_TABLE_NAME))
-            work_sheet.append([data.get(f) for f in fields])
+        self._write_xls_export(path, self.iter_section_rows(data))
+
+    def shards_to_xls_export(self, path, shard_files):
+        self._write_xls_export(path, self.iter_shard_rows(shard_files))
 
+    def _write_xls_export(self, path, section_rows):
+        """
+        Stream the rows into the write-only worksheets of each section, which
+        openpyxl spools to temporary files, deduplicating strings in the
+        shared strings table. A section longer than `XLSX_MAX_ROWS` continues
+        on worksheets suffixed with _2, _3... which repeat the headers.
+        """
         wb = Workbook(optimized_write=True)
         work_sheets = {}
         # map of section_names to generated_names
         work_sheet_titles = {}
-        for section in self.sections:
-            section_name = section['name']
-            work_sheet_title = ExportBuilder.get_valid_sheet_name(
-                "_".join(section_name.split("/")), work_sheet_titles.values())
-            work_sheet_titles[section_name] = work_sheet_title
-            work_sheets[section_name] = wb.create_sheet(
-                title=work_sheet_title)
+        sheet_titles = []
+        headers = {}
+        # rows in the current worksheet and number of worksheets per section
+        row_counts = {}
+        sheet_counts = {}
+
+        def add_work_sheet(section_name, title):
+            title = ExportBuilder.get_valid_sheet_name(title, sheet_titles)
+            sheet_titles.append(title)
+            work_sheets[section_name] = wb.create_sheet(title=title)
+            work_sheets[section_name].append(headers[section_name])
+            row_counts[section_name] = 1
+            sheet_counts[section_name] = sheet_counts.get(section_name, 0) + 1
+            return title
 
-        # write the headers
         for section in self.sections:
             section_name = section['name']
-            headers = [
+            headers[section_name] = [
                 element['title'] for element in
                 section['elements']] + self.EXTRA_FIELDS
-            # get the worksheet
-            ws = work_sheets[section_name]
-            ws.append(headers)
+            work_sheet_titles[section_name] = add_work_sheet(
+                section_name, "_".join(section_name.split("/")))
 
-        index = 1
-        indices = {}
-        survey_name = self.survey.name
-        for d in data:
-            joined_export = dict_to_joined_export(d, index, indices,
-                                                  survey_name)
-            output = ExportBuilder.decode_mongo_encoded_section_names(
-                joined_export)
-            # attach meta fields (index, parent_index, parent_table)
-            # output has keys for every section
-            if survey_name not in output:
-                output[survey_name] = {}
-            output[survey_name][INDEX] = index
-            output[survey_name][PARENT_INDEX] = -1
-            for section in self.sections:
-                # get data for this section and write to xls
-                section_name = section['name']
-                fields = [
-                    element['xpath'] for element in
-                    section['elements']] + self.EXTRA_FIELDS
-
-                ws = work_sheets[section_name]
-                # section might not exist within the output, e.g. data was
-                # not provided for said repeat - write test to check this
-                row = output.get(section_name, None)
-                if type(row) == dict:
-                    write_row(
-                        self.pre_process_row(row, section),
-                        ws, fields, work_sheet_titles)
-                elif type(row) == list:
-                    for child_row in row:
-                        write_row(
-                            self.pre_process_row(child_row, section),
-                            ws, fields, work_sheet_titles)
-            index += 1
+        section_fields = self.section_fields()
+        for section, row in section_rows:
+            section_name = section['name']
+            if row_counts[section_name] >= self.XLSX_MAX_ROWS:
+                add_work_sheet(section_name, "{0}_{1}".format(
+                    work_sheet_titles[section_name],
+                    sheet_counts[section_name] + 1))
+            # update parent_table with the generated sheet's title, the first
+            # one of the parent section
+            row[PARENT_TABLE_NAME] = work_sheet_titles.get(
+                row.get(PARENT_TABLE_NAME))
+            work_sheets[section_name].append(
+                [row.get(f) for f in section_fields[section_name]])
+            row_counts[section_name] += 1
 
         wb.save(filename=path)
 
@@ -602,8 +836,92 @@ class ExportBuilder(object):
             self.SPLIT_SELECT_MULTIPLES, self.BINARY_SELECT_MULTIPLES)
         csv_builder.export_to(path)
 
+    def _parquet_columns(self, section):
+        """
+        :returns: The header, Arrow type and conversion of every column of
+            `section`
+        """
+        choices = set(chain.from_iterable(
+            self.select_multiples.get(section['name'], {}).values()))
+        # like `pre_process_row()`
+        choice_type = 'binary' if ExportBuilder.BINARY_SELECT_MULTIPLES\
+            else 'boolean'
+        columns = [
+            (element['title'], choice_type if element['xpath'] in choices
+             else element['type'])
+            for element in section['elements']] + [
+            (field, PARQUET_EXTRA_FIELD_TYPES.get(field, 'string'))
+            for field in self.EXTRA_FIELDS]
+        return [
+            (title,) + PARQUET_COLUMN_TYPES.get(
+                column_type, PARQUET_COLUMN_TYPES['string'])
+            for title, column_type in columns]
+
+    def to_zipped_parquet(self, path, data, *args):
+        """
+        Write a Parquet file per section, typed from the survey, in row
+        groups of `PARQUET_ROW_GROUP_SIZE` rows, and zip them
+        """
+        if pyarrow is None:
+            raise RuntimeError('Parquet exports require pyarrow.')
+
+        def write_row_group(parquet_def):
+            arrays = [
+                pyarrow.array(values, type=field.type)
+                for values, field in zip(
+                    parquet_def['values'], parquet_def['schema'])]
+            parquet_def['writer'].write_table(pyarrow.Table.from_arrays(
+                arrays, schema=parquet_def['schema']))
+            parquet_def['values'] = [[] for _ in arrays]
+
+        parquet_defs = {}
+        try:
+            for section in self.sections:
+                columns = self._parquet_columns(section)
+                schema = pyarrow.schema([
+                    pyarrow.field(title, getattr(pyarrow, type_name)())
+                    for title, type_name, _ in columns])
+                parquet_file = NamedTemporaryFile(suffix=".parquet")
+                parquet_defs[section['name']] = {
+                    'parquet_file': parquet_file,
+                    'writer': pyarrow.parquet.ParquetWriter(
+                        parquet_file.name, schema),
+                    'schema': schema,
+                    'converters': [convert for _, _, convert in columns],
+                    'values': [[] for _ in columns]}
+
+            # rows are buffered column by column until a row group is full
+            section_fields = self.section_fields()
+            for section, row in self.iter_section_rows(data):
+                parquet_def = parquet_defs[section['name']]
+                for values, field, convert in zip(
+                        parquet_def['values'],
+                        section_fields[section['name']],
+                        parquet_def['converters']):
+                    values.append(convert(row.get(field)))
+                if len(parquet_def['values'][0]) >=\
+                        self.PARQUET_ROW_GROUP_SIZE:
+                    write_row_group(parquet_def)
+
+            for section in self.sections:
+                parquet_def = parquet_defs[section['name']]
+                if parquet_def['values'][0]:
+                    write_row_group(parquet_def)
+                parquet_def['writer'].close()
+
+            # Parquet files are already compressed
+            with ZipFile(path, 'w', ZIP_STORED,
+                         allowZip64=self.ALLOW_ZIP64) as zip_file:
+                for section in self.sections:
+                    zip_file.write(
+                        parquet_defs[section['name']]['parquet_file'].name,
+                        "_".join(section['name'].split("/")) + ".parquet")
+        finally:
+            for parquet_def in parquet_defs.values():
+                parquet_def['parquet_file'].close()
+
     def to_zipped_sav(self, path, data, *args):
-        def write_row(row, csv_writer, fields):
+        def write_row(row, sav_writer, fields):
             sav_writer.writerow(
                 [encode_if_str(row, field, True) for field in fields])
 
@@ -639,56 +957,31 @@ class ExportBuilder(object):
             sav_defs[section['name']] = {
                 'sav_file': sav_file, 'sav_writer': sav_writer}
 
-        index = 1
-        indices = {}
-        survey_name = self.survey.name
-        for d in data:
-            # decode mongo section names
-            joined_export = dict_to_joined_export(d, index, indices,
-                                                  survey_name)
-            output = ExportBuilder.decode_mongo_encoded_section_names(
-                joined_export)
-            # attach meta fields (index, parent_index, parent_table)
-            # output has keys for every section
-            if survey_name not in output:
-                output[survey_name] = {}
-            output[survey_name][INDEX] = index
-            output[survey_name][PARENT_INDEX] = -1
-            for section in self.sections:
-                # get data for this section and write to csv
-                section_name = section['name']
-                sav_def = sav_defs[section_name]
-                fields = [
-                    element['xpath'] for element in
-                    section['elements']] + self.EXTRA_FIELDS
-                sav_writer = sav_def['sav_writer']
-                row = output.get(section_name, None)
-                if type(row) == dict:
-                    write_row(
-                        self.pre_process_row(row, section),
-                        sav_writer, fields)
-                elif type(row) == list:
-                    for child_row in row:
-                        write_row(
-                            self.pre_process_row(child_row, section),
-                            sav_writer, fields)
-            index += 1
+        section_fields = self.section_fields()
+        for section, row in self.iter_section_rows(data):
+            write_row(row, sav_defs[section['name']]['sav_writer'],
+                      section_fields[section['name']])
 
         for section_name, sav_def in sav_defs.iteritems():
             sav_def['sav_writer'].closeSavFile(
                 sav_def['sav_writer'].fh, mode='wb')
 
-        # write zipfile
-        with ZipFile(path, 'w') as zip_file:
+        # write zipfile, the SPSS library only writes to files so each one is
+        # removed as soon as it is zipped
+        try:
+            with ZipFile(path, 'w', ZIP_DEFLATED,
+                         allowZip64=self.ALLOW_ZIP64) as zip_file:
+                for section in self.sections:
+                    sav_file = sav_defs.pop(section['name'])['sav_file']
+                    write_file_to_zip(
+                        zip_file, sav_file.name,
+                        "_".join(section['name'].split("/")) + ".sav",
+                        self.ZIP_COMPRESS_LEVEL)
+                    sav_file.close()
+        finally:
+            # close files when we are done
             for section_name, sav_def in sav_defs.iteritems():
-                sav_file = sav_def['sav_file']
-                sav_file.seek(0)
-                zip_file.write(
-                    sav_file.name, "_".join(section_name.split("/")) + ".sav")
-
-        # close files when we are done
-        for section_name, sav_def in sav_defs.iteritems():
-            sav_def['sav_file'].close()
+                sav_def['sav_file'].close()
 
 
 def dict_to_flat_export(d, parent_index=0):
@@ -702,28 +995,47 @@ def generate_export(export_type, extension, username, id_string,
     """
     Create appropriate export object given the export type
     """
+    if export_type in INCREMENTAL_EXPORT_TYPES and filter_query is None:
+        return generate_incremental_export(
+            export_type, extension, username, id_string, export_id,
+            group_delimiter, split_select_multiples, binary_select_multiples)
 
     export_type_func_map = {
         Export.XLS_EXPORT: 'to_xls_export',
         Export.CSV_EXPORT: 'to_flat_csv_export',
         Export.CSV_ZIP_EXPORT: 'to_zipped_csv',
         Export.SAV_ZIP_EXPORT: 'to_zipped_sav',
+        Export.PARQUET_ZIP_EXPORT: 'to_zipped_parquet',
         Export.ANALYSER_EXPORT: 'to_analyser_export'
     }
 
     xform = XForm.objects.get(
         user__username__iexact=username, id_string__exact=id_string)
 
+    # exports of filter queries are not kept as `Export`s, but shared
+    # through the export cache
+    cache_key = None
+    if filter_query is not None and settings.EXPORT_CACHE_MAX_SIZE:
+        cache_key = export_cache_key(
+            xform, export_type, extension, filter_query, {
+                'group_delimiter': group_delimiter,
+                'split_select_multiples': split_select_multiples,
+                'binary_select_multiples': binary_select_multiples,
+            })
+        cached_export = get_cached_export(xform, cache_key)
+        if cached_export is not None:
+            return export_from_cache(
+                xform, export_type, cached_export, export_id)
+
     # query mongo for the cursor
     records = query_mongo(username, id_string, filter_query)
 
-    export_builder = ExportBuilder()
-    export_builder.GROUP_DELIMITER = group_delimiter
-    export_builder.SPLIT_SELECT_MULTIPLES = split_select_multiples
-    export_builder.BINARY_SELECT_MULTIPLES = binary_select_multiples
-    export_builder.set_survey(xform.data_dictionary().survey)
+    export_builder = get_export_builder(
+        xform, group_delimiter, split_select_multiples,
+        binary_select_multiples)
 
-    prefix = slugify('{}_export__{}__{}'.format(export_type, username, id_string))
+    prefix = slugify(
+        '{}_export__{}__{}'.format(export_type, username, id_string))
     temp_file = NamedTemporaryFile(prefix=prefix, suffix=("." + extension))
 
     # get the export function by export type
@@ -732,6 +1044,109 @@ def generate_export(export_type, extension, username, id_string,
     func.__call__(
         temp_file.name, records, username, id_string, filter_query)
 
+    return save_export_file(
+        xform, export_type, extension, temp_file, export_id, filter_query,
+        cache_key)
+
+
+def export_cache_key(xform, export_type, extension, filter_query, options):
+    """
+    Hash everything the content of an export depends on: the form, the
+    normalized filter query, the export type and options, and the last
+    change to the submissions
+    """
+    query = json.loads(filter_query, object_hook=json_util.object_hook)\
+        if filter_query else {}
+    time_of_last_submission = xform.time_of_last_submission_update()
+    key = json.dumps({
+        'xform': [xform.pk, xform.hash],
+        'query': query,
+        'export_type': export_type,
+        'extension': extension,
+        'options': options,
+        # the count catches submissions deleted for good
+        'submissions': [
+            time_of_last_submission.isoformat()
+            if time_of_last_submission else None,
+            xform.instances.count()],
+    }, sort_keys=True, default=json_util.default)
+    return hashlib.sha256(key).hexdigest()
+
+
+def get_cached_export(xform, cache_key):
+    try:
+        cached_export = CachedExport.objects.get(xform=xform, key=cache_key)
+    except CachedExport.DoesNotExist:
+        return None
+    if not get_storage_class()().exists(cached_export.filepath):
+        cached_export.delete()
+        return None
+    CachedExport.objects.filter(pk=cached_export.pk).update(
+        last_used=timezone.now())
+    return cached_export
+
+
+def export_from_cache(xform, export_type, cached_export, export_id=None):
+    """
+    Same as `save_export_file()` for a filter query, with the file of
+    `cached_export`
+    """
+    if export_id:
+        export = Export.objects.get(id=export_id)
+    else:
+        export = Export(xform=xform, export_type=export_type)
+    export.filedir, export.filename = os.path.split(cached_export.filepath)
+    export.internal_status = Export.SUCCESSFUL
+    return export
+
+
+def cache_export_file(xform, export_type, cache_key, export_filename, size):
+    """
+    Add the saved file of an export to the export cache and evict the least
+    recently used entries beyond the limits
+
+    :returns: The path of the cached file, another one if an identical
+        export was cached meanwhile
+    """
+    try:
+        # in a savepoint, requests are atomic
+        with transaction.atomic():
+            cached_export = CachedExport.objects.create(
+                xform=xform, key=cache_key, export_type=export_type,
+                filepath=export_filename, size=size)
+    except IntegrityError:
+        cached_export = CachedExport.objects.get(key=cache_key)
+        get_storage_class()().delete(export_filename)
+    else:
+        CachedExport.evict(
+            settings.EXPORT_CACHE_MAX_SIZE, settings.EXPORT_CACHE_MAX_ENTRIES,
+            keep=cached_export)
+    return cached_export.filepath
+
+
+def get_export_builder(xform, group_delimiter='/',
+                       split_select_multiples=True,
+                       binary_select_multiples=False):
+    export_builder = ExportBuilder()
+    export_builder.GROUP_DELIMITER = group_delimiter
+    export_builder.SPLIT_SELECT_MULTIPLES = split_select_multiples
+    export_builder.BINARY_SELECT_MULTIPLES = binary_select_multiples
+    export_builder.ZIP_COMPRESS_LEVEL = settings.EXPORT_ZIP_COMPRESS_LEVEL
+    export_builder.set_survey(xform.data_dictionary().survey)
+    return export_builder
+
+
+def save_export_file(xform, export_type, extension, temp_file,
+                     export_id=None, filter_query=None, cache_key=None):
+    """
+    Save the generated `temp_file` to the storage and mark its export as
+    successful
+
+    :param cache_key: Optional key of the export in the export cache
+    """
+    username = xform.user.username
+    id_string = xform.id_string
+
     # generate filename
     basename = "%s_%s" % (
         id_string, datetime.now().strftime("%Y_%m_%d_%H_%M_%S"))
@@ -744,21 +1159,32 @@ def generate_export(export_type, extension, username, id_string,
     while not Export.is_filename_unique(xform, filename):
         filename = increment_index_in_filename(filename)
 
+    # seek to the beginning as required by storage classes
+    temp_file.seek(0)
+    size = os.path.getsize(temp_file.name)
+    if size > settings.EXPORT_CACHE_MAX_SIZE:
+        # it would be evicted at once, so it isn't saved in the cache
+        cache_key = None
+
     file_path = os.path.join(
         username,
         'exports',
         id_string,
         export_type,
         filename)
+    if cache_key is not None:
+        file_path = os.path.join(
+            os.path.dirname(file_path), 'cache', cache_key, filename)
 
     # TODO: if s3 storage, make private - how will we protect local storage??
     storage = get_storage_class()()
-    # seek to the beginning as required by storage classes
-    temp_file.seek(0)
     export_filename = storage.save(
         file_path,
         File(temp_file, file_path))
     temp_file.close()
+    if cache_key is not None:
+        export_filename = cache_export_file(
+            xform, export_type, cache_key, export_filename, size)
 
     dir_name, basename = os.path.split(export_filename)
 
@@ -776,7 +1202,12 @@ def generate_export(export_type, extension, username, id_string,
     return export
 
 
-def query_mongo(username, id_string, query=None, hide_deleted=True):
+def query_mongo(username, id_string, query=None, hide_deleted=True,
+                fields=None, id_range=None):
+    """
+    :param id_range: Optional first and last `_id` of the records, or None
+        for no last one, which are then sorted by `_id`
+    """
     query = json.loads(query, object_hook=json_util.object_hook)\
         if query else {}
     query = MongoHelper.to_safe_dict(query)
@@ -785,7 +1216,321 @@ def query_mongo(username, id_string, query=None, hide_deleted=True):
         # display only active elements
         # join existing query with deleted_at_query on an $and
         query = {"$and": [query, {"_deleted_at": None}]}
-    return xform_instances.find(query)
+    if id_range is not None:
+        id_query = {"$gte": id_range[0]}
+        if id_range[1] is not None:
+            id_query["$lte"] = id_range[1]
+        query = {"$and": [query, {ID: id_query}]}
+        return xform_instances.find(query, fields).sort(ID, 1)
+    return xform_instances.find(query, fields)
+
+
+# export types which can be generated in shards by several workers, with
+# their extension
+SHARDED_EXPORT_TYPES = {
+    Export.CSV_EXPORT: 'csv',
+    Export.CSV_ZIP_EXPORT: 'zip',
+    Export.XLS_EXPORT: 'xlsx',
+}
+
+
+def should_shard_export(xform, export_type):
+    shard_size = settings.EXPORT_SHARD_SIZE
+    return bool(shard_size) and export_type in SHARDED_EXPORT_TYPES and\
+        xform.num_of_submissions > shard_size
+
+
+def plan_export_shards(username, id_string, filter_query=None,
+                       shard_size=None):
+    """
+    Split the records of an export into shards of `shard_size` records
+
+    :returns: The first and last `_id` of the records of every shard
+    """
+    shard_size = shard_size or settings.EXPORT_SHARD_SIZE
+    shards = []
+    cursor = query_mongo(
+        username, id_string, filter_query, fields=[ID]).sort(ID, 1)
+    for i, record in enumerate(cursor):
+        if i % shard_size == 0:
+            shards.append([record[ID], record[ID]])
+        else:
+            shards[-1][1] = record[ID]
+    return shards
+
+
+def _export_shard_path(username, id_string, export_type, export_id,
+                       shard_index, extension):
+    return os.path.join(
+        username, 'exports', id_string, export_type, 'shards',
+        '%s_%d.%s' % (export_id, shard_index, extension))
+
+
+def generate_export_shard(export_type, username, id_string, export_id,
+                          shard_index, id_range, filter_query=None,
+                          group_delimiter='/', split_select_multiples=True,
+                          binary_select_multiples=False):
+    """
+    Generate the rows of the records whose `_id` is within `id_range` and
+    save them to the storage
+
+    :returns: The storage paths of the shard and, for CSV exports, of its
+        columns
+    """
+    storage = get_storage_class()()
+    columns_path = None
+    try:
+        with NamedTemporaryFile(suffix='.jsonl') as shard_file:
+            if export_type == Export.CSV_EXPORT:
+                # TODO resolve circular import
+                from onadata.apps.viewer.pandas_mongo_bridge import\
+                    CSVDataFrameBuilder
+
+                csv_builder = CSVDataFrameBuilder(
+                    username, id_string, filter_query, group_delimiter,
+                    split_select_multiples, binary_select_multiples)
+                columns = csv_builder.export_shard_to(shard_file, id_range)
+                columns_path = storage.save(
+                    _export_shard_path(username, id_string, export_type,
+                                       export_id, shard_index, 'json'),
+                    ContentFile(json.dumps(columns)))
+            else:
+                xform = XForm.objects.get(
+                    user__username__iexact=username,
+                    id_string__exact=id_string)
+                export_builder = get_export_builder(
+                    xform, group_delimiter, split_select_multiples,
+                    binary_select_multiples)
+                export_builder.to_export_shard(shard_file, query_mongo(
+                    username, id_string, filter_query, id_range=id_range))
+            shard_file.seek(0)
+            shard_path = storage.save(
+                _export_shard_path(username, id_string, export_type,
+                                   export_id, shard_index, 'jsonl'),
+                File(shard_file))
+    except Exception:
+        # don't leave the columns of a shard which failed behind
+        if columns_path and storage.exists(columns_path):
+            storage.delete(columns_path)
+        raise
+    return {'shard': shard_path, 'columns': columns_path}
+
+
+def generate_export_from_shards(export_type, username, id_string, export_id,
+                                shards, filter_query=None,
+                                group_delimiter='/',
+                                split_select_multiples=True,
+                                binary_select_multiples=False):
+    """
+    Merge the shards returned by `generate_export_shard()`, in order, into
+    the file of the export
+    """
+    xform = XForm.objects.get(
+        user__username__iexact=username, id_string__exact=id_string)
+    storage = get_storage_class()()
+
+    def _open_shards():
+        for shard in shards:
+            # the shards are read one at a time, from a local copy since
+            # remote storages don't stream
+            with NamedTemporaryFile(suffix='.jsonl') as shard_file:
+                with storage.open(shard['shard'], 'rb') as f:
+                    shutil.copyfileobj(f, shard_file)
+                shard_file.seek(0)
+                yield shard_file
+
+    extension = SHARDED_EXPORT_TYPES[export_type]
+    prefix = slugify('{}_export__{}__{}'.format(export_type, username, id_string))
+    temp_file = NamedTemporaryFile(prefix=prefix, suffix=("." + extension))
+    if export_type == Export.CSV_EXPORT:
+        # TODO resolve circular import
+        from onadata.apps.viewer.pandas_mongo_bridge import\
+            CSVDataFrameBuilder
+
+        shard_columns = []
+        for shard in shards:
+            with storage.open(shard['columns']) as f:
+                shard_columns.append(json.load(f))
+        csv_builder = CSVDataFrameBuilder(
+            username, id_string, filter_query, group_delimiter,
+            split_select_multiples, binary_select_multiples)
+        csv_builder.export_shards_to(
+            temp_file.name, _open_shards(), shard_columns)
+    else:
+        export_builder = get_export_builder(
+            xform, group_delimiter, split_select_multiples,
+            binary_select_multiples)
+        if export_type == Export.CSV_ZIP_EXPORT:
+            export_builder.shards_to_zipped_csv(
+                temp_file.name, _open_shards())
+        else:
+            export_builder.shards_to_xls_export(
+                temp_file.name, _open_shards())
+
+    return save_export_file(
+        xform, export_type, extension, temp_file, export_id, filter_query)
+
+
+def delete_export_shards(shards):
+    storage = get_storage_class()()
+    for shard in shards:
+        for path in shard.values():
+            if path and storage.exists(path):
+                storage.delete(path)
+
+
+def delete_export_shard_files(username, id_string, export_type, export_id):
+    """
+    Delete every file saved by `generate_export_shard()` for the export,
+    whether its shard task succeeded or not
+    """
+    storage = get_storage_class()()
+    shards_dir = os.path.dirname(_export_shard_path(
+        username, id_string, export_type, export_id, 0, 'jsonl'))
+    if not storage.exists(shards_dir):
+        return
+    prefix = '%s_' % export_id
+    _, files = storage.listdir(shards_dir)
+    for name in files:
+        if name.startswith(prefix):
+            storage.delete(os.path.join(shards_dir, name))
+
+
+# export types which can extend the file of the previous export with the
+# submissions made since
+INCREMENTAL_EXPORT_TYPES = [Export.CSV_EXPORT, Export.CSV_ZIP_EXPORT]
+
+
+class RecordWatermark(object):
+    """
+    Count the records of an export, and keep their largest `_id`, as they are
+    iterated
+    """
+
+    def __init__(self, count=0, last_id=None):
+        self.count = count
+        self.last_id = last_id
+
+    def track(self, records):
+        for record in records:
+            self.count += 1
+            if self.last_id is None or record[ID] > self.last_id:
+                self.last_id = record[ID]
+            yield record
+
+
+def get_incremental_base_export(xform, export_type, group_delimiter='/',
+                                split_select_multiples=True,
+                                binary_select_multiples=False):
+    """
+    Find the latest export of all the submissions of `xform` which a new
+    export can extend: submissions were only added since, none was edited,
+    deleted or had its notes changed, and the form wasn't replaced
+    """
+    if export_type not in INCREMENTAL_EXPORT_TYPES:
+        return None
+    try:
+        export = Export.objects.filter(
+            xform=xform, export_type=export_type,
+            internal_status=Export.SUCCESSFUL,
+            last_instance_id__isnull=False).latest('created_on')
+    except Export.DoesNotExist:
+        return None
+
+    options = {
+        'group_delimiter': group_delimiter,
+        'split_select_multiples': split_select_multiples,
+        'binary_select_multiples': binary_select_multiples,
+        'xform_hash': xform.hash,
+    }
+    if export.options != options or export.time_of_last_submission is None:
+        return None
+    # deleting a submission also modifies it, unless it is deleted for good,
+    # which the count catches
+    instances = xform.instances.filter(id__lte=export.last_instance_id)
+    if instances.filter(
+            date_modified__gt=export.time_of_last_submission).exists() or\
+            instances.filter(deleted_at__isnull=True).count() !=\
+            export.instance_count:
+        return None
+    if not get_storage_class()().exists(export.filepath):
+        return None
+    return export
+
+
+def generate_incremental_export(export_type, extension, username, id_string,
+                                export_id=None, group_delimiter='/',
+                                split_select_multiples=True,
+                                binary_select_multiples=False):
+    """
+    Generate a CSV or CSV ZIP export of all the submissions of a form,
+    appending the submissions made since the previous export to its file
+    when none was edited or deleted, and recording what the export covers
+    for the next one
+    """
+    xform = XForm.objects.get(
+        user__username__iexact=username, id_string__exact=id_string)
+    options = {
+        'group_delimiter': group_delimiter,
+        'split_select_multiples': split_select_multiples,
+        'binary_select_multiples': binary_select_multiples,
+    }
+    # taken before reading the records so that submissions edited while
+    # exporting make the next export a full one
+    time_of_last_submission = xform.time_of_last_submission_update()
+    previous_export = get_incremental_base_export(
+        xform, export_type, **options)
+    export_builder = get_export_builder(xform, **options)
+
+    # TODO resolve circular import
+    from onadata.apps.viewer.pandas_mongo_bridge import CSVDataFrameBuilder
+
+    csv_builder = CSVDataFrameBuilder(
+        username, id_string, None, group_delimiter, split_select_multiples,
+        binary_select_multiples)
+
+    prefix = slugify('{}_export__{}__{}'.format(export_type, username, id_string))
+    temp_file = NamedTemporaryFile(prefix=prefix, suffix=("." + extension))
+    watermark = None
+    if previous_export is not None:
+        watermark = RecordWatermark(
+            previous_export.instance_count, previous_export.last_instance_id)
+        id_range = [previous_export.last_instance_id + 1, None]
+        with NamedTemporaryFile(suffix=("." + extension)) as previous_file:
+            with get_storage_class()().open(
+                    previous_export.filepath, 'rb') as f:
+                shutil.copyfileobj(f, previous_file)
+            previous_file.flush()
+            try:
+                if export_type == Export.CSV_EXPORT:
+                    csv_builder.append_to(
+                        temp_file.name, previous_file.name, id_range,
+                        watermark)
+                else:
+                    export_builder.append_to_zipped_csv(
+                        temp_file.name, previous_file.name,
+                        watermark.track(query_mongo(
+                            username, id_string, id_range=id_range)))
+            except IncrementalExportError:
+                watermark = None
+
+    if watermark is None:
+        watermark = RecordWatermark()
+        if export_type == Export.CSV_EXPORT:
+            csv_builder.export_to(temp_file.name, watermark=watermark)
+        else:
+            export_builder.to_zipped_csv(
+                temp_file.name,
+                watermark.track(query_mongo(username, id_string)))
+
+    export = save_export_file(
+        xform, export_type, extension, temp_file, export_id)
+    export.time_of_last_submission = time_of_last_submission
+    export.last_instance_id = watermark.last_id
+    export.instance_count = watermark.count
+    export.options = dict(options, xform_hash=xform.hash)
+    export.save()
+    return export
 
 
 def should_create_new_export(xform, export_type):
@@ -825,51 +1570,168 @@ def increment_index_in_filename(filename):
     return new_filename
 
 
-def generate_attachments_zip_export(
-        export_type, extension, username, id_string, export_id=None,
-        filter_query=None):
-    xform = XForm.objects.get(user__username=username, id_string=id_string)
-    attachments = Attachment.objects.filter(instance__xform=xform)
-    basename = "%s_%s" % (id_string,
-                          datetime.now().strftime("%Y_%m_%d_%H_%M_%S"))
-    filename = basename + "." + extension
-    file_path = os.path.join(
-        username,
-        'exports',
-        id_string,
-        export_type,
-        filename)
+# number of submissions whose attachments are queried at a time, and of
+# files added to an attachments ZIP export between two progress updates
+ATTACHMENTS_QUERY_CHUNK_SIZE = 1000
+ATTACHMENTS_PROGRESS_INTERVAL = 100
 
-    export_filename = get_storage_class()().save(file_path, ContentFile(''))
 
-    with get_storage_class()().open(export_filename, 'wb') as destination_file:
-        create_attachments_zipfile(
-            attachments,
-            output_file=destination_file,
-        )
+def query_attachments(xform, username, id_string, filter_query=None):
+    """
+    The attachments of the submissions of `xform` matching `filter_query`
 
-    dir_name, basename = os.path.split(export_filename)
+    :returns: The number of attachments and an iterator over them
+    """
+    attachments = Attachment.objects.filter(
+        instance__xform=xform).order_by('pk')
+    if filter_query is None:
+        return attachments.count(), attachments.iterator()
+
+    instance_ids = [record[ID] for record in query_mongo(
+        username, id_string, filter_query, fields=[ID])]
+    chunks = [instance_ids[i:i + ATTACHMENTS_QUERY_CHUNK_SIZE]
+              for i in range(0, len(instance_ids),
+                             ATTACHMENTS_QUERY_CHUNK_SIZE)]
+    count = sum(attachments.filter(instance_id__in=chunk).count()
+                for chunk in chunks)
+    return count, chain.from_iterable(
+        attachments.filter(instance_id__in=chunk).iterator()
+        for chunk in chunks)
+
+
+def generate_attachments_zip_export(
+        export_type, extension, username, id_string, export_id=None,
+        filter_query=None):
+    """
+    Stream the attachments of the submissions matching `filter_query` to
+    ZIP files of at most `ATTACHMENTS_EXPORT_VOLUME_SIZE` bytes, unless a
+    single attachment is bigger
 
+    The files after the first one are named `<name>_part2.zip`,
+    `<name>_part3.zip`, etc. and listed in the `volumes` option of the
+    export, whose `shards_total` and `shards_done` count the attachments.
+    """
+    xform = XForm.objects.get(user__username=username, id_string=id_string)
     # get or create export object
     if(export_id):
         export = Export.objects.get(id=export_id)
     else:
         export = Export.objects.create(xform=xform, export_type=export_type)
 
+    total, attachments = query_attachments(
+        xform, username, id_string, filter_query)
+    Export.objects.filter(pk=export.pk).update(
+        shards_total=total, shards_done=0)
+
+    storage = get_storage_class()()
+    volume_size = settings.ATTACHMENTS_EXPORT_VOLUME_SIZE
+    basename = "%s_%s" % (id_string,
+                          datetime.now().strftime("%Y_%m_%d_%H_%M_%S"))
+    volumes = []
+
+    def _open_volume():
+        suffix = '_part%d' % (len(volumes) + 1) if volumes else ''
+        file_path = os.path.join(
+            username,
+            'exports',
+            id_string,
+            export_type,
+            basename + suffix + "." + extension)
+        volumes.append(storage.save(file_path, ContentFile('')))
+        destination_file = storage.open(volumes[-1], 'wb')
+        return destination_file, ZipFile(
+            destination_file, 'w', ZIP_STORED, allowZip64=True)
+
+    destination_file, zip_file = _open_volume()
+    done = 0
+    try:
+        for member in read_attachments(attachments):
+            if volume_size and zip_file.filelist and\
+                    destination_file.tell() + member.compress_size >\
+                    volume_size:
+                zip_file.close()
+                destination_file.close()
+                destination_file, zip_file = _open_volume()
+            member.write_to(zip_file)
+            done += 1
+            if done % ATTACHMENTS_PROGRESS_INTERVAL == 0:
+                Export.objects.filter(pk=export.pk).update(shards_done=done)
+    finally:
+        zip_file.close()
+        destination_file.close()
+
+    dir_name, basename = os.path.split(volumes[0])
     export.filedir = dir_name
     export.filename = basename
+    export.options = {
+        'volumes': [os.path.basename(volume) for volume in volumes[1:]]}
+    # files missing from the storage are skipped
+    export.shards_total = export.shards_done = total
     export.internal_status = Export.SUCCESSFUL
     export.save()
     return export
 
 
+KML_HEADER = u"""<?xml version="1.0" encoding="utf-8"?>
+<kml xmlns="http://earth.google.com/kml/2.2">
+  <Document>
+    <name>%(name)s</name>
+    <Style id="sh_red-circle">
+      <IconStyle>
+        <scale>1.3</scale>
+        <Icon>
+          <href>http://maps.google.com/mapfiles/kml/paddle/red-circle.png</href>
+        </Icon>
+        <hotSpot x="32" y="1" xunits="pixels" yunits="pixels"/>
+      </IconStyle>
+      <ListStyle>
+        <ItemIcon>
+          <href>http://maps.google.com/mapfiles/kml/paddle/red-circle-lv.png</href>
+        </ItemIcon>
+      </ListStyle>
+    </Style>
+    <StyleMap id="msn_red-circle">
+      <Pair>
+        <key>normal</key>
+        <styleUrl>#sn_red-circle</styleUrl>
+      </Pair>
+      <Pair>
+        <key>highlight</key>
+        <styleUrl>#sh_red-circle</styleUrl>
+      </Pair>
+    </StyleMap>
+"""
+KML_PLACEMARK = u"""    <Placemark>
+      <description>
+        Survey Instance: %(id)s
+      </description>
+      <styleUrl>#sh_red-circle</styleUrl>
+      <Point>
+        <coordinates>
+          %(lng)s, %(lat)s
+        </coordinates>
+      </Point>
+    </Placemark>
+"""
+KML_FOOTER = u"""  </Document>
+</kml>
+"""
+
+
 def generate_kml_export(
         export_type, extension, username, id_string, export_id=None,
-        filter_query=None):
+        filter_query=None, bbox=None, start=None, end=None):
+    """
+    Write the locations of the submissions to a KML file, zipped as
+    `doc.kml` for a KMZ export, a placemark at a time
+
+    The submissions can be filtered with the `bbox`, `start` and `end`
+    arguments of `kml_export_data()`.
+    """
     user = User.objects.get(username=username)
     xform = XForm.objects.get(user__username=username, id_string=id_string)
-    response = render_to_response(
-        'survey.kml', {'data': kml_export_data(id_string, user)})
+    kml = (chunk.encode('utf-8') for chunk in iter_kml(
+        id_string, kml_export_data(id_string, user, bbox, start, end)))
 
     basename = "%s_%s" % (id_string,
                           datetime.now().strftime("%Y_%m_%d_%H_%M_%S"))
@@ -882,13 +1744,24 @@ def generate_kml_export(
         filename)
 
     storage = get_storage_class()()
-    temp_file = NamedTemporaryFile(suffix=extension)
-    temp_file.write(response.content)
-    temp_file.seek(0)
-    export_filename = storage.save(
-        file_path,
-        File(temp_file, file_path))
-    temp_file.close()
+    with NamedTemporaryFile(suffix=extension) as temp_file:
+        if export_type == Export.KMZ_EXPORT:
+            member = DeflatedZipMember('doc.kml')
+            try:
+                for chunk in kml:
+                    member.write(chunk)
+                with ZipFile(temp_file, 'w', ZIP_DEFLATED,
+                             allowZip64=True) as zip_file:
+                    member.write_to(zip_file)
+            finally:
+                member.close()
+        else:
+            for chunk in kml:
+                temp_file.write(chunk)
+        temp_file.seek(0)
+        export_filename = storage.save(
+            file_path,
+            File(temp_file, file_path))
 
     dir_name, basename = os.path.split(export_filename)
 
@@ -906,30 +1779,62 @@ def generate_kml_export(
     return export
 
 
-def kml_export_data(id_string, user):
-    # TODO resolve circular import
-    from onadata.apps.viewer.models.data_dictionary import DataDictionary
-    dd = DataDictionary.objects.get(id_string=id_string, user=user)
+def kml_export_data(id_string, user, bbox=None, start=None, end=None):
+    """
+    The locations of the submissions of a form, read from the database a
+    row at a time
+
+    :param bbox: Optional minimum longitude, minimum latitude, maximum
+        longitude and maximum latitude of the locations
+    :param start: Optional earliest submission time
+    :param end: Optional latest submission time
+    :returns: An iterator over the name, id, latitude and longitude of the
+        first location of every submission
+    """
     instances = Instance.objects.filter(
         xform__user=user,
         xform__id_string=id_string,
         deleted_at=None,
         geom__isnull=False
-    ).order_by('id')
-    data_for_template = []
-
-    for instance in instances:
-        point = instance.point
-        if point:
-            data_for_template.append({
-                'name': id_string,
-                'id': instance.uuid,
-                'lat': point.y,
-                'lng': point.x,
-                })
+    )
+    polygon = None
+    if bbox is not None:
+        polygon = Polygon.from_bbox(bbox)
+        # narrows down the submissions with the spatial index, any of their
+        # locations may be within the box
+        instances = instances.filter(geom__intersects=polygon)
+    if start is not None:
+        instances = instances.filter(date_created__gte=start)
+    if end is not None:
+        instances = instances.filter(date_created__lte=end)
+
+    for uuid, geom in instances.order_by('id').values_list(
+            'uuid', 'geom').iterator():
+        if not geom or not len(geom):
+            continue
+        point = geom[0]
+        if polygon is not None and not polygon.intersects(point):
+            continue
+        yield {
+            'name': id_string,
+            'id': uuid,
+            'lat': point.y,
+            'lng': point.x,
+        }
 
 
-    return data_for_template
+def iter_kml(name, data):
+    """
+    The KML document of the locations of `kml_export_data()`, in chunks
+    """
+    yield KML_HEADER % {'name': escape(name)}
+    for location in data:
+        yield KML_PLACEMARK % {
+            'id': escape(location['id']),
+            'lat': location['lat'],
+            'lng': location['lng'],
+        }
+    yield KML_FOOTER
 
 
 def _get_records(instances):
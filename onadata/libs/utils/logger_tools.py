@@ -32,7 +32,7 @@ from onadata.apps.main.models import UserProfile
 from onadata.apps.logger.models import Attachment
 from onadata.apps.logger.models.attachment import (
     generate_attachment_filename,
-    hash_attachment_contents,
+    hash_attachment_file,
 )
 from onadata.apps.logger.models import Instance
 from onadata.apps.logger.models.instance import (
@@ -43,6 +43,7 @@ from onadata.apps.logger.models.instance import (
 )
 from onadata.apps.logger.models import XForm
 from onadata.apps.logger.models.xform import XLSFormError
+from onadata.apps.logger.submission_context import SubmissionContext
 from onadata.apps.logger.xform_instance_parser import (
     InstanceEmptyError,
     InstanceInvalidUserError,
@@ -57,6 +58,7 @@ from onadata.apps.viewer.models.parsed_instance import _remove_from_mongo,\
     xform_instances, ParsedInstance
 from onadata.libs.utils import common_tags
 from onadata.libs.utils.model_tools import queryset_iterator, set_uuid
+from onadata.libs.utils.mongo_sync import bulk_update_mongo_for_xform
 
 
 OPEN_ROSA_VERSION_HEADER = 'X-OpenRosa-Version'
@@ -72,12 +74,15 @@ mongo_instances = settings.MONGO_DB.instances
 
 
 def _get_instance(xml, new_uuid, submitted_by, status, xform,
-                  defer_counting=False):
+                  defer_counting=False, submission_context=None):
     '''
     `defer_counting=False` will set a Python-only attribute of the same name on
     the *new* `Instance` if one is created. This will prevent
     `update_xform_submission_count()` from doing anything, which avoids locking
     any rows in `logger_xform` or `main_userprofile`.
+
+    `submission_context`, when given, is set as a Python-only attribute of the
+    `Instance` so that saving it reuses the parsed submission.
     '''
     # check if its an edit submission
     old_uuid = get_deprecated_uuid_from_xml(xml)
@@ -89,6 +94,8 @@ def _get_instance(xml, new_uuid, submitted_by, status, xform,
         instance = instances[0]
         InstanceHistory.objects.create(
             xml=instance.xml, xform_instance=instance, uuid=old_uuid)
+        if submission_context is not None:
+            instance.submission_context = submission_context
         instance.xml = xml
         instance._populate_xml_hash()
         instance.uuid = new_uuid
@@ -103,6 +110,8 @@ def _get_instance(xml, new_uuid, submitted_by, status, xform,
         instance.user = submitted_by
         instance.status = status
         instance.xform = xform
+        if submission_context is not None:
+            instance.submission_context = submission_context
         if defer_counting:
             # Only set the attribute if requested, i.e. don't bother ever
             # setting it to `False`
@@ -207,26 +216,33 @@ def save_attachments(instance, media_files):
     any_new_attachment = False
     for f in media_files:
         attachment_filename = generate_attachment_filename(instance, f.name)
-        existing_attachment = Attachment.objects.filter(
+        # Hash the upload in chunks; the stored files are never read back
+        # unless they were saved before their hash was recorded
+        media_file_hash = hash_attachment_file(f)
+        attachments = Attachment.objects.filter(
             instance=instance,
             media_file=attachment_filename,
             mimetype=f.content_type,
-        ).first()
-        if existing_attachment and (existing_attachment.file_hash ==
-                                    hash_attachment_contents(f.read())):
+        )
+        if attachments.filter(media_file_hash=media_file_hash).exists():
             # We already have this attachment!
             continue
-        f.seek(0)
+        # Or we have it from before its hash was recorded; `file_hash`
+        # records it
+        if any(attachment.file_hash == media_file_hash for attachment in
+               attachments.filter(media_file_hash=None)):
+            continue
         # This is a new attachment; save it!
         Attachment.objects.create(
             instance=instance,
-            media_file=f, mimetype=f.content_type)
+            media_file=f, mimetype=f.content_type,
+            media_file_hash=media_file_hash)
         any_new_attachment = True
     return any_new_attachment
 
 
 def save_submission(xform, xml, media_files, new_uuid, submitted_by, status,
-                    date_created_override):
+                    date_created_override, defer_counting=False):
     if not date_created_override:
         date_created_override = get_submission_date_from_xml(xml)
 
@@ -243,9 +259,16 @@ def save_submission(xform, xml, media_files, new_uuid, submitted_by, status,
     # submission counters and returns an `Instance` with a `defer_counting`
     # attribute set to `True` *if* a new instance was created. We are
     # responsible for calling `update_xform_submission_count()` if the returned
-    # `Instance` has `defer_counting = True`.
+    # `Instance` has `defer_counting = True`, unless our own caller asked for
+    # `defer_counting`, in which case that responsibility is passed on.
+    #
+    # The `SubmissionContext` lets `Instance.save()`, `ParsedInstance.save()`
+    # and the REST services share a single parse of the XML and a single
+    # Mongo document.
+    submission_context = SubmissionContext(xform)
     instance = _get_instance(xml, new_uuid, submitted_by, status, xform,
-                             defer_counting=True)
+                             defer_counting=True,
+                             submission_context=submission_context)
 
     save_attachments(instance, media_files)
 
@@ -259,16 +282,21 @@ def save_submission(xform, xml, media_files, new_uuid, submitted_by, status,
         instance.save()
 
     if instance.xform is not None:
-        pi, created = ParsedInstance.objects.get_or_create(
-            instance=instance)
+        try:
+            pi = ParsedInstance.objects.get(instance=instance)
+        except ParsedInstance.DoesNotExist:
+            pi = ParsedInstance(instance=instance)
+        # With `MONGO_WRITE_BEHIND`, the Mongo document is written after the
+        # transaction commits instead of holding up the request
+        pi.save(write_behind=settings.MONGO_WRITE_BEHIND)
 
-    if not created:
-        pi.save(async=False)
+    # The context is only valid while the submission is being saved
+    del instance.submission_context
 
     # Now that the slow tasks are complete and we are (hopefully!) close to the
     # end of the transaction, update the submission count if the `Instance` was
     # newly created
-    if getattr(instance, 'defer_counting', False):
+    if getattr(instance, 'defer_counting', False) and not defer_counting:
         # Remove the Python-only attribute
         del instance.defer_counting
         update_xform_submission_count(sender=None, instance=instance,
@@ -280,11 +308,16 @@ def save_submission(xform, xml, media_files, new_uuid, submitted_by, status,
 @transaction.atomic # paranoia; redundant since `ATOMIC_REQUESTS` set to `True`
 def create_instance(username, xml_file, media_files,
                     status=u'submitted_via_web', uuid=None,
-                    date_created_override=None, request=None):
+                    date_created_override=None, request=None,
+                    defer_counting=False):
     """
     Submission cases:
         If there is a username and no uuid, submitting an old ODK form.
         If there is a username and a uuid, submitting a new ODK form.
+
+    With `defer_counting`, a new `Instance` is returned with the Python-only
+    `defer_counting` attribute set and the caller must update the submission
+    counters, e.g. with `increment_submission_counts()`.
     """
     instance = None
     submitted_by = request.user \
@@ -304,15 +337,17 @@ def create_instance(username, xml_file, media_files,
     #    * the submitted XML is an exact match with one that
     #      has already been submitted for that user.
     if xform.has_start_time:
-        # XML matches are identified by identical content hash OR, when a
-        # content hash is not present, by string comparison of the full
-        # content, which is slow! Use the management command
+        # XML matches are identified by identical content hash within the
+        # form, using the `(xform, xml_hash)` index. Only while some of the
+        # form's submissions have no content hash is the full content
+        # compared, which is slow! Use the management command
         # `populate_xml_hashes_for_instances` to hash existing submissions
-        existing_instance = Instance.objects.filter(
-            Q(xml_hash=xml_hash) |
-                Q(xml_hash=Instance.DEFAULT_XML_HASH, xml=xml),
-            xform__user=xform.user,
-        ).first()
+        form_instances = Instance.objects.filter(xform=xform)
+        existing_instance = form_instances.filter(xml_hash=xml_hash).first()
+        if existing_instance is None and form_instances.filter(
+                xml_hash=Instance.DEFAULT_XML_HASH).exists():
+            existing_instance = form_instances.filter(
+                xml_hash=Instance.DEFAULT_XML_HASH, xml=xml).first()
     else:
         existing_instance = None
 
@@ -331,7 +366,7 @@ def create_instance(username, xml_file, media_files,
     else:
         instance = save_submission(xform, xml, media_files, new_uuid,
                                    submitted_by, status,
-                                   date_created_override)
+                                   date_created_override, defer_counting)
         return instance
 
 
@@ -610,7 +645,16 @@ def inject_instanceid(xml_str, uuid):
     return xml_str
 
 
-def update_mongo_for_xform(xform, only_update_missing=True):
+def update_mongo_for_xform(xform, only_update_missing=True, bulk=False,
+                           workers=1):
+    if bulk:
+        # Upserts in place instead of clearing the form's records first
+        bulk_update_mongo_for_xform(
+            xform, only_update_missing=only_update_missing, workers=workers)
+        sys.stdout.write(
+            "\nUpdated %s\n------------------------------------------\n"
+            % xform.id_string)
+        return
 
     instance_ids = set(
         [i.id for i in Instance.objects.only('id').filter(xform=xform)])
@@ -661,7 +705,8 @@ def update_mongo_for_xform(xform, only_update_missing=True):
         % xform.id_string)
 
 
-def mongo_sync_status(remongo=False, update_all=False, user=None, xform=None):
+def mongo_sync_status(remongo=False, update_all=False, user=None, xform=None,
+                      bulk=False, workers=1):
     """Check the status of records in the mysql db versus mongodb. At a
     minimum, return a report (string) of the results.
 
@@ -674,6 +719,10 @@ def mongo_sync_status(remongo=False, update_all=False, user=None, xform=None):
     user       -> if specified, apply only to the forms for the given user
                   (default: None)
     xform      -> if specified, apply only to the given form (default: None)
+    bulk       -> if True, update the records with batched upserts
+                  (default: False)
+    workers    -> number of processes building the documents in bulk mode
+                  (default: 1)
 
     """
 
@@ -720,7 +769,8 @@ def mongo_sync_status(remongo=False, update_all=False, user=None, xform=None):
                         "-------------------------------\n"
                         % xform.id_string)
                 update_mongo_for_xform(
-                    xform, only_update_missing=not update_all)
+                    xform, only_update_missing=not update_all, bulk=bulk,
+                    workers=workers)
         done += 1
         sys.stdout.write(
             "%.2f %% done ...\r" % ((float(done) / float(total)) * 100))
@@ -0,0 +1,145 @@
+import json
+import logging
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import ugettext as _
+
+from onadata.libs.exceptions import UnindexedQueryError
+from onadata.libs.utils.common_tags import ID, USERFORM_ID
+
+# Cache key of the indexes of the `instances` collection
+MONGO_INDEXES_CACHE_KEY = 'mongo-instances-indexes'
+MONGO_INDEXES_CACHE_TIMEOUT = 5 * 60
+
+logger = logging.getLogger('console_logger')
+
+
+class QueryShape(object):
+    """
+    The fields a Mongo query of the submissions of a form filters and sorts
+    on, without their values, e.g. `{"age": {"$gt": 5}}` sorted by
+    `{"_submission_time": -1}` has the filter fields `["age"]` and the sort
+    `[["_submission_time", -1]]`.
+
+    The `_userform_id` of every query, and `_deleted_at`, aren't part of it.
+    """
+    IGNORED_FIELDS = (USERFORM_ID, '_deleted_at')
+
+    def __init__(self, query=None, sort=None):
+        fields = set()
+        self._add_fields(query or {}, fields)
+        self.filter_fields = sorted(fields.difference(self.IGNORED_FIELDS))
+        self.sort = [[key, int(direction)]
+                     for key, direction in (sort or {}).items()]
+
+    @classmethod
+    def _add_fields(cls, query, fields):
+        for key, value in query.items():
+            if key.startswith('$'):
+                # `$and`, `$or`, etc.
+                for sub_query in value if type(value) == list else []:
+                    if type(sub_query) == dict:
+                        cls._add_fields(sub_query, fields)
+            else:
+                fields.add(key)
+
+    @property
+    def key(self):
+        return json.dumps([self.filter_fields, self.sort])
+
+    def is_sort_indexed(self, indexes):
+        """
+        Whether Mongo can read the records in the order of the sort from an
+        index instead of sorting them in memory
+        """
+        if not self.sort or [key for key, _ in self.sort] == [ID]:
+            return True
+        sort_keys = [USERFORM_ID] + [key for key, _ in self.sort]
+        return any(index[:len(sort_keys)] == sort_keys for index in indexes)
+
+    def is_filter_indexed(self, indexes):
+        """
+        Whether an index narrows down the records of the form to those
+        matching one of the filters
+        """
+        if not self.filter_fields or ID in self.filter_fields:
+            return True
+        return any(len(index) > 1 and index[0] == USERFORM_ID and
+                   index[1] in self.filter_fields for index in indexes)
+
+    def recommended_index(self):
+        """
+        The compound index serving the shape: the form, the filters, then
+        the sort
+        """
+        keys = [[USERFORM_ID, 1]] + [
+            [field, 1] for field in self.filter_fields
+            if field not in [key for key, _ in self.sort]]
+        return keys + [pair for pair in self.sort if pair[0] != ID]
+
+
+def get_instances_indexes(refresh=False):
+    """
+    The keys of the indexes of the `instances` collection, e.g.
+    `[["_userform_id"], ["_userform_id", "_submission_time"]]`, cached for
+    `MONGO_INDEXES_CACHE_TIMEOUT` seconds
+    """
+    indexes = None if refresh else cache.get(MONGO_INDEXES_CACHE_KEY)
+    if indexes is None:
+        indexes = [
+            [key for key, _ in index['key']] for index in
+            settings.MONGO_DB.instances.index_information().values()]
+        cache.set(MONGO_INDEXES_CACHE_KEY, indexes,
+                  MONGO_INDEXES_CACHE_TIMEOUT)
+    return indexes
+
+
+def limit_query_time(cursor, shape, stream=False):
+    """
+    Stop `cursor`, of a query of the given `QueryShape`, after
+    `MONGO_QUERY_MAX_TIME_MS`, or after `MONGO_UNINDEXED_QUERY_MAX_TIME_MS`
+    if no index serves its sort or filters, which then scan the records of
+    the form, or, with `stream`, after `MONGO_STREAM_QUERY_MAX_TIME_MS`
+
+    :raises UnindexedQueryError: if `MONGO_REJECT_UNINDEXED_SORTS` is set and
+        no index serves the sort
+    """
+    indexes = get_instances_indexes()
+    sort_indexed = shape.is_sort_indexed(indexes)
+    if not sort_indexed and settings.MONGO_REJECT_UNINDEXED_SORTS:
+        raise UnindexedQueryError(
+            _(u"Sorting on %(keys)s is not supported, sort on _id instead.")
+            % {'keys': u', '.join(key for key, _ in shape.sort)})
+
+    max_time_ms = settings.MONGO_QUERY_MAX_TIME_MS
+    if stream:
+        max_time_ms = settings.MONGO_STREAM_QUERY_MAX_TIME_MS
+    elif not sort_indexed or not shape.is_filter_indexed(indexes):
+        max_time_ms = settings.MONGO_UNINDEXED_QUERY_MAX_TIME_MS
+    if max_time_ms:
+        cursor.max_time_ms(max_time_ms)
+
+
+def log_query_shape(shape, elapsed_ms):
+    """
+    Record a query of the shape in the `query_shapes` collection, if it
+    took longer than `MONGO_SLOW_QUERY_MS`, for `advise_mongo_indexes`
+    """
+    if elapsed_ms < settings.MONGO_SLOW_QUERY_MS:
+        return
+    logger.warning(u'Slow Mongo query shape (%d ms): %s',
+                   elapsed_ms, shape.key)
+    settings.MONGO_DB.query_shapes.update(
+        {'_id': shape.key},
+        {
+            '$set': {
+                'filter_fields': shape.filter_fields,
+                'sort': shape.sort,
+                'last_seen': datetime.utcnow(),
+            },
+            '$inc': {'count': 1, 'total_ms': elapsed_ms},
+            '$max': {'max_ms': elapsed_ms},
+        },
+        upsert=True)
@@ -0,0 +1,401 @@
+import json
+import multiprocessing
+import os
+import sys
+import time
+from datetime import timedelta
+from itertools import groupby, imap
+
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+from pymongo.errors import BulkWriteError
+
+from onadata.apps.api.mongo_helper import MongoHelper
+from onadata.apps.logger.models import Instance, XForm
+from onadata.apps.logger.xform_instance_parser import XFormInstanceParser
+from onadata.apps.viewer.models.mongo_sync_watermark import \
+    MongoSyncWatermark
+from onadata.apps.viewer.models.parsed_instance import ParsedInstance,\
+    xform_instances
+from onadata.libs.utils.common_tags import ID, XFORM_ID_STRING
+
+
+DEFAULT_BATCH_SIZE = 1000
+
+# Instances saved just before a reconciliation may only be committed after it
+# read them, so every run re-reads this much of the previous one
+RECONCILE_OVERLAP = timedelta(minutes=5)
+
+# Instances queued for longer than this, e.g. because their document cannot
+# be built, are left to `reconcile_mongo()` instead of being retried by every
+# write-behind flush
+WRITE_BEHIND_MAX_AGE = timedelta(hours=1)
+
+# Data dictionary of the form being rebuilt, set in every worker process by
+# `_init_worker()`
+_worker_data_dictionary = None
+
+
+def _init_worker(data_dictionary):
+    global _worker_data_dictionary
+    _worker_data_dictionary = data_dictionary
+
+
+def build_mongo_document(item):
+    """
+    Parse a submission and merge it with its metadata into a Mongo document.
+    Runs in the worker processes, so it must not touch the database.
+
+    :param tuple item: The submission XML and the dict returned by
+        `ParsedInstance.get_mongo_metadata()`.
+    :returns: The document, or `None` if the XML could not be parsed.
+    """
+    xml, metadata = item
+    parser = XFormInstanceParser(xml, _worker_data_dictionary)
+    document = parser.get_flat_dict_with_attributes()
+    if document.get(XFORM_ID_STRING) is None:
+        return None
+    document.update(metadata)
+    return MongoHelper.to_safe_dict(document)
+
+
+class FileCheckpoint(object):
+    """
+    Keeps the last primary key written for each form in a JSON file so that
+    an interrupted rebuild can be resumed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.positions = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.positions = json.load(f)
+
+    def get(self, xform):
+        return self.positions.get(unicode(xform.pk), 0)
+
+    def set(self, xform, last_pk):
+        self.positions[unicode(xform.pk)] = last_pk
+        temp_path = u'%s.tmp' % self.path
+        with open(temp_path, 'w') as f:
+            json.dump(self.positions, f)
+        os.rename(temp_path, self.path)
+
+
+def _resync_modified_instances(instances):
+    """
+    Re-sync the instances that live submissions changed or deleted while
+    their batch was being written, since the bulk upsert may have replaced a
+    newer document with a stale one.
+    """
+    read_dates = dict((i.pk, i.date_modified) for i in instances)
+    current_dates = dict(Instance.objects.filter(
+        pk__in=read_dates.keys()).values_list('pk', 'date_modified'))
+
+    deleted_pks = [pk for pk in read_dates if pk not in current_dates]
+    if deleted_pks:
+        xform_instances.remove({ID: {'$in': deleted_pks}})
+
+    modified_pks = [pk for pk, date_modified in current_dates.items()
+                    if date_modified != read_dates[pk]]
+    for pi in ParsedInstance.objects.filter(instance__in=modified_pks)\
+            .select_related('instance'):
+        pi.update_mongo(async=False)
+
+
+def _write_batch(xform, instances, build_documents):
+    parsed_instances = []
+    new_parsed_instances = []
+    for instance in instances:
+        # all the instances belong to `xform`, avoid fetching it again
+        instance.xform = xform
+        try:
+            pi = instance.parsed_instance
+        except ParsedInstance.DoesNotExist:
+            pi = ParsedInstance(instance=instance)
+            new_parsed_instances.append(pi)
+        pi._set_geopoint()
+        parsed_instances.append(pi)
+    if new_parsed_instances:
+        ParsedInstance.objects.bulk_create(new_parsed_instances)
+
+    documents = build_documents(
+        build_mongo_document,
+        [(pi.instance.xml, pi.get_mongo_metadata())
+         for pi in parsed_instances])
+
+    bulk = xform_instances.initialize_unordered_bulk_op()
+    synced_pks = []
+    failed_pks = []
+    for pi, document in zip(parsed_instances, documents):
+        if document is None:
+            failed_pks.append(pi.instance.pk)
+        else:
+            bulk.find({ID: document[ID]}).upsert().replace_one(document)
+            synced_pks.append(document[ID])
+
+    if synced_pks:
+        try:
+            bulk.execute()
+        except BulkWriteError as e:
+            errors = set(error['index']
+                         for error in e.details.get('writeErrors', []))
+            failed_pks.extend(synced_pks[i] for i in errors)
+            synced_pks = [pk for i, pk in enumerate(synced_pks)
+                          if i not in errors]
+
+    # Only flag the instances once Mongo acknowledged their documents
+    Instance.objects.filter(pk__in=synced_pks).update(
+        is_synced_with_mongo=True)
+    Instance.objects.filter(pk__in=failed_pks).update(
+        is_synced_with_mongo=False)
+
+    _resync_modified_instances(instances)
+
+    return len(synced_pks), failed_pks
+
+
+def bulk_update_mongo_for_xform(xform, only_update_missing=False,
+                                batch_size=DEFAULT_BATCH_SIZE, workers=1,
+                                start_after=0, checkpoint=None,
+                                stdout=sys.stdout):
+    """
+    Rebuild the Mongo documents of `xform`'s submissions in batches.
+
+    Instances are read in primary key order, `batch_size` at a time, with
+    their attachments, notes and tags prefetched. Their XML is parsed by a
+    pool of `workers` processes and the documents are written with unordered
+    bulk upserts, so existing documents remain readable during the rebuild
+    and live submissions keep being synced as usual.
+
+    :param bool only_update_missing: Skip the instances that already have a
+        Mongo document.
+    :param int start_after: Resume after this instance primary key.
+    :param checkpoint: Optional object whose `set(xform, last_pk)` method is
+        called after every batch, e.g. a `FileCheckpoint`.
+    :returns: The number of documents written.
+    """
+    data_dictionary = xform.data_dictionary()
+    # Compile the survey before the workers are forked so they inherit it
+    data_dictionary.get_survey_elements_of_type(u'repeat')
+    pool = None
+    if workers > 1:
+        pool = multiprocessing.Pool(
+            workers, _init_worker, (data_dictionary,))
+        build_documents = pool.map
+    else:
+        _init_worker(data_dictionary)
+        build_documents = lambda func, items: list(imap(func, items))
+
+    queryset = Instance.objects.filter(xform=xform).order_by('pk')\
+        .select_related('user', 'parsed_instance')\
+        .prefetch_related('attachments', 'notes', 'tags')
+    last_pk = start_after
+    total = 0
+    started = time.time()
+    try:
+        while True:
+            instances = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+            if not instances:
+                break
+            last_pk = instances[-1].pk
+
+            if only_update_missing:
+                existing_pks = set(record[ID] for record in xform_instances.find(
+                    {ID: {'$in': [i.pk for i in instances]}}, {ID: 1}))
+                instances = [i for i in instances if i.pk not in existing_pks]
+
+            written, failed_pks = _write_batch(
+                xform, instances, build_documents)
+            total += written
+            for pk in failed_pks:
+                stdout.write(
+                    "\033[91m[ERROR] - Instance #{} - Could not save the "
+                    "parsed instance\033[0m\n".format(pk))
+
+            if checkpoint is not None:
+                checkpoint.set(xform, last_pk)
+            elapsed = time.time() - started
+            stdout.write(
+                "%s: %d documents written (%.1f/s), last pk %d\n" % (
+                    xform.id_string, total, total / max(elapsed, 0.001),
+                    last_pk))
+            stdout.flush()
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return total
+
+
+def flush_write_behind_queue(batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Write the documents queued by `ParsedInstance.update_mongo(write_behind=True)`,
+    i.e. the recently modified instances not synced with Mongo, with one bulk
+    upsert per form and batch.
+
+    :returns: The number of documents written and the list of primary keys
+        of the instances that could not be synced.
+    """
+    build_documents = lambda func, items: list(imap(func, items))
+    queryset = Instance.objects.filter(
+        is_synced_with_mongo=False,
+        date_modified__gte=timezone.now() - WRITE_BEHIND_MAX_AGE,
+        xform__isnull=False,
+    ).order_by('pk').select_related('user', 'parsed_instance')\
+        .prefetch_related('attachments', 'notes', 'tags')
+    last_pk = 0
+    total = 0
+    all_failed_pks = []
+    while True:
+        instances = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+        if not instances:
+            break
+        last_pk = instances[-1].pk
+        instances.sort(key=lambda i: i.xform_id)
+        xforms = XForm.objects.select_related('user').in_bulk(
+            set(i.xform_id for i in instances))
+        for xform_id, form_instances in groupby(
+                instances, lambda i: i.xform_id):
+            xform = xforms[xform_id]
+            _init_worker(xform.data_dictionary())
+            written, failed_pks = _write_batch(
+                xform, list(form_instances), build_documents)
+            total += written
+            all_failed_pks.extend(failed_pks)
+    return total, all_failed_pks
+
+
+def _not_synced_with_mongo():
+    # `is_synced_with_mongo` is null for the instances saved before the field
+    # was added, which `mongo_sync_report()` reports as unknown until the
+    # `update_is_sync_with_mongo` command checks them against Mongo
+    return Q(is_synced_with_mongo=False)
+
+
+def reconcile_xform(xform, batch_size=DEFAULT_BATCH_SIZE, until=None):
+    """
+    Sync the instances of `xform` modified since its watermark, or whose last
+    write to Mongo failed, then advance the watermark to `until`. The first
+    run of a form only syncs the instances that failed.
+
+    :param datetime until: When the reconciliation started, defaults to now.
+    :returns: The number of documents written and the list of primary keys
+        of the instances that could not be synced.
+    """
+    if until is None:
+        until = timezone.now()
+    watermark, created = MongoSyncWatermark.objects.get_or_create(
+        xform=xform)
+    changed = _not_synced_with_mongo()
+    if watermark.synced_until is not None:
+        changed |= Q(date_modified__gte=(
+            watermark.synced_until - RECONCILE_OVERLAP))
+
+    _init_worker(xform.data_dictionary())
+    build_documents = lambda func, items: list(imap(func, items))
+    queryset = Instance.objects.filter(changed, xform=xform).order_by('pk')\
+        .select_related('user', 'parsed_instance')\
+        .prefetch_related('attachments', 'notes', 'tags')
+    last_pk = 0
+    total = 0
+    all_failed_pks = []
+    while True:
+        instances = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+        if not instances:
+            break
+        last_pk = instances[-1].pk
+        written, failed_pks = _write_batch(xform, instances, build_documents)
+        total += written
+        all_failed_pks.extend(failed_pks)
+
+    watermark.synced_until = until
+    watermark.save()
+    return total, all_failed_pks
+
+
+def reconcile_mongo(batch_size=DEFAULT_BATCH_SIZE, xforms=None,
+                    stdout=sys.stdout):
+    """
+    Incrementally reconcile Mongo with Postgres.
+
+    A single indexed query finds the forms with instances modified since the
+    oldest watermark or not synced, and only those forms are visited. The
+    watermarks of the other forms are moved forward since none of their
+    instances changed.
+
+    :param xforms: Optional queryset restricting the forms to reconcile, in
+        which case the other watermarks are left untouched.
+    :returns: The number of documents written and the list of primary keys
+        of the instances that could not be synced.
+    """
+    until = timezone.now()
+    watermarks = MongoSyncWatermark.objects.all()
+    instances = Instance.objects.all()
+    if xforms is not None:
+        watermarks = watermarks.filter(xform__in=xforms)
+        instances = instances.filter(xform__in=xforms)
+
+    changed = _not_synced_with_mongo()
+    oldest = watermarks.aggregate(oldest=Min('synced_until'))['oldest']
+    if oldest is not None:
+        changed |= Q(date_modified__gte=oldest - RECONCILE_OVERLAP)
+    xform_ids = set(instances.filter(changed).order_by()
+                    .values_list('xform_id', flat=True).distinct())
+
+    total = 0
+    all_failed_pks = []
+    for xform in XForm.objects.filter(pk__in=xform_ids)\
+            .select_related('user').order_by('pk'):
+        written, failed_pks = reconcile_xform(xform, batch_size, until)
+        total += written
+        all_failed_pks.extend(failed_pks)
+        stdout.write("%s: %d documents written, %d failed\n" % (
+            xform.id_string, written, len(failed_pks)))
+
+    watermarks.exclude(xform_id__in=xform_ids).update(synced_until=until)
+    return total, all_failed_pks
+
+
+def mongo_sync_report():
+    """
+    Report, form by form, the instances that are not synced with Mongo.
+
+    Unlike `mongo_sync_status()`, which compares the count of every form with
+    Mongo, this runs aggregate queries over the instances flagged as not
+    synced, or whose sync status is unknown, so its cost depends on the
+    number of out of sync forms only.
+    """
+    def _count(condition):
+        return dict(((username, id_string), count) for
+                    username, id_string, count in
+                    Instance.objects.filter(condition)
+                    .values_list('xform__user__username', 'xform__id_string')
+                    .annotate(count=Count('pk')).order_by())
+
+    not_synced = _count(_not_synced_with_mongo())
+    unknown = _count(Q(is_synced_with_mongo__isnull=True))
+    report_string = ""
+    total_to_remongo = 0
+    total_unknown = 0
+    forms = sorted(set(not_synced) | set(unknown))
+    for username, id_string in forms:
+        count = not_synced.get((username, id_string), 0)
+        unknown_count = unknown.get((username, id_string), 0)
+        report_string += "user: %s, id_string: %s\nNot synced: %d\n" % (
+            username, id_string, count)
+        if unknown_count:
+            report_string += "Unknown: %d\n" % unknown_count
+        report_string += "--------------------------------------\n"
+        total_to_remongo += count
+        total_unknown += unknown_count
+    report_string += "Total # of forms out of sync: %d\n" \
+        "Total # of records to remongo: %d\n" % (
+            len(forms), total_to_remongo)
+    if total_unknown:
+        report_string += "Total # of records of unknown sync status: %d, " \
+            "run `update_is_sync_with_mongo --only-unknown` to check " \
+            "them\n" % total_unknown
+    return report_string
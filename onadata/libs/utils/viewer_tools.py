@@ -3,6 +3,8 @@ import traceback
 import requests
 import zipfile
 
+from itertools import islice
+from multiprocessing.dummy import Pool as ThreadPool
 from tempfile import NamedTemporaryFile
 from xml.dom import minidom
 
@@ -13,6 +15,7 @@ from django.core.mail import mail_admins
 from django.utils.translation import ugettext as _
 
 from onadata.libs.utils import common_tags
+from onadata.libs.utils.zip_tools import CHUNK_SIZE, StoredZipMember
 
 
 SLASH = u"/"
@@ -225,19 +228,61 @@ def enketo_url(form_url, id_string, instance_xml=None,
     return False
 
 
+def read_attachments(attachments, workers=None):
+    """
+    Read the files of `attachments` from the storage, `workers` at a time,
+    into spooled zip members
+
+    Only a batch of `workers` files is read ahead of the consumer, so a slow
+    storage, e.g. S3, is queried in parallel without holding every file.
+
+    :returns: A `StoredZipMember` per attachment whose file exists, in the
+        order of `attachments`
+    """
+    workers = workers or settings.ATTACHMENTS_EXPORT_WORKERS
+    storage = get_storage_class()()
+
+    def _read(attachment):
+        name = attachment.media_file.name
+        member = StoredZipMember(name)
+        try:
+            if not storage.exists(name):
+                member.close()
+                return None
+            with storage.open(name, 'rb') as source_file:
+                for chunk in iter(lambda: source_file.read(CHUNK_SIZE), ''):
+                    member.write(chunk)
+        except Exception, e:
+            member.close()
+            report_exception(
+                "Error adding file \"{}\" to archive.".format(name), e)
+            return None
+        return member
+
+    attachments = iter(attachments)
+    pool = ThreadPool(workers) if workers > 1 else None
+    try:
+        while True:
+            batch = list(islice(attachments, workers))
+            if not batch:
+                break
+            map_function = pool.map if pool else map
+            for member in map_function(_read, batch):
+                if member is not None:
+                    yield member
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+
 def create_attachments_zipfile(attachments, output_file=None):
     if not output_file:
         output_file = NamedTemporaryFile()
 
-    storage = get_storage_class()()
     with zipfile.ZipFile(output_file, 'w', zipfile.ZIP_STORED, allowZip64=True) as zip_file:
-        for attachment in attachments:
-            if storage.exists(attachment.media_file.name):
-                try:
-                    with storage.open(attachment.media_file.name, 'rb') as source_file:
-                        zip_file.writestr(attachment.media_file.name, source_file.read())
-                except Exception, e:
-                    report_exception("Error adding file \"{}\" to archive.".format(attachment.media_file.name), e)
+        for member in read_attachments(attachments):
+            member.write_to(zip_file)
 
     return output_file
 
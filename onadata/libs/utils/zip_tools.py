@@ -0,0 +1,106 @@
+import shutil
+import time
+import zlib
+from tempfile import SpooledTemporaryFile
+from zipfile import ZipInfo, ZIP_DEFLATED, ZIP_STORED, ZIP64_LIMIT
+
+# Compressed bytes of a member kept in memory before spilling to disk
+SPOOL_MAX_SIZE = 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+
+class DeflatedZipMember(object):
+    """
+    File-like object deflating the content of a zip member as it is written.
+
+    Only the compressed bytes are kept, in a spooled temporary file, until
+    `write_to()` appends them to the zip file as they are. This lets several
+    members be written at the same time, e.g. one per section of an export,
+    which `zipfile` doesn't support.
+    """
+    compress_type = ZIP_DEFLATED
+
+    def __init__(self, arcname, compress_level=zlib.Z_DEFAULT_COMPRESSION,
+                 spool_max_size=SPOOL_MAX_SIZE):
+        self.arcname = arcname
+        self.file_size = 0
+        self.crc = 0
+        self._compressor = zlib.compressobj(
+            compress_level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        self._spool = SpooledTemporaryFile(max_size=spool_max_size)
+
+    def write(self, data):
+        self.file_size += len(data)
+        self.crc = zlib.crc32(data, self.crc) & 0xffffffff
+        self._spool.write(self._compress(data))
+
+    def _compress(self, data):
+        return self._compressor.compress(data)
+
+    def _flush(self):
+        return self._compressor.flush()
+
+    def write_to(self, zip_file):
+        """
+        Append the member to `zip_file` and release its spooled data.
+        """
+        self._spool.write(self._flush())
+        zinfo = ZipInfo(self.arcname, time.localtime(time.time())[:6])
+        zinfo.compress_type = self.compress_type
+        zinfo.external_attr = 0600 << 16L
+        zinfo.file_size = self.file_size
+        zinfo.compress_size = self._spool.tell()
+        zinfo.CRC = self.crc
+        zinfo.header_offset = zip_file.fp.tell()
+        # the same bookkeeping as `ZipFile.write()`, raises `LargeZipFile`
+        # if ZIP64 is needed but not allowed
+        zip_file._writecheck(zinfo)
+        zip_file._didModify = True
+        zip64 = zinfo.file_size > ZIP64_LIMIT or \
+            zinfo.compress_size > ZIP64_LIMIT
+        zip_file.fp.write(zinfo.FileHeader(zip64))
+        self._spool.seek(0)
+        shutil.copyfileobj(self._spool, zip_file.fp, CHUNK_SIZE)
+        zip_file.filelist.append(zinfo)
+        zip_file.NameToInfo[zinfo.filename] = zinfo
+        self.close()
+
+    @property
+    def compress_size(self):
+        return self._spool.tell()
+
+    def close(self):
+        self._spool.close()
+
+
+class StoredZipMember(DeflatedZipMember):
+    """
+    Same as `DeflatedZipMember`, for a member stored without compression,
+    e.g. an already compressed photo.
+    """
+    compress_type = ZIP_STORED
+
+    def __init__(self, arcname, spool_max_size=SPOOL_MAX_SIZE):
+        super(StoredZipMember, self).__init__(
+            arcname, spool_max_size=spool_max_size)
+
+    def _compress(self, data):
+        return data
+
+    def _flush(self):
+        return ''
+
+
+def write_file_to_zip(zip_file, path, arcname,
+                      compress_level=zlib.Z_DEFAULT_COMPRESSION):
+    """
+    Same as `ZipFile.write()`, with a compression level.
+    """
+    member = DeflatedZipMember(arcname, compress_level)
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), ''):
+                member.write(chunk)
+        member.write_to(zip_file)
+    finally:
+        member.close()
@@ -512,6 +512,72 @@ BINARY_SELECT_MULTIPLES = False
 # Use 'n/a' for empty values by default on csv exports
 NA_REP = 'n/a'
 
+# Engine used to parse submission XML: 'lxml' converts the instance in a
+# single streaming pass, 'minidom' builds the whole DOM first
+XFORM_INSTANCE_PARSER_BACKEND = os.environ.get(
+    'XFORM_INSTANCE_PARSER_BACKEND', 'lxml')
+
+# Number of compiled pyxform surveys kept in memory by each process
+SURVEY_CACHE_SIZE = int(os.environ.get('SURVEY_CACHE_SIZE', 200))
+
+# Seconds between two incremental Postgres to Mongo reconciliations
+MONGO_RECONCILE_INTERVAL = int(
+    os.environ.get('MONGO_RECONCILE_INTERVAL', 15 * 60))
+
+# Write the Mongo documents of submissions in batches once their transaction
+# has committed, instead of during the request
+MONGO_WRITE_BEHIND = os.environ.get('MONGO_WRITE_BEHIND', 'False') == 'True'
+# Milliseconds during which queued documents are coalesced into one flush
+MONGO_WRITE_BEHIND_DELAY = int(os.environ.get('MONGO_WRITE_BEHIND_DELAY', 500))
+# Maximum number of documents per bulk write
+MONGO_WRITE_BEHIND_BATCH_SIZE = int(
+    os.environ.get('MONGO_WRITE_BEHIND_BATCH_SIZE', 500))
+
+# Deflate level, from 0 to 9, of the zipped CSV and SPSS exports
+EXPORT_ZIP_COMPRESS_LEVEL = int(os.environ.get('EXPORT_ZIP_COMPRESS_LEVEL', 6))
+
+# Number of records per shard of the CSV, CSV ZIP and XLSX exports generated
+# in parallel by several Celery workers; forms with fewer submissions, or all
+# forms when 0, are exported by a single task
+EXPORT_SHARD_SIZE = int(os.environ.get('EXPORT_SHARD_SIZE', 0))
+
+# Total size, in bytes, and number of the export files of filter queries kept
+# for identical exports, least recently used first out; 0 disables the cache
+EXPORT_CACHE_MAX_SIZE = int(
+    os.environ.get('EXPORT_CACHE_MAX_SIZE', 1024 * 1024 * 1024))
+EXPORT_CACHE_MAX_ENTRIES = int(os.environ.get('EXPORT_CACHE_MAX_ENTRIES', 500))
+
+# Time, in milliseconds, after which the data API stops its Mongo queries, or
+# those which no index of `instances` serves; 0 doesn't limit them. Sorts no
+# index serves are rejected if MONGO_REJECT_UNINDEXED_SORTS is set, and
+# queries slower than MONGO_SLOW_QUERY_MS logged for `advise_mongo_indexes`.
+# Streamed responses, which a timeout would truncate, are only stopped after
+# MONGO_STREAM_QUERY_MAX_TIME_MS
+MONGO_QUERY_MAX_TIME_MS = int(os.environ.get('MONGO_QUERY_MAX_TIME_MS', 60000))
+MONGO_UNINDEXED_QUERY_MAX_TIME_MS = int(
+    os.environ.get('MONGO_UNINDEXED_QUERY_MAX_TIME_MS', 10000))
+MONGO_STREAM_QUERY_MAX_TIME_MS = int(
+    os.environ.get('MONGO_STREAM_QUERY_MAX_TIME_MS', 0))
+MONGO_REJECT_UNINDEXED_SORTS = os.environ.get(
+    'MONGO_REJECT_UNINDEXED_SORTS', 'False') == 'True'
+MONGO_SLOW_QUERY_MS = int(os.environ.get('MONGO_SLOW_QUERY_MS', 1000))
+
+# Time, in seconds, the data API caches the counts of filtered queries, and
+# number of submissions the `estimate=true` counts are extrapolated from
+DATA_COUNT_CACHE_TIMEOUT = int(os.environ.get('DATA_COUNT_CACHE_TIMEOUT', 60))
+DATA_COUNT_ESTIMATE_SAMPLE_SIZE = int(
+    os.environ.get('DATA_COUNT_ESTIMATE_SAMPLE_SIZE', 1000))
+
+# Number of threads reading attachments from the storage for a ZIP export, and
+# size, in bytes, of the files the export is split into; 0 doesn't split it
+ATTACHMENTS_EXPORT_WORKERS = int(
+    os.environ.get('ATTACHMENTS_EXPORT_WORKERS', 8))
+ATTACHMENTS_EXPORT_VOLUME_SIZE = int(os.environ.get(
+    'ATTACHMENTS_EXPORT_VOLUME_SIZE', 2 * 1024 * 1024 * 1024))
+
+# Number of threads importing the instances of an asynchronous bulk submission
+BULK_SUBMISSION_WORKERS = int(os.environ.get('BULK_SUBMISSION_WORKERS', 4))
+
 # Set wsgi url scheme to HTTPS
 os.environ['wsgi.url_scheme'] = 'https'
 
@@ -250,6 +250,11 @@ CELERYBEAT_SCHEDULE = {
         'task': 'onadata.apps.viewer.tasks.log_stuck_exports_and_mark_failed',
         'schedule': timedelta(hours=6),
     },
+    # Incrementally sync to Mongo the instances modified since the last run
+    'reconcile-mongo-with-postgres': {
+        'task': 'onadata.apps.viewer.tasks.reconcile_mongo_with_postgres',
+        'schedule': timedelta(seconds=MONGO_RECONCILE_INTERVAL),
+    },
 }
 
 ### ISSUE 242 TEMPORARY FIX ###